@@ -1,19 +1,30 @@
+import asyncio
+import functools
+import contextlib
+import io
 import os
 from typing import List, Optional, Dict, Any
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, ValidationError
+from pydantic import BaseModel, TypeAdapter, ValidationError
 from dotenv import load_dotenv
 import boto3
+from boto3.s3.transfer import TransferConfig
 import requests
 import httpx
 import json
 from botocore.exceptions import ClientError
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+try:
+    import orjson
+except ImportError:  # orjson 미설치 환경에서는 표준 json 사용
+    orjson = None
 
 from main import main_flow, get_gauges, finalize_analysis, regenerate_subtree
 from storyengine_pkg.generator import generate_single_episode
+from storyengine_pkg.tokenizer import load_token_encoder
 from storyengine_pkg.models import (
     StoryConfig,
     InitialAnalysis,
@@ -23,13 +34,25 @@ from storyengine_pkg.models import (
 
 load_dotenv()
 
-# S3 클라이언트 초기화
-s3_client = boto3.client(
-    's3',
-    region_name=os.getenv('AWS_REGION', 'ap-northeast-2'),
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-)
+_MB = 1024 * 1024
+# 큰 소설 파일은 8MB 단위로 나눠 여러 스레드에서 병렬로 받음 (작은 파일은 GET 한 번)
+S3_TRANSFER_CONFIG = TransferConfig(multipart_threshold=8 * _MB, max_concurrency=10, use_threads=True)
+
+
+@functools.lru_cache(maxsize=1)
+def get_s3_client():
+    """
+    프로세스 전역 S3 클라이언트 (처음 사용할 때 한 번만 생성)
+
+    클라이언트 생성 시 botocore 서비스 모델 파싱에 100ms 이상 걸리므로 요청마다 만들지 않고 재사용합니다.
+    boto3 클라이언트는 스레드 간 공유해도 안전합니다.
+    """
+    session = boto3.session.Session(
+        region_name=os.getenv('AWS_REGION', 'ap-northeast-2'),
+        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
+    )
+    return session.client('s3')
 
 
 def download_from_s3(file_key: str, bucket: str = None) -> str:
@@ -38,11 +61,13 @@ def download_from_s3(file_key: str, bucket: str = None) -> str:
         bucket = os.getenv('AWS_S3_BUCKET', 'story-game-bucket')
 
     try:
-        response = s3_client.get_object(Bucket=bucket, Key=file_key)
-        content = response['Body'].read().decode('utf-8')
+        buffer = io.BytesIO()
+        get_s3_client().download_fileobj(bucket, file_key, buffer, Config=S3_TRANSFER_CONFIG)
+        content = buffer.getvalue().decode('utf-8')
         return content
     except ClientError as e:
-        if e.response['Error']['Code'] == 'NoSuchKey':
+        # download_fileobj는 HEAD 요청으로 크기를 먼저 확인하므로 없는 키는 '404'로 옴
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
             raise HTTPException(status_code=404, detail=f"File not found in S3: {file_key}")
         else:
             raise HTTPException(status_code=500, detail=f"S3 error: {str(e)}")
@@ -50,13 +75,29 @@ def download_from_s3(file_key: str, bucket: str = None) -> str:
         raise HTTPException(status_code=400, detail="파일 인코딩 오류. UTF-8 파일을 사용하세요.")
 
 
+def _encode_json(data: Dict) -> bytes:
+    """업로드용 JSON 직렬화 (전체 스토리처럼 큰 결과는 orjson이 훨씬 빠름, 출력 형식은 동일한 2칸 들여쓰기)"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def _sse_event(event: str, data: Dict) -> str:
+    """Server-Sent Events 메시지 한 건 (data는 줄바꿈 없는 한 줄 JSON)"""
+    if orjson is not None:
+        payload = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    else:
+        payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
 async def upload_to_presigned_url(url: str, data: Dict):
     """미리 서명된 URL로 JSON 데이터를 PUT 요청으로 업로드합니다 (비동기)."""
     try:
         async with httpx.AsyncClient(timeout=300.0) as client:  # 5분 타임아웃
             response = await client.put(
                 url,
-                content=json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'),
+                content=_encode_json(data),
                 headers={'Content-Type': 'application/json'}
             )
             response.raise_for_status()  # 2xx 이외의 상태 코드에 대해 예외 발생
@@ -88,10 +129,18 @@ def extract_metadata(story_data: Dict) -> Dict:
     }
 
 
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 토크나이저 인코딩 파일을 첫 요청 전에 미리 로드 (로드 실패 시 문자 수 기준 추정으로 동작)
+    await load_token_encoder()
+    yield
+
+
 app = FastAPI(
     title="Interactive Story Engine API",
     description="소설 텍스트를 인터랙티브 스토리로 변환하는 API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS 설정 (프론트엔드 연동용)
@@ -422,11 +471,129 @@ async def generate_story(request: GenerateRequest):
         print(f"❌ 오류 발생:\n{error_detail}")
         raise HTTPException(status_code=500, detail=error_detail)
 
-@app.post("/generate-next-episode", response_model=Episode)
-async def generate_next_episode_endpoint(request: GenerateNextEpisodeRequest):
+@app.post("/generate/stream")
+async def generate_story_stream(request: GenerateRequest):
+    """
+    스토리 생성 (SSE 스트리밍) - 노드 본문을 생성되는 대로 전달
+
+    전체 생성이 끝날 때까지 기다리지 않고 진행 상황을 text/event-stream으로 보냅니다.
+
+    이벤트:
+        node_text: {"node_id", "delta"} - 트리 노드 본문 조각
+        done: /generate와 같은 응답 본문 (s3_upload_url이 있으면 업로드 후 메타데이터만)
+        error: {"detail"} - 생성 실패
+    """
+    if not API_KEY:
+        raise HTTPException(status_code=500, detail="API 키가 설정되지 않았습니다.")
+
+    # 유효성 검사 (스트림 시작 전에 검사해야 일반 HTTP 오류로 응답 가능)
+    if len(request.selected_gauge_ids) < 2:
+        raise HTTPException(status_code=400, detail="게이지 ID를 2개 이상 선택해야 합니다.")
+
+    if not (2 <= request.max_depth <= 5):
+        raise HTTPException(status_code=400, detail="트리 깊이는 2~5 사이여야 합니다.")
+
+    if request.num_episodes < 1:
+        raise HTTPException(status_code=400, detail="에피소드 개수는 1 이상이어야 합니다.")
+
+    ending_config_dict = None
+    if request.ending_config:
+        ending_config_dict = {
+            k: v for k, v in request.ending_config.model_dump().items() if v > 0
+        }
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def on_node_text(node_id: str, delta: str):
+        await queue.put(("node_text", {"node_id": node_id, "delta": delta}))
+
+    async def run():
+        try:
+            print(f"🎬 스토리 생성 시작 - 스트리밍 (에피소드: {request.num_episodes}, 깊이: {request.max_depth})")
+            story_data = await main_flow(
+                api_key=API_KEY,
+                novel_text=request.novel_text,
+                selected_gauge_ids=request.selected_gauge_ids,
+                num_episodes=request.num_episodes,
+                max_depth=request.max_depth,
+                ending_config=ending_config_dict,
+                num_episode_endings=request.num_episode_endings,
+                on_node_text=on_node_text
+            )
+            print(f"✅ 스토리 생성 완료")
+
+            if request.s3_upload_url:
+                await upload_to_presigned_url(request.s3_upload_url, story_data)
+                payload = {
+                    "status": "success",
+                    "file_key": request.file_key or "unknown",
+                    "data": {"metadata": extract_metadata(story_data)}
+                }
+            else:
+                payload = {"status": "success", "data": story_data}
+            await queue.put(("done", payload))
+        except Exception as e:
+            print(f"❌ 오류 발생: {e}")
+            detail = e.detail if isinstance(e, HTTPException) else f"Story generation failed: {str(e)}"
+            await queue.put(("error", {"detail": detail}))
+
+    async def events():
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event, data = await queue.get()
+                yield _sse_event(event, data)
+                if event in ("done", "error"):
+                    break
+        finally:
+            # 클라이언트 연결이 끊기면 남은 생성 작업 중단
+            task.cancel()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# 이전 에피소드 트리 전체가 포함되는 큰 요청이므로 본문 바이트를 pydantic-core가 한 번에 파싱+검증
+# (FastAPI 기본 경로는 json.loads로 dict를 만든 뒤 다시 검증하는 2단계)
+NEXT_EPISODE_REQUEST_ADAPTER = TypeAdapter(GenerateNextEpisodeRequest)
+
+_default_openapi = app.openapi
+
+
+def _openapi_with_next_episode_request():
+    """본문을 직접 읽는 /generate-next-episode의 요청 스키마(하위 모델 포함)를 API 문서 components에 등록"""
+    if app.openapi_schema is None:
+        schemas = _default_openapi().setdefault("components", {}).setdefault("schemas", {})
+        request_schema = GenerateNextEpisodeRequest.model_json_schema(ref_template="#/components/schemas/{model}")
+        for name, sub_schema in request_schema.pop("$defs", {}).items():
+            schemas.setdefault(name, sub_schema)
+        schemas["GenerateNextEpisodeRequest"] = request_schema
+    return app.openapi_schema
+
+
+app.openapi = _openapi_with_next_episode_request
+
+
+@app.post(
+    "/generate-next-episode",
+    response_model=Episode,
+    openapi_extra={"requestBody": {
+        "content": {"application/json": {"schema": {"$ref": "#/components/schemas/GenerateNextEpisodeRequest"}}},
+        "required": True,
+    }},
+)
+async def generate_next_episode_endpoint(raw_request: Request):
     """
     Generates a single episode sequentially.
     """
+    try:
+        request = NEXT_EPISODE_REQUEST_ADAPTER.validate_json(await raw_request.body())
+    except ValidationError as e:
+        # FastAPI 기본 검증과 같은 형식의 422 응답 (loc 앞에 "body", JSON 문법 오류의 input은 원본 바이트이므로 제외)
+        raise RequestValidationError([
+            {**{k: v for k, v in error.items() if not isinstance(v, bytes)}, "loc": ("body", *error["loc"])}
+            for error in e.errors(include_url=False)
+        ])
+
     print("=" * 60)
     print("📥 /generate-next-episode 요청 수신")
     print(f"  - Current Episode Order: {request.current_episode_order}")
@@ -446,7 +613,8 @@ async def generate_next_episode_endpoint(request: GenerateNextEpisodeRequest):
             current_episode_order=request.current_episode_order,
             previous_episode_data=request.previous_episode
         )
-        return newly_generated_episode
+        # response_model 재검증/jsonable_encoder 변환 없이 pydantic-core 직렬화로 바로 응답
+        return Response(content=newly_generated_episode.model_dump_json(by_alias=True), media_type="application/json")
     except Exception as e:
         print(f"❌ 에러 발생: {str(e)}")
         import traceback
@@ -534,8 +702,8 @@ async def analyze_novel_from_s3(request: AnalyzeFromS3Request):
         raise HTTPException(status_code=500, detail="API 키가 설정되지 않았습니다.")
 
     try:
-        # 1. S3에서 소설 다운로드
-        novel_text = download_from_s3(request.file_key, request.bucket)
+        # 1. S3에서 소설 다운로드 (boto3는 동기 클라이언트이므로 스레드에서 실행하여 이벤트 루프 블로킹 방지)
+        novel_text = await asyncio.to_thread(download_from_s3, request.file_key, request.bucket)
 
         # 2. 분석 (요약, 캐릭터, 게이지 제안)
         result = await get_gauges(API_KEY, novel_text)
@@ -582,7 +750,7 @@ async def generate_story_from_s3(request: GenerateFromS3Request):
 
     try:
         print(f"📥 S3에서 파일 다운로드 시작: {request.file_key}")
-        novel_text = download_from_s3(request.file_key, request.bucket)
+        novel_text = await asyncio.to_thread(download_from_s3, request.file_key, request.bucket)
         print(f"✅ 다운로드 완료 (텍스트 길이: {len(novel_text)}자)")
 
         # ending_config 변환
@@ -1,7 +1,7 @@
 import asyncio
 import os
 from dotenv import load_dotenv
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Callable, Awaitable
 
 from storyengine_pkg import (
     InteractiveStoryDirector,
@@ -17,7 +17,10 @@ async def main_flow(
     num_episodes: int = 4,
     max_depth: int = 3,
     ending_config: Optional[Dict[str, int]] = None,
-    num_episode_endings: int = 3
+    num_episode_endings: int = 3,
+    cache_enabled: bool = False,
+    use_batch_api: bool = False,
+    on_node_text: Optional[Callable[[str, str], Awaitable[None]]] = None
 ) -> Dict:
     """
     에피소드 기반 인터랙티브 스토리 생성 파이프라인 (API용)
@@ -32,6 +35,9 @@ async def main_flow(
             예: {"happy": 2, "tragic": 1, "neutral": 1, "open": 1}
             지원 타입: happy, tragic, neutral, open, bad, bittersweet
         num_episode_endings: 에피소드별 엔딩 개수 (기본값: 3)
+        cache_enabled: LLM 응답 캐시 사용 여부 (같은 소설 재실행 시 분석/노드 호출 재사용, 기본값: False)
+        use_batch_api: 분석 단계와 에피소드 엔딩 설계를 OpenAI Batch API로 제출 (약 50% 저렴, 최대 24시간 소요, 기본값: False)
+        on_node_text: 트리 노드 본문을 생성되는 대로 받을 async 콜백 (node_id, 텍스트 조각) - SSE 등 진행 상황 전달용
 
     Returns:
         생성된 에피소드 리스트 (각 에피소드에 노드와 엔딩 포함)
@@ -40,84 +46,55 @@ async def main_flow(
     print("🎬 에피소드 기반 인터랙티브 스토리 생성 파이프라인")
     print("=" * 60)
 
-    director = InteractiveStoryDirector(api_key=api_key)
-
-    # ========================================
-    # 1단계: 소설 요약 생성
-    # ========================================
-    print("\n📝 [1단계] 소설 요약 생성 중...")
-    novel_summary = await director._generate_summary(novel_text)
-    print(f"  ✅ 요약 완료 ({len(novel_summary)}자)")
+    director = InteractiveStoryDirector(api_key=api_key, enable_cache=cache_enabled, use_batch_api=use_batch_api)
 
-    # ========================================
-    # 2단계: 등장인물 추출
-    # ========================================
-    print("\n👥 [2단계] 등장인물 분석 중...")
-    characters = await director.extract_characters(novel_text)
-    print(f"  ✅ {len(characters)}명의 캐릭터 추출 완료")
-    for char in characters:
-        print(f"    • {char.get('name', '이름없음')}")
+    if ending_config is None:
+        ending_config = {"happy": 2, "tragic": 1, "neutral": 1, "open": 1}
 
     # ========================================
-    # 3단계: 게이지 시스템 설계
+    # 1~5단계: 요약/캐릭터/게이지/엔딩/에피소드 분할 (의존성 없는 단계는 병렬 실행)
     # ========================================
-    print("\n📊 [3단계] 게이지 시스템 설계 중...")
-    gauges = await director.suggest_gauges(novel_summary)
-    print(f"  ✅ {len(gauges)}개의 게이지 제안됨")
-
-    # 선택된 게이지 필터링
-    selected_gauges = [g for g in gauges if g.get('id') in selected_gauge_ids]
-
-    # 선택된 게이지가 부족하면 앞에서부터 채움
-    if len(selected_gauges) < 2:
-        for g in gauges:
-            if g not in selected_gauges:
-                selected_gauges.append(g)
-            if len(selected_gauges) >= 2:
-                break
+    prepared = await prepare_story(
+        director,
+        novel_text,
+        selected_gauge_ids,
+        num_episodes=num_episodes,
+        ending_config=ending_config
+    )
+    novel_summary = prepared["summary"]
+    characters = prepared["characters"]
+    selected_gauges = prepared["selected_gauges"]
+    final_endings = prepared["final_endings"]
+    episode_templates = prepared["episode_templates"]
 
     print(f"  📌 선택된 게이지: {[g.get('name') for g in selected_gauges]}")
     print(f"  🌳 트리 깊이: {max_depth}")
-
-    # ========================================
-    # 4단계: 최종 엔딩 설계 (게이지 누적 기반)
-    # ========================================
-    if ending_config is None:
-        ending_config = {"happy": 2, "tragic": 1, "neutral": 1, "open": 1}
-    total_endings = sum(ending_config.values())
-    print(f"\n🏁 [4단계] 최종 엔딩 설계 중 ({total_endings}개)...")
-    final_endings = await director.design_final_endings(
-        novel_summary,
-        selected_gauges,
-        ending_config=ending_config
-    )
-    print(f"  ✅ {len(final_endings)}개의 최종 엔딩 설계 완료")
     for e in final_endings:
         print(f"    • [{e.get('type', '?')}] {e.get('title', '제목없음')}")
         print(f"      조건: {e.get('condition', '?')}")
 
-    # ========================================
-    # 5단계: 에피소드 분할
-    # ========================================
-    print(f"\n📚 [5단계] 에피소드 분할 중 ({num_episodes}개)...")
-    episode_templates = await director.split_into_episodes(novel_summary, characters, num_episodes)
-
     # ========================================
     # 6단계: 각 에피소드별 트리 및 엔딩 생성
     # ========================================
     print("\n🌳 [6단계] 에피소드별 스토리 생성 시작...")
 
-    completed_episodes: List[Episode] = []
+    async def _intro(ep_template: Dict) -> str:
+        async with director._llm_semaphore:
+            return await director.generate_episode_intro(ep_template, characters, novel_summary)
 
-    for ep_template in episode_templates:
+    # 도입부/엔딩 설계는 에피소드 간 의존성이 없으므로 전체 에피소드를 한 번에 병렬 호출
+    # (동시 요청 수는 디렉터 세마포어로 제한 - 엔딩 설계는 실시간 호출일 때만 _structured_call 안에서 세마포어를 잡음)
+    n = len(episode_templates)
+    results = await asyncio.gather(
+        *[_intro(ep) for ep in episode_templates],
+        *[director.design_episode_endings(ep, selected_gauges, num_endings=num_episode_endings) for ep in episode_templates]
+    )
+    intros, endings_list = results[:n], results[n:]
+
+    async def _build_episode(ep_template: Dict, intro_text: str, episode_endings: List) -> Episode:
         ep_id = ep_template.get('id', f"ep{ep_template.get('order', 0)}")
         ep_title = ep_template.get('title', '제목없음')
 
-        print(f"\n  📖 에피소드 {ep_template.get('order', '?')}: {ep_title}")
-
-        # 🌟 에피소드 도입부 생성
-        intro_text = await director.generate_episode_intro(ep_template, characters, novel_summary)
-
         # 컨텍스트 구성 (에피소드 정보 포함)
         context = {
             "characters": characters,
@@ -129,14 +106,13 @@ async def main_flow(
             "intro_text": intro_text  # 도입부 컨텍스트 전달
         }
 
-        # 에피소드 트리 생성
-        episode_nodes = await director.generate_full_tree(context, max_depth=max_depth)
+        # 에피소드 트리 생성 (노드 호출은 디렉터 세마포어를 공유하므로 에피소드 간에도 동시 요청 수가 제한됨)
+        episode_nodes = await director.generate_full_tree(context, max_depth=max_depth, on_node_text=on_node_text)
 
-        # 에피소드 엔딩 설계
-        episode_endings = await director.design_episode_endings(ep_template, selected_gauges, num_endings=num_episode_endings)
+        print(f"    ✅ 에피소드 {ep_template.get('order', '?')} 완료 ({ep_title}): 도입부 + {len(episode_nodes)}개 노드, {len(episode_endings)}개 엔딩")
 
         # 완성된 에피소드 조립
-        completed_episode: Episode = {
+        return {
             "id": ep_id,
             "title": ep_title,
             "order": ep_template.get('order', 0),
@@ -147,8 +123,11 @@ async def main_flow(
             "endings": episode_endings
         }
 
-        completed_episodes.append(completed_episode)
-        print(f"    ✅ 에피소드 완료: 도입부 + {len(episode_nodes)}개 노드, {len(episode_endings)}개 엔딩")
+    # 에피소드 트리도 서로 독립적이므로 병렬 생성 (결과 순서는 에피소드 템플릿 순서 유지)
+    completed_episodes: List[Episode] = list(await asyncio.gather(*[
+        _build_episode(ep, intro, eps_endings)
+        for ep, intro, eps_endings in zip(episode_templates, intros, endings_list)
+    ]))
 
     # ========================================
     # 7단계: 결과 저장
@@ -183,13 +162,96 @@ async def main_flow(
     return result
 
 
-async def get_gauges(api_key: str, novel_text: str) -> Dict:
+def _select_gauges(gauges: List[Dict], selected_gauge_ids: List[str]) -> List[Dict]:
+    """선택된 게이지 필터링 (부족하면 앞에서부터 채워 최소 2개 보장)"""
+    selected_gauges = [g for g in gauges if g.get('id') in selected_gauge_ids]
+
+    if len(selected_gauges) < 2:
+        for g in gauges:
+            if g not in selected_gauges:
+                selected_gauges.append(g)
+            if len(selected_gauges) >= 2:
+                break
+
+    return selected_gauges
+
+
+async def prepare_story(
+    director: InteractiveStoryDirector,
+    novel_text: str,
+    selected_gauge_ids: List[str],
+    num_episodes: int = 4,
+    ending_config: Optional[Dict[str, int]] = None
+) -> Dict:
+    """
+    트리 생성 전 준비 단계(요약, 캐릭터, 게이지, 최종 엔딩, 에피소드 분할)를 의존성에 맞춰 병렬 실행
+
+    의존 관계:
+        - 등장인물 추출은 원문만 필요 → 요약과 동시에 시작
+        - 게이지 제안은 요약 필요 → 요약 완료 후 시작
+        - 에피소드 분할은 요약 + 캐릭터 필요 → 게이지/엔딩 설계와 동시에 진행
+        - 최종 엔딩은 선택된 게이지 필요 → 게이지 완료 후 시작
+
+    Returns:
+        {
+            "summary", "characters", "gauges", "selected_gauges",
+            "final_endings", "episode_templates"
+        }
+    """
+    print("\n📝 [1~2단계] 소설 요약 + 등장인물 분석 (병렬)...")
+    characters_task = asyncio.create_task(director.extract_characters(novel_text))
+    try:
+        novel_summary = await director._generate_summary(novel_text)
+    except Exception:
+        characters_task.cancel()
+        raise
+    print(f"  ✅ 요약 완료 ({len(novel_summary)}자)")
+
+    async def _gauges_and_endings():
+        print("\n📊 [3단계] 게이지 시스템 설계 중...")
+        gauges = await director.suggest_gauges(novel_summary)
+        print(f"  ✅ {len(gauges)}개의 게이지 제안됨")
+        selected_gauges = _select_gauges(gauges, selected_gauge_ids)
+
+        print(f"\n🏁 [4단계] 최종 엔딩 설계 중 ({sum((ending_config or {}).values())}개)...")
+        final_endings = await director.design_final_endings(
+            novel_summary,
+            selected_gauges,
+            ending_config=ending_config
+        )
+        print(f"  ✅ {len(final_endings)}개의 최종 엔딩 설계 완료")
+        return gauges, selected_gauges, final_endings
+
+    async def _split_episodes():
+        characters = await characters_task
+        print(f"  ✅ {len(characters)}명의 캐릭터 추출 완료")
+        print(f"\n📚 [5단계] 에피소드 분할 중 ({num_episodes}개)...")
+        return await director.split_into_episodes(novel_summary, characters, num_episodes)
+
+    (gauges, selected_gauges, final_endings), episode_templates = await asyncio.gather(
+        _gauges_and_endings(),
+        _split_episodes()
+    )
+
+    return {
+        "summary": novel_summary,
+        "characters": characters_task.result(),
+        "gauges": gauges,
+        "selected_gauges": selected_gauges,
+        "final_endings": final_endings,
+        "episode_templates": episode_templates
+    }
+
+
+async def get_gauges(api_key: str, novel_text: str, cache_enabled: bool = False, use_batch_api: bool = False) -> Dict:
     """
     게이지 제안만 받아오는 함수 (프론트엔드에서 게이지 선택 UI용)
 
     Args:
         api_key: OpenAI API 키
         novel_text: 원본 소설 텍스트
+        cache_enabled: LLM 응답 캐시 사용 여부
+        use_batch_api: 캐릭터 추출/게이지 제안을 OpenAI Batch API로 제출
 
     Returns:
         {
@@ -198,16 +260,22 @@ async def get_gauges(api_key: str, novel_text: str) -> Dict:
             "gauges": 제안된 게이지 리스트
         }
     """
-    director = InteractiveStoryDirector(api_key=api_key)
+    director = InteractiveStoryDirector(api_key=api_key, enable_cache=cache_enabled, use_batch_api=use_batch_api)
 
-    # 요약 생성
-    novel_summary = await director._generate_summary(novel_text)
+    # 캐릭터 추출은 원문만 필요하므로 요약 → 게이지 제안과 병렬로 진행
+    characters_task = asyncio.create_task(director.extract_characters(novel_text))
 
-    # 캐릭터 추출
-    characters = await director.extract_characters(novel_text)
+    try:
+        # 요약 생성
+        novel_summary = await director._generate_summary(novel_text)
+
+        # 게이지 제안
+        gauges = await director.suggest_gauges(novel_summary)
+    except Exception:
+        characters_task.cancel()
+        raise
 
-    # 게이지 제안
-    gauges = await director.suggest_gauges(novel_summary)
+    characters = await characters_task
 
     return {
         "summary": novel_summary,
@@ -355,19 +423,21 @@ async def regenerate_subtree(
 
     parent_choices = parent_node.get('choices', [])
 
-    for choice_idx, choice_text in enumerate(parent_choices):
-        print(f"\n  선택지 {choice_idx + 1}/{len(parent_choices)}: '{choice_text}'")
-
-        # 자식 노드 트리 생성 (depth는 current_depth + 1부터 시작)
-        child_nodes = await _generate_child_subtree(
+    # 선택지별 서브트리는 서로 독립적이므로 동시에 생성 (동시 LLM 호출 수는 director 세마포어로 제한)
+    child_results = await asyncio.gather(*(
+        _generate_child_subtree(
             director=director,
             parent_text=parent_node.get('text'),
             choice_text=choice_text,
-            current_depth=current_depth + 1,
+            current_depth=current_depth + 1,  # 자식 노드 트리는 current_depth + 1부터 시작
             max_depth=max_depth,
             context=context
         )
+        for choice_text in parent_choices
+    ))
 
+    for choice_idx, (choice_text, child_nodes) in enumerate(zip(parent_choices, child_results)):
+        print(f"\n  선택지 {choice_idx + 1}/{len(parent_choices)}: '{choice_text}'")
         if child_nodes and len(child_nodes) > 0:
             regenerated_nodes.append(child_nodes[0])  # 각 선택지의 루트 자식 노드
             print(f"    ✅ {_count_nodes(child_nodes[0])}개 노드 생성")
@@ -467,10 +537,12 @@ async def _generate_single_node(
 }}"""
 
     try:
-        response = await director.llm.ainvoke([
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt)
-        ])
+        # 서브트리의 형제 노드들이 동시에 생성되므로 director 세마포어로 동시 호출 수 제한
+        async with director._llm_semaphore:
+            response = await director.gateway.invoke(director.llm_json, [
+                SystemMessage(content=system_prompt),
+                HumanMessage(content=user_prompt)
+            ])
 
         parsed = director._parse_json(response.content)
 
@@ -544,11 +616,14 @@ async def _generate_child_subtree(
 
     # 재귀적으로 자식 노드의 자식들 생성 (max_depth 도달 전까지)
     if current_depth < max_depth and node_data.get("choices"):
-        for sub_choice_obj in node_data.get("choices", []):
-            # Pass the text of the choice object to the recursive call
-            sub_choice_text = sub_choice_obj.get("text") if isinstance(sub_choice_obj, dict) else sub_choice_obj
-
-            sub_children = await _generate_child_subtree(
+        # Pass the text of the choice object to the recursive call
+        sub_choice_texts = [
+            sub_choice_obj.get("text") if isinstance(sub_choice_obj, dict) else sub_choice_obj
+            for sub_choice_obj in node_data.get("choices", [])
+        ]
+        # 형제 서브트리를 동시에 생성 (순서는 gather가 보존)
+        sub_results = await asyncio.gather(*(
+            _generate_child_subtree(
                 director=director,
                 parent_text=child_node["text"],
                 choice_text=sub_choice_text,
@@ -556,6 +631,9 @@ async def _generate_child_subtree(
                 max_depth=max_depth,
                 context=context
             )
+            for sub_choice_text in sub_choice_texts
+        ))
+        for sub_children in sub_results:
             if sub_children and len(sub_children) > 0:
                 child_node["children"].append(sub_children[0])
 
@@ -578,6 +656,17 @@ def _count_nodes(node: Dict) -> int:
 # CLI 실행용 (터미널에서 직접 실행 시)
 # ============================================
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="에피소드 기반 인터랙티브 스토리 생성")
+    parser.add_argument("--no-cache", action="store_true", help="LLM 응답 캐시(.llm_cache/)를 사용하지 않고 모두 새로 생성")
+    parser.add_argument(
+        "--batch-api", action="store_true",
+        help="분석 단계 호출을 OpenAI Batch API로 제출 (약 50%% 저렴, 완료까지 최대 24시간)"
+    )
+    args = parser.parse_args()
+    cache_enabled = not args.no_cache
+
     load_dotenv()
     API_KEY = os.environ.get("OPENAI_API_KEY")
 
@@ -622,7 +711,9 @@ if __name__ == "__main__":
 
             # 1단계: 게이지 제안 받기
             print("\n📊 게이지 분석 중...")
-            gauge_data = await get_gauges(API_KEY, novel_text)
+            gauge_data = await get_gauges(
+                API_KEY, novel_text, cache_enabled=cache_enabled, use_batch_api=args.batch_api
+            )
             gauges = gauge_data["gauges"]
 
             # 게이지 선택
@@ -726,7 +817,9 @@ if __name__ == "__main__":
                 num_episodes=num_episodes,
                 max_depth=max_depth,
                 ending_config=ending_config,
-                num_episode_endings=num_episode_endings
+                num_episode_endings=num_episode_endings,
+                cache_enabled=cache_enabled,
+                use_batch_api=args.batch_api
             )
 
             # 결과 요약 출력
@@ -1,7 +1,6 @@
 """
 Story Engine Package
 """
-from .director import InteractiveStoryDirector
 from .models import (
     Character,
     Gauge,
@@ -18,6 +17,9 @@ from .utils import (
     calculate_tag_scores,
     evaluate_condition,
     determine_episode_ending,
+    determine_episode_ending_from_scores,
+    prepare_endings,
+    determine_episode_ending_prepared,
     calculate_final_ending,
     evaluate_gauge_condition,
     load_novel_from_file,
@@ -29,8 +31,10 @@ from .utils import (
 from .validation import (
     validate_gauge_balance,
     check_condition_reachability,
+    compile_condition,
     find_dead_ends,
     check_tag_coverage,
+    full_validation_pass,
 )
 from .crud import (
     edit_node,
@@ -39,10 +43,14 @@ from .crud import (
     remove_choice,
     update_episode_ending,
     update_intro_text,
+    edit_nodes,
+    add_choices,
+    delete_nodes,
 )
 from .simulation import (
     simulate_playthrough,
     simulate_full_game,
+    simulate_full_game_batch,
     get_all_possible_endings,
 )
 from .export import (
@@ -51,6 +59,16 @@ from .export import (
     export_for_game_engine,
 )
 
+
+def __getattr__(name):
+    # 디렉터는 langchain 로드에 1초가량 걸리므로 처음 접근할 때 import
+    # (트리 조회/편집/시뮬레이션/내보내기만 쓰는 경로는 LLM 의존성을 로드하지 않음)
+    if name == "InteractiveStoryDirector":
+        from .director import InteractiveStoryDirector
+        return InteractiveStoryDirector
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 __all__ = [
     "InteractiveStoryDirector",
     "Character",
@@ -66,6 +84,9 @@ __all__ = [
     "calculate_tag_scores",
     "evaluate_condition",
     "determine_episode_ending",
+    "determine_episode_ending_from_scores",
+    "prepare_endings",
+    "determine_episode_ending_prepared",
     "calculate_final_ending",
     "evaluate_gauge_condition",
     "load_novel_from_file",
@@ -75,16 +96,22 @@ __all__ = [
     "print_story_path",
     "validate_gauge_balance",
     "check_condition_reachability",
+    "compile_condition",
     "find_dead_ends",
     "check_tag_coverage",
+    "full_validation_pass",
     "edit_node",
     "delete_node",
     "add_choice",
     "remove_choice",
     "update_episode_ending",
     "update_intro_text",
+    "edit_nodes",
+    "add_choices",
+    "delete_nodes",
     "simulate_playthrough",
     "simulate_full_game",
+    "simulate_full_game_batch",
     "get_all_possible_endings",
     "export_to_markdown",
     "export_to_html",
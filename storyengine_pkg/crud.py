@@ -1,6 +1,36 @@
-from typing import List, Dict
+from collections import defaultdict
+from typing import List, Dict, Optional, Tuple
 
-from .models import Episode, StoryChoice
+from .models import Episode, StoryChoice, StoryNode
+
+
+def _children_index(episode: Episode) -> Dict[Optional[str], List[StoryNode]]:
+    """
+    에피소드의 parent_id → 자식 노드 리스트 인덱스
+
+    삭제 작업 한 번(같은 에피소드의 삭제 대상 전체)에 한 번만 만들어, 노드 리스트를 반복 스캔하던
+    하위 노드 탐색을 인덱스 조회로 바꿉니다 (O(노드 수 × 깊이) → O(노드 수)).
+    호출 간 캐시는 두지 않습니다. 에피소드 dict에는 넣을 수 없어(JSON 저장/응답에 포함됨) id(episode) 키의
+    모듈 전역 캐시가 필요한데, id는 GC 후 재사용될 수 있고 crud를 거치지 않은 제자리 편집은 감지할 수 없어
+    낡은 인덱스로 엉뚱한 노드를 지울 위험이 있습니다. 인덱스 생성은 노드 수에 선형이라 매번 만들어도 충분히 쌉니다.
+    """
+    index = {}
+    for node in episode.get("nodes", []):
+        index.setdefault(node.get("parent_id"), []).append(node)
+    return index
+
+
+def _collect_subtree_ids(children: Dict[Optional[str], List[StoryNode]], root_ids: List[str]) -> set:
+    """루트 노드들과 그 하위 노드들의 ID 수집"""
+    collected = set()
+    stack = list(root_ids)
+    while stack:
+        current = stack.pop()
+        if current in collected:
+            continue
+        collected.add(current)
+        stack.extend(child.get("id") for child in children.get(current, []))
+    return collected
 
 
 def edit_node(episodes: List[Episode], episode_id: str, node_id: str, updates: Dict) -> bool:
@@ -36,27 +66,38 @@ def delete_node(episodes: List[Episode], episode_id: str, node_id: str) -> bool:
     """
     for episode in episodes:
         if episode.get("id") == episode_id:
-            nodes = episode.get("nodes", [])
-
             # 삭제할 노드와 자식 노드들의 ID 수집
-            to_delete = {node_id}
-            changed = True
-            while changed:
-                changed = False
-                for node in nodes:
-                    if node.get("parent_id") in to_delete and node.get("id") not in to_delete:
-                        to_delete.add(node.get("id"))
-                        changed = True
+            to_delete = _collect_subtree_ids(_children_index(episode), [node_id])
 
             # 노드 삭제
-            original_count = len(nodes)
-            episode["nodes"] = [n for n in nodes if n.get("id") not in to_delete]
-
-            return len(episode["nodes"]) < original_count
+            return _remove_nodes(episode, to_delete) > 0
 
     return False
 
 
+def _remove_nodes(episode: Episode, to_delete: set) -> int:
+    """
+    삭제 대상 노드들을 에피소드에서 제거
+
+    삭제할 노드가 전체의 일부(1/8 미만)면 리스트를 제자리에서 수정하고,
+    그 이상이면 새 리스트를 만들어 교체합니다.
+
+    Returns:
+        제거된 노드 개수
+    """
+    nodes = episode.get("nodes", [])
+    original_count = len(nodes)
+
+    if len(to_delete) * 8 < original_count:
+        indices = [i for i, n in enumerate(nodes) if n.get("id") in to_delete]
+        for idx in reversed(indices):
+            del nodes[idx]
+    else:
+        episode["nodes"] = [n for n in nodes if n.get("id") not in to_delete]
+
+    return original_count - len(episode["nodes"])
+
+
 def add_choice(episodes: List[Episode], episode_id: str, node_id: str, choice: StoryChoice) -> bool:
     """노드에 선택지 추가"""
     for episode in episodes:
@@ -101,4 +142,134 @@ def update_intro_text(episodes: List[Episode], episode_id: str, new_intro: str)
         if episode.get("id") == episode_id:
             episode["intro_text"] = new_intro
             return True
-    return False
\ No newline at end of file
+    return False
+
+
+# ============================================
+# 일괄 처리 (Batch CRUD)
+# ============================================
+
+def _index_episodes(episodes: List[Episode]) -> Dict[str, Episode]:
+    """에피소드 ID → 에피소드 인덱스 (중복 ID는 첫 번째 것 우선)"""
+    index = {}
+    for episode in episodes:
+        index.setdefault(episode.get("id"), episode)
+    return index
+
+
+def _index_nodes(episode: Episode) -> Dict[str, StoryNode]:
+    """노드 ID → 노드 인덱스 (중복 ID는 첫 번째 것 우선)"""
+    index = {}
+    for node in episode.get("nodes", []):
+        index.setdefault(node.get("id"), node)
+    return index
+
+
+def _group_ops_by_episode(ops: List[Tuple]) -> Dict[str, List[Tuple[int, Tuple]]]:
+    """작업 리스트를 에피소드 ID별로 묶음 (원래 순서 인덱스 유지)"""
+    grouped = defaultdict(list)
+    for i, op in enumerate(ops):
+        grouped[op[0]].append((i, op))
+    return grouped
+
+
+def edit_nodes(episodes: List[Episode], ops: List[Tuple[str, str, Dict]]) -> List[bool]:
+    """
+    여러 노드를 한 번에 수정
+
+    에피소드/노드 인덱스를 한 번만 만들고 모든 수정 작업에 재사용합니다.
+
+    Args:
+        episodes: 에피소드 리스트
+        ops: [(episode_id, node_id, updates), ...]
+
+    Returns:
+        각 작업의 성공 여부 (ops 순서와 동일)
+    """
+    results = [False] * len(ops)
+    episode_index = _index_episodes(episodes)
+
+    for episode_id, items in _group_ops_by_episode(ops).items():
+        episode = episode_index.get(episode_id)
+        if episode is None:
+            continue
+
+        node_index = _index_nodes(episode)
+        for i, (_, node_id, updates) in items:
+            node = node_index.get(node_id)
+            if node is None:
+                continue
+            for key, value in updates.items():
+                if key in node:
+                    node[key] = value
+            results[i] = True
+
+    return results
+
+
+def add_choices(episodes: List[Episode], ops: List[Tuple[str, str, StoryChoice]]) -> List[bool]:
+    """
+    여러 노드에 선택지를 한 번에 추가
+
+    Args:
+        ops: [(episode_id, node_id, choice), ...]
+
+    Returns:
+        각 작업의 성공 여부 (ops 순서와 동일)
+    """
+    results = [False] * len(ops)
+    episode_index = _index_episodes(episodes)
+
+    for episode_id, items in _group_ops_by_episode(ops).items():
+        episode = episode_index.get(episode_id)
+        if episode is None:
+            continue
+
+        node_index = _index_nodes(episode)
+        for i, (_, node_id, choice) in items:
+            node = node_index.get(node_id)
+            if node is None:
+                continue
+            if "choices" not in node:
+                node["choices"] = []
+            node["choices"].append(choice)
+            results[i] = True
+
+    return results
+
+
+def delete_nodes(episodes: List[Episode], targets: List[Tuple[str, str]]) -> List[bool]:
+    """
+    여러 노드를 한 번에 삭제 (자식 노드들도 함께 삭제)
+
+    같은 에피소드의 삭제 대상들은 하나의 자식 탐색으로 묶어서 처리합니다.
+
+    Args:
+        targets: [(episode_id, node_id), ...]
+
+    Returns:
+        각 대상의 삭제 여부 (targets 순서와 동일)
+    """
+    results = [False] * len(targets)
+    episode_index = _index_episodes(episodes)
+
+    for episode_id, items in _group_ops_by_episode(targets).items():
+        episode = episode_index.get(episode_id)
+        if episode is None:
+            continue
+
+        existing_ids = {node.get("id") for node in episode.get("nodes", [])}
+
+        # 모든 삭제 루트에서 한 번에 하위 노드 수집
+        to_delete = _collect_subtree_ids(
+            _children_index(episode),
+            [node_id for _, (_, node_id) in items]
+        )
+
+        for i, (_, node_id) in items:
+            results[i] = node_id in existing_ids
+
+        if to_delete & existing_ids:
+            _remove_nodes(episode, to_delete)
+
+    return results
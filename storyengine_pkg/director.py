@@ -1,15 +1,30 @@
+import asyncio
+import copy
+import hashlib
+import itertools
 import json
-import operator
+import os
+import random
 import re
-import uuid
-from typing import TypedDict, List, Dict, Any, Annotated, Optional
-from langchain_openai import ChatOpenAI
+import weakref
+from collections import Counter, OrderedDict
+from typing import TypedDict, List, Dict, Any, Optional, Callable, Awaitable
+import httpx
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_core.output_parsers import JsonOutputParser, PydanticOutputParser
-from langgraph.graph import StateGraph, END, START
-from langgraph.types import Send
-from pydantic import BaseModel, Field
-
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.runnables import RunnableBinding
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, model_validator
+
+try:
+    import orjson
+except ImportError:  # orjson 미설치 환경에서는 표준 json 사용
+    orjson = None
+
+from storyengine_pkg.llm_cache import LLMResponseCache, SemanticNodeCache, make_cache_key, DEFAULT_CACHE_DIR
+from storyengine_pkg.openai_batch import OpenAIBatchRunner
+from storyengine_pkg.llm_gateway import LLMGateway
 from storyengine_pkg.models import (
     Character,
     Gauge,
@@ -21,36 +36,784 @@ from storyengine_pkg.models import (
     StoryNodeDetail,
 )
 
+# 기본(상위) 모델로 생성하는 극적으로 중요한 노드 타입 - 나머지(development)는 저가 모델 사용
+_CRITICAL_NODE_TYPES = {"first_choice", "climax", "ending"}
+# deep_model 지정 시 상위 모델로 생성하는 노드 타입 (트리 하단이라 개수가 적고 서사적 비중이 가장 큼)
+_DEEP_NODE_TYPES = {"climax", "ending"}
+
+# 캐릭터 설명/관계의 인용 표시 제거용 ([cite: 8, 35] 형태, 앞 공백 포함)
+_CITE_RE = re.compile(r'\s*\[cite:[^\]]*\]')
+# 등장인물 병합 시 설명을 문장 단위로 중복 제거
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+
+# 등장인물 추출 청크 크기(문자 수)와 청크 간 겹치는 줄 수 (경계에 걸친 장면의 인물을 놓치지 않도록)
+_CHARACTER_CHUNK_CHARS = 15000
+_CHARACTER_CHUNK_OVERLAP_LINES = 20
+
+# LLM 응답 JSON 추출/자동 수정용 정규식
+_CODE_BLOCK_RE = re.compile(r'```(?:json)?\s*([\s\S]*?)\s*```')
+_TRAILING_COMMA_RE = re.compile(r',(\s*[}\]])')
+_REPEATED_COMMA_RE = re.compile(r',\s*,+')
+_TRAILING_COMMA_OBJ_RE = re.compile(r',\s*\n\s*}')
+_TRAILING_COMMA_ARR_RE = re.compile(r',\s*\n\s*]')
+
+
+def _node_id_factory() -> Callable[[], str]:
+    """트리별 노드 ID 생성기 ("<트리 접두사 6자리>-<생성 순번 4자리>" 16진수)
+
+    트리 안에서는 순번으로 중복이 없고 생성 순서대로 정렬되며, 트리(에피소드)끼리는 무작위 접두사로 구분합니다.
+    보안 용도가 아니므로 os.urandom 대신 모듈 전역 난수 생성기 사용 (fork 후 자동 재시드)
+    """
+    prefix = f"{random.getrandbits(24):06x}"
+    counter = itertools.count()
+    return lambda: f"{prefix}-{next(counter):04x}"
+
+
+def _line_chunks(lines: List[str], max_chars: int, overlap: int) -> List[tuple]:
+    """줄 목록을 max_chars를 넘지 않는 (시작, 끝) 구간으로 분할 (이웃 구간은 overlap줄씩 겹침, 한 줄이 너무 길면 그 줄만 단독 구간)"""
+    spans = []
+    start = 0
+    while start < len(lines):
+        end, size = start, 0
+        while end < len(lines) and (end == start or size + len(lines[end]) + 1 <= max_chars):
+            size += len(lines[end]) + 1
+            end += 1
+        spans.append((start, end))
+        if end >= len(lines):
+            break
+        start = max(end - overlap, start + 1)
+    return spans
+
+
+def _merge_characters(groups: List[List[Dict]]) -> List[Dict]:
+    """
+    청크별 등장인물 추출 결과를 이름/별명이 겹치는 인물끼리 병합 (처음 등장한 순서 유지)
+
+    별명은 합집합, 설명은 인용 표시를 뺀 문장 기준으로 중복을 제거하며 이어 붙이고, 관계는 합집합으로 모읍니다.
+    """
+    merged: List[Dict] = []
+    by_name: Dict[str, Dict] = {}
+    for characters in groups:
+        for char in characters:
+            names = [n.strip() for n in [char.get("name", "")] + list(char.get("aliases", [])) if n and n.strip()]
+            keys = {n.lower() for n in names}
+            target = next((by_name[k] for k in keys if k in by_name), None)
+            if target is None:
+                target = {"name": char.get("name", ""), "aliases": [], "description": "", "relationships": []}
+                merged.append(target)
+
+            for alias in names:
+                if alias != target["name"] and alias not in target["aliases"]:
+                    target["aliases"].append(alias)
+
+            sentences = _SENTENCE_SPLIT_RE.split(target["description"]) if target["description"] else []
+            seen = {_CITE_RE.sub("", s).strip() for s in sentences}
+            for sentence in _SENTENCE_SPLIT_RE.split(char.get("description", "").strip()):
+                sentence_key = _CITE_RE.sub("", sentence).strip()
+                if sentence_key and sentence_key not in seen:
+                    seen.add(sentence_key)
+                    sentences.append(sentence)
+            target["description"] = " ".join(sentences)
+
+            for relation in char.get("relationships", []):
+                if relation not in target["relationships"]:
+                    target["relationships"].append(relation)
+
+            for key in keys:
+                by_name.setdefault(key, target)
+    return merged
+
+
+def _json_loads(text: str) -> Any:
+    """JSON 파싱 (orjson 우선, 실패 시 json.JSONDecodeError 계열 예외 발생)"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _json_dumps(obj: Any) -> str:
+    """프롬프트 삽입용 compact JSON 직렬화 (한글 그대로 유지)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _extract_json_object(text: str, start: int = 0) -> Optional[str]:
+    """
+    text[start:]에서 처음 나오는 '{'부터 짝이 맞는 '}'까지 잘라 반환 (없으면 None)
+
+    문자열 리터럴/이스케이프를 추적하는 단일 패스 스캔이라 탐욕적 정규식과 달리
+    응답 길이에 선형이며, JSON 뒤에 붙은 설명 문장의 '}'까지 삼키지 않습니다.
+    """
+    begin = text.find('{', start)
+    if begin == -1:
+        return None
+
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(begin, len(text)):
+        c = text[i]
+        if escaped:
+            escaped = False
+        elif c == '\\':
+            escaped = in_string
+        elif c == '"':
+            in_string = not in_string
+        elif in_string:
+            continue
+        elif c == '{':
+            depth += 1
+        elif c == '}':
+            depth -= 1
+            if depth == 0:
+                return text[begin:i + 1]
+    return None
+
 # Structured Output을 위한 Pydantic 스키마
+_MIN_IMMEDIATE_REACTION = 50
+
+
+# LLM 응답 한 번마다 만들어지고 바로 dict로 변환되는 읽기 전용 모델 (strict 스키마와 같이 추가 필드 금지)
+_NODE_SCHEMA_CONFIG = ConfigDict(frozen=True, extra="forbid")
+
+
 class StoryChoiceSchema(BaseModel):
     """선택지 스키마 - immediate_reaction 필수"""
+    model_config = _NODE_SCHEMA_CONFIG
+
     text: str = Field(description="선택지 텍스트 (80-200자)")
     tags: List[str] = Field(description="게이지에 영향을 주는 태그 리스트")
     immediate_reaction: str = Field(
         description="선택 직후의 즉각적인 반응 묘사 (100-200자). 반드시 포함되어야 하며 비워둘 수 없음.",
-        min_length=50  # 최소 50자 강제
+        json_schema_extra={"minLength": _MIN_IMMEDIATE_REACTION}  # 최소 50자는 LLM에 전달되는 JSON Schema로 강제
     )
 
+    # 런타임 길이 검사는 개발 환경 방어용 (python -O 실행 시 생략)
+    if __debug__:
+        @model_validator(mode="after")
+        def _check_immediate_reaction(self):
+            if len(self.immediate_reaction) < _MIN_IMMEDIATE_REACTION:
+                raise ValueError(f"immediate_reaction은 최소 {_MIN_IMMEDIATE_REACTION}자 이상이어야 합니다")
+            return self
+
+# strict JSON Schema는 임의 키 객체(Dict)를 허용하지 않으므로 이름-값 리스트로 받고 파싱 후 dict로 변환
+class NpcEmotionSchema(BaseModel):
+    model_config = _NODE_SCHEMA_CONFIG
+
+    name: str = Field(description="캐릭터 이름")
+    emotion: str = Field(description="감정 상태")
+
+class RelationUpdateSchema(BaseModel):
+    model_config = _NODE_SCHEMA_CONFIG
+
+    relation: str = Field(description="관계 (예: 랠프-잭)")
+    change: str = Field(description="변화 내용")
+
+class StoryNodeDetailSchema(BaseModel):
+    model_config = _NODE_SCHEMA_CONFIG
+
+    npc_emotions: List[NpcEmotionSchema] = Field(description="현재 등장하는 NPC들의 감정 상태 리스트")
+    situation: str = Field(description="현재 상황 한 줄 요약")
+    relations_update: List[RelationUpdateSchema] = Field(description="이번 장면으로 인한 인물 관계 변화 리스트")
+
 class StoryNodeSchema(BaseModel):
     """스토리 노드 스키마 - Structured Output용"""
+    model_config = _NODE_SCHEMA_CONFIG
+
     text: str = Field(description="스토리 본문 (1200-2000자)")
-    details: Dict[str, Any] = Field(description="디테일 정보 (npc_emotions, situation, relations_update)")
+    details: StoryNodeDetailSchema = Field(description="디테일 정보 (npc_emotions, situation, relations_update)")
     choices: List[StoryChoiceSchema] = Field(
         description="선택지 리스트 (2-4개). 모든 선택지는 immediate_reaction 필드를 반드시 포함해야 함.",
         min_items=2,
         max_items=4
     )
 
+class ReactionRewriteSchema(BaseModel):
+    """유사 분기 노드 재사용 시 선택지별 즉각 반응만 다시 작성한 결과"""
+    reactions: List[str] = Field(description="선택지 순서대로 다시 작성한 즉각 반응 (각 100-200자)")
+
+
+class ParsedNode(TypedDict):
+    """검증을 마친 LLM 노드 응답 (이후 단계는 Pydantic 모델 대신 이 dict 형태로만 다룸)"""
+    text: str
+    details: StoryNodeDetail
+    choices: List[StoryChoice]
+
+
+def _node_schema_to_dict(node: StoryNodeSchema) -> ParsedNode:
+    """StoryNodeSchema → 노드 dict (리스트로 받은 details 항목을 StoryNodeDetail의 dict 형식으로 변환)"""
+    parsed = node.model_dump()
+    details = parsed["details"]
+    details["npc_emotions"] = {e["name"]: e["emotion"] for e in details["npc_emotions"]}
+    details["relations_update"] = {r["relation"]: r["change"] for r in details["relations_update"]}
+    return parsed
+
+# 단계별 응답 스키마 (Structured Output - 자유 형식 JSON 파싱 대신 스키마로 강제)
+class CharacterSchema(BaseModel):
+    name: str = Field(description="캐릭터 이름")
+    aliases: List[str] = Field(description="별명 리스트")
+    description: str = Field(description="외형/성격/행동/변화를 포함한 통합 설명 ([cite: 줄번호] 근거 포함)")
+    relationships: List[str] = Field(description="다른 인물과의 관계 설명 리스트 ([cite: 줄번호] 근거 포함)")
+
+class CharactersResponse(BaseModel):
+    characters: List[CharacterSchema]
+
+class GaugeSchema(BaseModel):
+    id: str = Field(description="영문 소문자 식별자")
+    name: str = Field(description="게이지 한글 이름")
+    meaning: str = Field(description="게이지가 의미하는 바 (1-2문장)")
+    min_label: str = Field(description="0일 때의 상태")
+    max_label: str = Field(description="100일 때의 상태")
+    description: str = Field(description="스토리에서 게이지가 사용되는 방식")
+    initial_value: int = Field(description="소설 시작 시점의 초기값 (0~100)")
+
+class GaugesResponse(BaseModel):
+    gauges: List[GaugeSchema]
+
+class FinalEndingSchema(BaseModel):
+    id: str = Field(description="영문 소문자 식별자")
+    type: str = Field(description="엔딩 타입 (happy, tragic, neutral, open, bad, bittersweet)")
+    title: str = Field(description="엔딩 제목")
+    condition: str = Field(description="최종 게이지 조건식 (예: hope >= 70 AND trust >= 60)")
+    summary: str = Field(description="엔딩 내용 요약 (3-5문장)")
+
+class FinalEndingsResponse(BaseModel):
+    endings: List[FinalEndingSchema]
+
+class EpisodeTemplateSchema(BaseModel):
+    id: str = Field(description="영문 소문자 식별자")
+    title: str = Field(description="에피소드 제목")
+    order: int = Field(description="순서 (1부터)")
+    description: str = Field(description="에피소드 요약 (2-3문장)")
+    theme: str = Field(description="핵심 테마/갈등")
+    key_characters: List[str] = Field(description="주요 등장인물 리스트")
+
+class EpisodesResponse(BaseModel):
+    episodes: List[EpisodeTemplateSchema]
+
+class GaugeChangeSchema(BaseModel):
+    gauge_id: str = Field(description="게이지 ID")
+    change: int = Field(description="변화량 (-30 ~ +30)")
+
+class EpisodeEndingSchema(BaseModel):
+    id: str = Field(description="영문 소문자 식별자")
+    title: str = Field(description="엔딩 제목")
+    condition: str = Field(description="태그 기반 조건식 (예: cooperative >= 2 AND trusting >= 1)")
+    text: str = Field(description="엔딩 텍스트 (800-1500자)")
+    # strict 스키마는 임의 키 dict를 허용하지 않으므로 리스트로 받은 뒤 dict로 변환
+    gauge_changes: List[GaugeChangeSchema] = Field(description="게이지별 변화량 리스트")
+
+class EpisodeEndingsResponse(BaseModel):
+    endings: List[EpisodeEndingSchema]
+
+
+# 노드 생성 시스템 프롬프트의 고정 앞부분 (작성 요구사항 + 출력 형식)
+# 모든 노드 호출에서 글자 하나 다르지 않게 맨 앞에 두어야 OpenAI 자동 프롬프트 캐싱(1024 토큰 이상 공통 prefix)이 적용됨
+_NODE_SYSTEM_RULES = """당신은 인터랙티브 소설 작가입니다. 아래 컨텍스트를 바탕으로 스토리 노드를 생성합니다.
+
+[작성 요구사항]
+1. **스토리 본문** (1200-2000자) - 독자가 완전히 몰입할 수 있도록 작성:
+
+   🎬 **영화적 장면 묘사** (필수):
+   - 시각적 디테일: 캐릭터의 표정, 몸짓, 주변 환경의 색감과 빛
+   - 청각적 요소: 대화 톤, 배경 소리, 침묵의 무게감
+   - 촉각/후각: 긴장감이 느껴지는 분위기, 공간의 온도감
+
+   💭 **내적 독백** (필수):
+   - 주요 캐릭터의 진짜 생각과 감정을 깊이 있게 표현
+   - 표면적으로 보이는 것과 내면의 갈등 대조
+   - 과거 기억이나 두려움이 현재에 미치는 영향
+
+   🗣️ **생생한 대화** (최소 2-3회 교환):
+   - 캐릭터 성격이 드러나는 자연스러운 대화
+   - 대화 중 표정, 몸짓, 말투 변화 묘사
+   - 말하지 않은 것(침묵, 망설임)도 의미 있게 표현
+
+   ⏱️ **시간의 흐름과 템포**:
+   - 긴박한 순간은 짧고 강렬하게
+   - 중요한 감정 순간은 느리고 섬세하게
+
+   예시 스타일:
+   "랠프는 손에 쥔 소라껍데기를 내려다봤다. 햇빛에 반짝이는 표면이 마치 희망의 상징처럼 느껴졌다.
+   하지만 가슴 깊은 곳에서는 불안이 꿈틀거렸다. '정말 우리를 구하러 올까?'
+
+   '봉화를 피워야 해.' 랠프가 말했다. 목소리는 의도적으로 단호하게 만들었지만,
+   손은 미세하게 떨리고 있었다. 다른 아이들이 알아챌까 봐 재빨리 주먹을 쥐었다.
+
+   잭이 비웃음을 흘렸다. '구조?' 그가 날카롭게 웃으며 고개를 저었다. '그게 중요한 게 아니야.
+   지금 당장 먹을 고기가 필요하다고!' 그의 눈에는 야성적인 흥분이 타오르고 있었다.
+   사냥의 쾌감이 이성을 집어삼키기 시작한 것 같았다.
+
+   두 소년 사이의 공기가 팽팽하게 긴장했다. 다른 아이들은 숨을 죽이고 지켜봤다..."
+
+2. **디테일 정보**:
+   - npc_emotions: 현재 등장하는 NPC들의 감정 상태 리스트 (예: [{name: '랠프', emotion: '불안'}, {name: '잭', emotion: '흥분'}])
+   - situation: 현재 상황 한 줄 요약
+   - relations_update: 이번 장면으로 인한 인물 관계 변화 리스트 (예: [{relation: '랠프-잭', change: '적대감 상승'}])
+
+3. **선택지** (2~4개, 상황에 맞게 판단):
+   - 선택지 개수는 현재 상황의 복잡도와 중요도에 따라 2~4개 중 적절히 결정하세요
+     - 단순한 상황, 긴박한 순간: 2개
+     - 일반적인 상황: 3개
+     - 중요한 분기점, 다양한 접근이 가능한 상황: 4개
+   - 선택지 텍스트는 플레이어 관점에서 1인칭으로 작성하되, 선택의 감정적 무게감을 표현
+   - 선택의 단기적 결과를 암시하는 묘사 포함 (예: "하지만 그의 눈빛에서 위협을 느낀다")
+   - 각 선택지에 특성 태그 포함 (1~2개씩)
+   - 사용 가능한 태그: cooperative, aggressive, cautious, trusting, doubtful, brave, fearful, rational, emotional
+
+   🎭 **즉각 반응 (immediate_reaction)** - ⚠️ 모든 선택지마다 MANDATORY 필수 작성 (100-200자):
+   - 플레이어가 이 선택을 했을 때 **즉시** 벌어지는 일
+   - 캐릭터들의 첫 반응 (표정, 몸짓, 짧은 말)
+   - 분위기의 변화 (긴장감 상승/하강, 온도감 변화)
+   - 플레이어의 내적 감정 (후회, 확신, 불안 등)
+   - 다음 장면으로 넘어가기 전 짧은 "숨고르기" 제공
+
+   ⚠️ CRITICAL: immediate_reaction이 없거나 비어있으면 절대 안 됩니다! 반드시 각 선택지마다 100자 이상으로 작성하세요!
+
+   예시 1 (협력적 선택):
+   "당신이 손을 내밀자 그의 경계심이 조금 풀리는 것이 보였다. '믿어도 되는 걸까?' 그가 낮게 중얼거렸다.
+   주변 사람들의 시선이 당신에게 집중되었고, 공기 중의 긴장감이 미묘하게 완화되는 느낌이 들었다."
+
+   예시 2 (공격적 선택):
+   "당신의 날카로운 말에 그의 표정이 굳어졌다. 주먹을 불끈 쥔 그가 한 발짝 다가섰다.
+   주변 공기가 얼어붙었고, 당신은 이 선택이 돌이킬 수 없는 갈등을 불러올 수 있다는 것을 직감했다."
+
+⚠️ CRITICAL: 모든 선택지에 immediate_reaction을 100-200자로 반드시 포함하세요!
+선택지가 2개든 3개든 4개든, 모든 선택지마다 immediate_reaction을 반드시 작성하세요!
+
+⚠️ 다시 한번 강조: immediate_reaction 필드를 절대 빠뜨리지 마세요! 각 선택마다 100자 이상 필수입니다!"""
+
+_NODE_ENDING_NOTE = "⚠️ 이것은 에피소드 엔딩으로 연결되는 노드입니다. 스토리를 적절히 마무리하고 선택지는 빈 배열로 두세요."
+# user 메시지 끝에 붙는 노드 타입별 지시 (앞부분은 노드별 게이지/위치/이전 스토리)
+_NODE_USER_PROMPT = "위 컨텍스트를 바탕으로 다음 스토리 노드를 생성하세요."
+_NODE_USER_PROMPT_ENDING = f"{_NODE_USER_PROMPT}\n\n{_NODE_ENDING_NOTE}"
+
+class _JsonStringFieldReader:
+    """
+    스트리밍으로 도착하는 JSON 조각에서 문자열 필드 하나의 값을 도착하는 대로 디코딩
+
+    키 이름으로 처음 나오는 필드를 찾으므로 StoryNodeSchema처럼 대상 필드가 첫 속성인 스키마에 사용합니다.
+    이스케이프 시퀀스가 조각 경계에서 잘리면 다음 조각이 올 때까지 디코딩을 미룹니다.
+    """
+
+    def __init__(self, field: str):
+        self._key_re = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buf = ""
+        self._pos = -1  # 값 안에서 아직 디코딩하지 않은 위치 (-1: 키 탐색 중)
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        """조각을 추가하고 새로 확정된 값 부분(디코딩된 문자열)을 반환"""
+        if self.done:
+            return ""
+        self._buf += chunk
+        if self._pos < 0:
+            match = self._key_re.search(self._buf)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        buf = self._buf
+        start = i = self._pos
+        n = len(buf)
+        last_escape = -1
+        while i < n:
+            c = buf[i]
+            if c == '"':
+                self.done = True
+                break
+            if c == '\\':
+                step = 6 if buf[i + 1:i + 2] == 'u' else 2
+                if i + step > n:
+                    break
+                last_escape = i
+                i += step
+            else:
+                i += 1
+
+        # 서로게이트 쌍(\ud83d\ude00 등)의 앞쪽 절반에서 끝났으면 뒤쪽 절반이 올 때까지 보류
+        if not self.done and last_escape == i - 6 and buf[i - 4:i - 2].lower() in ("d8", "d9", "da", "db"):
+            i = last_escape
+
+        self._pos = i + 1 if self.done else i
+        return json.loads(f'"{buf[start:i]}"') if i > start else ""
+
+
+# OpenAI 호출 공용 HTTP 커넥션 풀 - 트리 단계/에피소드 사이의 공백에도 연결(TLS)을 유지하도록 keep-alive를 길게 두고,
+# h2 패키지가 설치되어 있으면 HTTP/2로 동시 분기 요청을 적은 수의 연결에 다중화
+_HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=60.0)
+# 설정별 클라이언트 캐시 크기 (API 키가 여러 개여도 메모리가 계속 늘지 않도록 LRU로 제한)
+_CLIENT_CACHE_SIZE = 32
+
+
+def _new_http_client() -> httpx.AsyncClient:
+    try:
+        import h2  # noqa: F401
+        http2 = True
+    except ImportError:
+        http2 = False
+    return httpx.AsyncClient(http2=http2, limits=_HTTP_LIMITS, timeout=60.0)
+
+
+def _lru_get(cache: "OrderedDict[tuple, Any]", key: tuple, factory: Callable[[], Any]) -> Any:
+    """cache[key]가 없으면 factory()로 만들어 넣고 반환 (최근 사용 순 유지, _CLIENT_CACHE_SIZE 초과 시 가장 오래된 항목 제거)"""
+    value = cache.get(key)
+    if value is None:
+        value = cache[key] = factory()
+    cache.move_to_end(key)
+    if len(cache) > _CLIENT_CACHE_SIZE:
+        cache.popitem(last=False)
+    return value
+
+
+def _api_key_id(api_key: Optional[str]) -> Optional[str]:
+    """캐시 키용 API 키 식별자 (원본 키를 모듈 전역 dict 키로 보관하지 않도록 해시)"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest() if api_key else None
+
+
+class _LoopClients:
+    """
+    이벤트 루프 하나에서 공유하는 HTTP 커넥션 풀과, 그 풀을 쓰는 ChatOpenAI / Structured Output 캐시
+
+    keep-alive 연결은 연결을 연 이벤트 루프에 묶여 있으므로 루프가 바뀌면(스크립트/테스트의 asyncio.run 반복 등)
+    다른 루프의 연결을 재사용하지 않도록 루프별로 따로 둡니다.
+    """
+    __slots__ = ("http", "chat_models", "structured_outputs", "__weakref__")
+
+    def __init__(self):
+        self.http = _new_http_client()
+        self.chat_models: "OrderedDict[tuple, ChatOpenAI]" = OrderedDict()
+        self.structured_outputs: "OrderedDict[tuple, Any]" = OrderedDict()
+
+
+# 이벤트 루프 → 루프 전용 클라이언트 묶음 (루프가 사라지면 함께 제거)
+_LOOP_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopClients]" = weakref.WeakKeyDictionary()
+
+
+def _loop_clients() -> _LoopClients:
+    """실행 중인 이벤트 루프의 클라이언트 묶음 (루프 밖에서 만든 디렉터는 공유하지 않고 전용 묶음 사용)"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _LoopClients()
+    clients = _LOOP_CLIENTS.get(loop)
+    if clients is None:
+        # 열린 연결이 루프를 참조해 약한 참조만으로는 해제되지 않으므로, 이미 닫힌 루프의 묶음은 여기서 정리
+        for closed in [other for other in _LOOP_CLIENTS if other.is_closed()]:
+            del _LOOP_CLIENTS[closed]
+        clients = _LOOP_CLIENTS[loop] = _LoopClients()
+    return clients
+
+
+# 상태 없는 파서이므로 모듈 단일 인스턴스 사용
+_JSON_PARSER = JsonOutputParser()
+
+
+def _chat_model(api_key: str, model: str, timeout: float, service_tier: Optional[str] = None, clients: Optional[_LoopClients] = None) -> ChatOpenAI:
+    """
+    설정별 ChatOpenAI 단일 인스턴스 반환 (temperature는 0.7 고정)
+
+    API는 요청마다 디렉터를 새로 만들므로 같은 설정의 클라이언트는 같은 이벤트 루프 안에서 공유합니다.
+    """
+    clients = clients or _loop_clients()
+    kwargs = {"service_tier": service_tier} if service_tier else {}
+    # 재시도는 LLMGateway가 RPM/TPM 예산과 함께 처리하므로 클라이언트 자체 재시도는 끔
+    # 스트리밍 응답도 마지막 조각에 사용량이 실리도록 stream_usage를 켜서 게이트웨이가 TPM 예약분을 정산
+    return _lru_get(
+        clients.chat_models,
+        (_api_key_id(api_key), model, timeout, service_tier),
+        lambda: ChatOpenAI(
+            model=model, temperature=0.7, api_key=api_key, timeout=timeout, max_retries=0,
+            stream_usage=True, http_async_client=clients.http, **kwargs
+        )
+    )
+
+
+# Rate Limit은 계정(API 키) 단위이므로 게이트웨이도 같은 키·한도면 디렉터 인스턴스 간에 공유
+# (게이트웨이는 이벤트 루프에 묶인 상태가 없으므로 루프와 무관하게 프로세스 전역)
+_GATEWAYS: "OrderedDict[tuple, LLMGateway]" = OrderedDict()
+
+
+def _gateway(api_key: str, requests_per_minute: int, tokens_per_minute: int) -> LLMGateway:
+    return _lru_get(
+        _GATEWAYS,
+        (_api_key_id(api_key), requests_per_minute, tokens_per_minute),
+        lambda: LLMGateway(requests_per_minute, tokens_per_minute)
+    )
+
+
+def _llm_config_key(llm: Any) -> tuple:
+    """요청 내용에 영향을 주는 ChatOpenAI 설정 튜플"""
+    api_key = getattr(llm, "openai_api_key", None)
+    return (
+        getattr(llm, "model_name", ""),
+        getattr(llm, "temperature", None),
+        getattr(llm, "service_tier", None),
+        getattr(llm, "request_timeout", None),
+        _api_key_id(api_key.get_secret_value()) if api_key is not None else None,
+    )
+
+
+def _structured_output(llm: Any, schema: type, clients: Optional[_LoopClients] = None) -> Any:
+    """
+    같은 설정의 LLM + 스키마 조합이면 이미 만든 Structured Output 러너블 반환
+
+    with_structured_output은 만들 때마다 스키마 → JSON Schema 변환을 수행하므로
+    (LLM 설정, 스키마)별로 한 번만 만들어 같은 이벤트 루프의 디렉터 인스턴스 간에 재사용합니다.
+    """
+    clients = clients or _loop_clients()
+    return _lru_get(
+        clients.structured_outputs,
+        (_llm_config_key(llm), schema),
+        lambda: _RawStructuredOutput(llm.with_structured_output(schema))
+    )
+
+
+class _RawStructuredOutput:
+    """
+    Structured Output 러너블을 모델 호출 / 파싱 단계로 나눠 실행하고 원본 메시지도 함께 반환
+
+    게이트웨이가 원본 메시지의 usage_metadata로 TPM 예약분을 정산할 수 있도록 {"raw", "parsed", "parsing_error"}를 반환합니다
+    (with_structured_output(include_raw=True)와 같은 형식이지만, 호출 kwargs(prompt_cache_key 등)를 모델 호출에 그대로 전달).
+    결과는 _structured_result로 꺼냅니다. 스키마 검증이 모델 호출 안에서 실패하면 예외가 그대로 올라가며 예약분은 정산되지 않습니다(과대 예약 쪽으로 안전).
+    """
+    __slots__ = ("model", "parser")
+
+    def __init__(self, runnable: Any):
+        self.model = runnable.first
+        self.parser = runnable.last
+
+    async def ainvoke(self, messages: Any, **kwargs) -> Dict[str, Any]:
+        raw = await self.model.ainvoke(messages, **kwargs)
+        try:
+            return {"raw": raw, "parsed": self.parser.invoke(raw), "parsing_error": None}
+        except (ValidationError, OutputParserException) as e:
+            return {"raw": raw, "parsed": None, "parsing_error": e}
+
+
+def _structured_result(response: Dict[str, Any]) -> BaseModel:
+    """Structured Output 응답에서 검증된 모델 반환 (파싱/검증 실패는 예외로 다시 올림)"""
+    error = response.get("parsing_error")
+    if error is not None:
+        raise error
+    parsed = response.get("parsed")
+    if parsed is None:
+        raise OutputParserException("Structured Output 응답이 비어 있습니다")
+    return parsed
+
+
+def _with_repair_note(messages: Any, error: Exception) -> List[Any]:
+    """검증에 실패한 Structured Output 재요청용 메시지 (원래 메시지 + 검증 오류 안내)"""
+    base = [HumanMessage(content=messages)] if isinstance(messages, str) else list(messages)
+    return base + [HumanMessage(
+        content=f"이전 응답이 스키마 검증에 실패했습니다: {error}\n오류를 고쳐 스키마에 맞는 응답만 다시 작성하세요."
+    )]
+
 # ==============================================================================
 # 2. 메인 클래스: 인터랙티브 스토리 디렉터
 # ==============================================================================
 
 class InteractiveStoryDirector:
-    def __init__(self, api_key: str):
-        self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7, api_key=api_key)
+    def __init__(
+        self,
+        api_key: str,
+        max_concurrency: Optional[int] = None,
+        enable_cache: bool = False,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        compact_prompt: bool = True,
+        service_tier: Optional[str] = None,
+        fast_model: Optional[str] = "gpt-4.1-nano",
+        deep_model: Optional[str] = None,
+        semantic_cache: bool = False,
+        semantic_threshold: float = 0.92,
+        semantic_repair_threshold: Optional[float] = None,
+        request_timeout: float = 60.0,
+        requests_per_minute: int = 500,
+        tokens_per_minute: int = 200_000,
+        use_batch_api: bool = False
+    ):
+        # 현재 이벤트 루프의 공용 HTTP 풀/클라이언트 캐시 (이 디렉터의 모든 클라이언트가 같은 풀 사용)
+        self._clients = clients = _loop_clients()
+        # 요청별 타임아웃 - 응답이 멈춘 호출이 세마포어 슬롯을 무기한 점유하지 않도록 함
+        self.llm = _chat_model(api_key, "gpt-4o-mini", request_timeout, clients=clients)
+        # 자유 형식 JSON 응답용 (JSON 모드 - 코드 펜스/후행 쉼표 없는 유효한 JSON 객체만 반환되므로 _parse_json이 첫 시도에 성공)
+        self.llm_json = self.llm.bind(response_format={"type": "json_object"})
+        # 지연에 덜 민감한 대량 호출(트리 노드 생성, 청크 요약)용 LLM
+        # service_tier="flex" 등을 지정하면 해당 티어로 요청 (지원 모델에서만 사용, 기본은 self.llm 공유)
+        if service_tier:
+            self.llm_flex = _chat_model(api_key, "gpt-4o-mini", request_timeout, service_tier, clients)
+        else:
+            self.llm_flex = self.llm
         # Structured Output용 LLM (JSON Schema 강제 모드)
-        self.structured_llm = self.llm.with_structured_output(StoryNodeSchema)
-        self.json_parser = JsonOutputParser()
+        self.structured_llm = _structured_output(self.llm_flex, StoryNodeSchema, clients)
+        # 중간 전개(development) 노드용 저가 모델 - 첫 선택/클라이맥스/엔딩 노드는 기본 모델 유지
+        # fast_model=None 이면 모든 노드를 기본 모델로 생성
+        if fast_model:
+            self.llm_fast = _chat_model(api_key, fast_model, request_timeout, service_tier, clients)
+            self.structured_llm_fast = _structured_output(self.llm_fast, StoryNodeSchema, clients)
+        else:
+            self.llm_fast = self.llm_flex
+            self.structured_llm_fast = self.structured_llm
+        # 클라이맥스/엔딩 노드 전용 상위 모델 (예: "gpt-4o") - 모델을 올릴 때 전체 노드 대신 이 노드들만 올림
+        # deep_model=None 이면 기본 모델로 생성
+        if deep_model:
+            self.llm_deep = _chat_model(api_key, deep_model, request_timeout, service_tier, clients)
+            self.structured_llm_deep = _structured_output(self.llm_deep, StoryNodeSchema, clients)
+        else:
+            self.llm_deep = self.llm_flex
+            self.structured_llm_deep = self.structured_llm
+        self._structured_llms: Dict[type, Any] = {}
+        self.json_parser = _JSON_PARSER
+        # 트리 생성 시 형제 노드들이 동시에 LLM을 호출하므로 동시 요청 수를 제한 (Rate Limit 보호)
+        # 미지정 시 STORY_MAX_CONCURRENCY 환경 변수 (기본 16) - 깊은 트리에서 한 깊이의 분기가 수백 개여도 이 수만큼만 동시 요청
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv("STORY_MAX_CONCURRENCY", "16"))
+        self._llm_semaphore = asyncio.Semaphore(max_concurrency)
+        # 모든 LLM 호출이 거치는 RPM/TPM 예산 + 429/5xx/연결 오류 재시도 게이트웨이 (계정 한도에 맞게 조정)
+        self.gateway = _gateway(api_key, requests_per_minute, tokens_per_minute)
+        # 분석 단계(캐릭터/게이지/최종 엔딩/에피소드 분할/에피소드 엔딩) 호출을 Batch API로 제출 (약 50% 저렴, 최대 24시간 소요)
+        # 오프라인 소설 등록용 - 동시에 대기 중인 요청은 배치 작업 하나로 묶임
+        self.batch_runner = OpenAIBatchRunner(api_key) if use_batch_api else None
+        # 프롬프트 해시 기반 응답 캐시 (개발/재생성 시 동일 프롬프트 재호출 방지)
+        self.cache = LLMResponseCache(cache_dir) if enable_cache else None
+        # 비슷한 (이전 본문, 선택지, 게이지) 조합의 노드를 임베딩 유사도로 재사용 (QA 등에서는 끄고 사용)
+        self.semantic_cache = SemanticNodeCache(
+            OpenAIEmbeddings(
+                model="text-embedding-3-small", dimensions=256, api_key=api_key,
+                http_async_client=clients.http
+            ),
+            threshold=semantic_threshold
+        ) if semantic_cache else None
+        # 유사도가 이 값 이상 semantic_threshold 미만인 분기는 캐시된 본문을 재사용하고 즉각 반응만 저가 호출로 다시 작성
+        # (None이면 사용 안 함, 예: 0.80)
+        self.semantic_repair_threshold = semantic_repair_threshold
+        # 프롬프트용 캐릭터/게이지/엔딩 블록을 한 줄 레코드(파이프 구분)로 압축 (False면 기존 불릿 형식)
+        self.compact_prompt = compact_prompt
+
+    @staticmethod
+    def _text_cache_key(messages, llm: Any) -> str:
+        """
+        텍스트 응답 캐시 키 - 실제로 호출하는 llm의 모델/온도로 구분
+
+        bind로 고정한 호출 인자(llm_json의 response_format 등)가 있으면 namespace에 넣어,
+        같은 프롬프트라도 출력 형식이 다른 호출끼리 캐시된 응답을 공유하지 않도록 합니다.
+        """
+        bound = llm.kwargs if isinstance(llm, RunnableBinding) else None
+        return make_cache_key(
+            messages,
+            getattr(llm, "model_name", ""),
+            getattr(llm, "temperature", None),
+            namespace=_json_dumps(bound) if bound else ""
+        )
+
+    async def _cached_invoke(self, messages, llm=None) -> str:
+        """LLM 호출 후 응답 텍스트 반환 (캐시 활성화 시 동일 프롬프트는 캐시에서 반환)"""
+        llm = llm or self.llm
+        if self.cache is None:
+            response = await self.gateway.invoke(llm, messages)
+            return response.content
+
+        key = self._text_cache_key(messages, llm)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        response = await self.gateway.invoke(llm, messages)
+        self.cache.set(key, response.content)
+        return response.content
+
+    async def _cached_stream(self, prompt: str, on_token: Optional[Callable[[str], Awaitable[None]]] = None) -> str:
+        """LLM 응답을 스트리밍으로 받아 조각마다 on_token 콜백 호출 후 전체 텍스트 반환 (캐시 적중 시 한 번에 전달)"""
+        key = None
+        if self.cache is not None:
+            key = self._text_cache_key(prompt, self.llm)
+            cached = self.cache.get(key)
+            if cached is not None:
+                if on_token:
+                    await on_token(cached)
+                return cached
+
+        parts = []
+        async for chunk in self.gateway.stream(self.llm, prompt):
+            if not chunk.content:
+                continue
+            parts.append(chunk.content)
+            if on_token:
+                await on_token(chunk.content)
+
+        text = "".join(parts)
+        if key:
+            self.cache.set(key, text)
+        return text
+
+    def _structured_for(self, schema: type):
+        """스키마별 Structured Output LLM (한 번 만든 것은 재사용)"""
+        if schema is StoryNodeSchema:
+            return self.structured_llm
+        if schema not in self._structured_llms:
+            self._structured_llms[schema] = _structured_output(self.llm, schema, self._clients)
+        return self._structured_llms[schema]
+
+    async def _structured_call(
+        self, messages, schema: type, batch: bool = False, max_repairs: int = 1, **kwargs
+    ) -> BaseModel:
+        """
+        Structured Output 호출 (batch=True이고 use_batch_api가 켜져 있으면 Batch API로 제출)
+
+        동시 호출 수 세마포어는 실시간 호출에서만 잡습니다. Batch API 제출은 결과까지 최대 24시간 걸릴 수 있어
+        세마포어를 잡은 채 기다리면 다른 실시간 호출이 모두 막히므로 세마포어 없이 제출합니다.
+        응답이 스키마 검증에 실패하면 검증 오류를 덧붙여 max_repairs회까지 다시 요청하고,
+        그래도 실패하면 예외를 그대로 올립니다 (기본값으로 대체하지 않음).
+        """
+        for attempt in range(max_repairs + 1):
+            try:
+                if batch and self.batch_runner is not None:
+                    return await self.batch_runner.parse(
+                        messages, schema,
+                        model=getattr(self.llm, "model_name", ""),
+                        temperature=getattr(self.llm, "temperature", None)
+                    )
+                async with self._llm_semaphore:
+                    response = await self.gateway.invoke(self._structured_for(schema), messages, **kwargs)
+                return _structured_result(response)
+            except (ValidationError, OutputParserException) as e:
+                if attempt >= max_repairs:
+                    raise
+                print(f"  🔧 {schema.__name__} 검증 실패, 오류를 전달하여 재요청 ({attempt + 1}/{max_repairs})")
+                messages = _with_repair_note(messages, e)
+
+    async def _cached_structured_dump(self, messages, schema: type = StoryNodeSchema, batch: bool = False, **kwargs) -> Dict[str, Any]:
+        """
+        Structured Output 호출 결과를 dict로 반환
+
+        새 LLM 응답은 스키마 검증을 거친 뒤 model_dump 결과를 캐시에 저장하고,
+        캐시 적중 시에는 이미 검증된 dict이므로 스키마 재검증/모델 생성 없이 복사본을 그대로 반환합니다.
+        """
+        if self.cache is None:
+            return (await self._structured_call(messages, schema, batch, **kwargs)).model_dump()
+
+        key = make_cache_key(
+            messages,
+            getattr(self.llm, "model_name", ""),
+            getattr(self.llm, "temperature", None),
+            namespace=schema.__name__
+        )
+        cached = self.cache.get(key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+
+        dumped = (await self._structured_call(messages, schema, batch, **kwargs)).model_dump()
+        self.cache.set(key, copy.deepcopy(dumped))
+        return dumped
+
+    async def _invoke_list(self, prompt: str, schema: type, field: str) -> List[Dict]:
+        """목록형 응답 스키마로 호출하여 field 항목들을 dict 리스트로 반환 (검증 실패는 1회 수정 요청 후 예외 발생)"""
+        response = await self._cached_structured_dump(prompt, schema=schema, batch=True)
+        return response.get(field, [])
 
     # --------------------------------------------------------------------------
     # [2단계] 등장인물 자동 추출 (Extract Characters)
@@ -59,20 +822,41 @@ class InteractiveStoryDirector:
         print("🕵️ 등장인물 분석 중...")
 
         # 텍스트에 줄 번호 추가 (cite 참조용)
-        lines = novel_text.split('\n')
+        lines = novel_text.splitlines()
+
+        # 전체 텍스트를 청크로 나눠 청크별로 동시에 추출한 뒤 병합 (긴 소설도 일부 구간을 버리지 않음)
+        # 줄 번호는 원문 기준으로 매겨 청크가 달라도 [cite: 줄번호]가 같은 줄을 가리킴
+        spans = _line_chunks(lines, _CHARACTER_CHUNK_CHARS, _CHARACTER_CHUNK_OVERLAP_LINES)
+
+        async def extract_chunk(start: int, end: int) -> List[Dict]:
+            numbered_text = '\n'.join(f"[{i}] {line}" for i, line in enumerate(lines[start:end], start + 1))
+            part_note = "" if len(spans) == 1 else "\n(소설 전체 중 일부 구간입니다. 이 구간에 등장하는 인물만 추출하세요.)\n"
+            prompt = self._character_prompt(numbered_text, part_note)
+            return await self._invoke_list(prompt, CharactersResponse, "characters")
 
-        # 전체 텍스트 사용 (너무 길면 앞/중간/뒤 샘플링)
-        if len(lines) <= 1000:
-            selected_lines = lines
+        if len(spans) <= 1:
+            characters = await extract_chunk(0, len(lines))
         else:
-            # 앞 400줄, 중간 200줄, 뒤 400줄
-            mid_start = len(lines) // 2 - 100
-            selected_lines = lines[:400] + lines[mid_start:mid_start+200] + lines[-400:]
+            print(f"  📦 {len(spans)}개 구간으로 나눠 등장인물 추출")
+            chunk_results = await asyncio.gather(*(extract_chunk(start, end) for start, end in spans))
+            merged = _merge_characters(chunk_results)
+            # 이름 표기가 달라 합쳐지지 않은 중복 인물 정리 + 이어 붙인 설명 압축 (실패 시 병합 결과 그대로 사용)
+            try:
+                characters = await self._refine_characters(merged) if merged else []
+            except Exception as e:
+                print(f"  ⚠️ 등장인물 정리 실패, 병합 결과 사용: {e}")
+                characters = []
+            characters = characters or merged
 
-        numbered_text = '\n'.join([f"[{i+1}] {line}" for i, line in enumerate(selected_lines)])
+        if not characters:
+            raise ValueError("등장인물 추출 결과가 비어 있습니다")
 
-        prompt = f"""당신은 문학 분석 전문가입니다. 아래 소설 텍스트에서 주요 등장인물들의 정보를 상세히 추출하세요.
+        return characters
 
+    def _character_prompt(self, numbered_text: str, part_note: str = "") -> str:
+        """등장인물 추출 프롬프트 (numbered_text: 줄 번호가 붙은 소설 텍스트)"""
+        return f"""당신은 문학 분석 전문가입니다. 아래 소설 텍스트에서 주요 등장인물들의 정보를 상세히 추출하세요.
+{part_note}
 [소설 텍스트] (줄 번호 포함)
 {numbered_text}
 
@@ -102,35 +886,21 @@ class InteractiveStoryDirector:
         "잭과 리더십 문제로 대립함 [cite: 612, 892]",
         "새끼돼지의 별명을 폭로했으나 나중에는 신뢰함 [cite: 215, 1840]"
     ]
-}}
-
-반드시 아래 JSON 형식으로만 응답하세요:
-{{
-    "characters": [
-        {{
-            "name": "캐릭터 이름",
-            "aliases": ["별명1", "별명2"],
-            "description": "상세 설명 [cite: 줄번호]...",
-            "relationships": ["관계 설명 [cite: 줄번호]", ...]
-        }}
-    ]
 }}"""
-        response = await self.llm.ainvoke(prompt)
-        characters = self._parse_json(response.content).get("characters", [])
 
-        # 빈 결과일 경우 기본값 반환
-        if not characters:
-            print("  ⚠️ 캐릭터 추출 실패, 기본값 사용")
-            return [
-                {
-                    "name": "주인공",
-                    "aliases": [],
-                    "description": "주인공에 대한 정보를 추출할 수 없습니다.",
-                    "relationships": []
-                }
-            ]
+    async def _refine_characters(self, merged: List[Dict]) -> List[Dict]:
+        """청크별 추출 결과를 합친 목록에서 중복 인물을 합치고 설명을 압축"""
+        prompt = f"""다음은 소설을 여러 구간으로 나눠 추출한 등장인물 목록을 이름/별명 기준으로 합친 결과입니다.
 
-        return characters
+[병합된 등장인물]
+{_json_dumps(merged)}
+
+[정리 규칙]
+- 표기만 다른 같은 인물(예: 이름과 별명이 각각 따로 추출된 경우)은 하나로 합치고 별명을 모두 남기세요
+- description은 겹치는 내용을 정리하여 800자 이내로 압축하되 [cite: 줄번호] 표기는 유지하세요
+- relationships는 중복을 제거하고 중요한 관계 위주로 정리하세요
+- 목록에 없는 새로운 정보나 인물을 추가하지 마세요"""
+        return await self._invoke_list(prompt, CharactersResponse, "characters")
 
     # --------------------------------------------------------------------------
     # [3단계] 게이지 제안 (Generate Gauges)
@@ -152,38 +922,11 @@ class InteractiveStoryDirector:
 - max_label: 100일 때의 상태 (예: "질서", "공포")
 - description: 스토리에서 이 게이지가 어떻게 사용되는지 설명
 - initial_value: 소설 시작 시점의 초기값 (0~100, 소설 상황에 맞게 설정)
-  - 예: 평화로운 시작이면 hope=70, 위기 상황이면 hope=30
+  - 예: 평화로운 시작이면 hope=70, 위기 상황이면 hope=30"""
+        gauges = await self._invoke_list(prompt, GaugesResponse, "gauges")
 
-반드시 아래 JSON 형식으로만 응답하세요:
-{{
-    "gauges": [
-        {{
-            "id": "civilization",
-            "name": "문명도",
-            "meaning": "사회 질서와 규범을 유지하려는 정도",
-            "min_label": "야만",
-            "max_label": "질서",
-            "description": "높을수록 민주적 리더십과 규칙을 따르고, 낮을수록 본능과 폭력에 의존",
-            "initial_value": 65
-        }}
-    ]
-}}"""
-        response = await self.llm.ainvoke(prompt)
-        gauges = self._parse_json(response.content).get("gauges", [])
-
-        # 빈 결과일 경우 기본값 반환
         if not gauges:
-            print("  ⚠️ 게이지 제안 실패, 기본값 사용")
-            return [
-                {
-                    "id": "progress",
-                    "name": "진행도",
-                    "meaning": "스토리 진행 상황",
-                    "min_label": "시작",
-                    "max_label": "완료",
-                    "description": "스토리가 얼마나 진행되었는지 나타냄"
-                }
-            ]
+            raise ValueError("게이지 제안 결과가 비어 있습니다")
 
         return gauges
 
@@ -261,42 +1004,11 @@ class InteractiveStoryDirector:
 - type: 엔딩 타입 (예: "happy", "bad", "neutral", "tragic", "open")
 - title: 엔딩 제목 (예: "구조의 희망", "야만으로의 추락")
 - condition: 도달 조건 - 최종 게이지 상태 (예: "hope >= 70 AND despair <= 30")
-- summary: 엔딩 내용 요약 (3-5문장)
+- summary: 엔딩 내용 요약 (3-5문장)"""
+        endings = await self._invoke_list(prompt, FinalEndingsResponse, "endings")
 
-반드시 아래 JSON 형식으로만 응답하세요:
-{{
-    "endings": [
-        {{
-            "id": "ending_hope",
-            "type": "happy",
-            "title": "구조의 희망",
-            "condition": "hope >= 70 AND trust >= 60",
-            "summary": "소년들은 끝까지 희망을 잃지 않고 서로를 신뢰했다. 마침내 구조선이 도착하고, 모두가 안전하게 돌아간다."
-        }},
-        {{
-            "id": "ending_despair",
-            "type": "tragic",
-            "title": "절망의 나락",
-            "condition": "despair >= 70 AND trust <= 30",
-            "summary": "절망이 모든 것을 집어삼켰다. 서로에 대한 신뢰는 무너지고, 비극적인 결말을 맞이한다."
-        }}
-    ]
-}}"""
-        response = await self.llm.ainvoke(prompt)
-        endings = self._parse_json(response.content).get("endings", [])
-
-        # 빈 결과일 경우 기본값 반환
         if not endings:
-            print("  ⚠️ 최종 엔딩 설계 실패, 기본값 사용")
-            return [
-                {
-                    "id": "ending_default",
-                    "type": "neutral",
-                    "title": "기본 엔딩",
-                    "condition": "default",
-                    "summary": "스토리가 기본적인 결말에 도달합니다."
-                }
-            ]
+            raise ValueError("최종 엔딩 설계 결과가 비어 있습니다")
 
         print(f"  ✅ {len(endings)}개의 최종 엔딩 설계 완료")
         return endings
@@ -330,36 +1042,11 @@ class InteractiveStoryDirector:
 - order: 순서 (1, 2, 3...)
 - description: 에피소드 요약 (2-3문장)
 - theme: 핵심 테마/갈등 (예: "신뢰 vs 의심", "희망 vs 절망")
-- key_characters: 주요 등장인물 리스트
-
-반드시 아래 JSON 형식으로만 응답하세요:
-{{
-    "episodes": [
-        {{
-            "id": "ep1_encounter",
-            "title": "첫 만남",
-            "order": 1,
-            "description": "주인공들이 처음 만나 서로를 알아가는 과정. 첫인상과 초기 관계가 형성된다.",
-            "theme": "신뢰 형성",
-            "key_characters": ["랠프", "잭", "새끼돼지"]
-        }}
-    ]
-}}"""
-        response = await self.llm.ainvoke(prompt)
-        episodes = self._parse_json(response.content).get("episodes", [])
+- key_characters: 주요 등장인물 리스트"""
+        episodes = await self._invoke_list(prompt, EpisodesResponse, "episodes")
 
         if not episodes:
-            print("  ⚠️ 에피소드 분할 실패, 기본값 사용")
-            return [
-                {
-                    "id": "ep1_default",
-                    "title": "에피소드 1",
-                    "order": 1,
-                    "description": "기본 에피소드",
-                    "theme": "기본",
-                    "key_characters": char_names[:3]
-                }
-            ]
+            raise ValueError("에피소드 분할 결과가 비어 있습니다")
 
         print(f"  ✅ {len(episodes)}개 에피소드 분할 완료")
         for ep in episodes:
@@ -370,7 +1057,19 @@ class InteractiveStoryDirector:
     # --------------------------------------------------------------------------
     # [5-2단계] 에피소드 도입부 생성 (Generate Episode Intro)
     # --------------------------------------------------------------------------
-    async def generate_episode_intro(self, episode: Dict, characters: List[Character], novel_summary: str) -> str:
+    async def generate_episode_intro(
+        self,
+        episode: Dict,
+        characters: List[Character],
+        novel_summary: str,
+        on_token: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> str:
+        """
+        에피소드 도입부 생성
+
+        Args:
+            on_token: 스트리밍 중 텍스트 조각을 받을 async 콜백 (웹소켓/SSE 전달용, 선택)
+        """
         print(f"  🎬 '{episode.get('title', '?')}' 도입부 생성 중...")
 
         # 캐릭터 정보
@@ -447,8 +1146,8 @@ class InteractiveStoryDirector:
 
 도입부 텍스트만 작성해주세요 (JSON 형식 아님, 순수 텍스트):"""
 
-        response = await self.llm.ainvoke(prompt)
-        intro_text = response.content.strip()
+        response_text = await self._cached_stream(prompt, on_token)
+        intro_text = response_text.strip()
 
         print(f"    ✅ 도입부 생성 완료 ({len(intro_text)}자)")
         return intro_text
@@ -489,6 +1188,7 @@ class InteractiveStoryDirector:
 - id: 영문 소문자 식별자
 - title: 엔딩 제목 (감정적 울림이 있는 제목)
 - condition: 태그 기반 조건식 (예: "cooperative >= 2 AND trusting >= 1")
+  - 어떤 조건에도 해당하지 않을 때 도달하는 기본 엔딩 1개는 condition을 "default"로 작성
 - text: 엔딩 텍스트 (800-1500자) - 플레이어의 선택이 만든 결과를 깊이 있게 표현:
 
   📖 **엔딩 텍스트 작성 가이드** (800-1500자):
@@ -528,62 +1228,35 @@ class InteractiveStoryDirector:
 
   하지만 섬의 어둠은 여전히 깊었고, 앞으로 더 어려운 시련이 기다리고 있었다..."
 
-- gauge_changes: 게이지 변화 (예: {{'hope': 15, 'trust': 10}})
-
-반드시 아래 JSON 형식으로만 응답하세요:
-{{
-    "endings": [
-        {{
-            "id": "ep1_ending_trust",
-            "title": "신뢰의 시작",
-            "condition": "cooperative >= 2 AND trusting >= 1",
-            "text": "서로를 알아가며 신뢰가 싹텄다. 아직 완전하지는 않지만, 함께할 수 있다는 희망이 생겼다.",
-            "gauge_changes": {{"hope": 10, "trust": 15}}
-        }},
-        {{
-            "id": "ep1_ending_doubt",
-            "title": "의심의 씨앗",
-            "condition": "doubtful >= 2 OR aggressive >= 2",
-            "text": "서로를 경계하며 거리를 두었다. 불신의 씨앗이 마음 속에 심어졌다.",
-            "gauge_changes": {{"hope": -5, "trust": -10}}
-        }},
-        {{
-            "id": "ep1_ending_neutral",
-            "title": "조심스러운 관망",
-            "condition": "default",
-            "text": "특별한 진전 없이 에피소드가 마무리되었다. 아직 서로에 대해 알아가는 중이다.",
-            "gauge_changes": {{"hope": 0, "trust": 0}}
-        }}
-    ]
-}}"""
-        response = await self.llm.ainvoke(prompt)
-        endings = self._parse_json(response.content).get("endings", [])
+- gauge_changes: 게이지별 변화량 (예: hope +15, trust +10)"""
+        endings = await self._invoke_list(prompt, EpisodeEndingsResponse, "endings")
+        for ending in endings:
+            ending["gauge_changes"] = {c["gauge_id"]: c["change"] for c in ending.get("gauge_changes", [])}
 
         if not endings:
-            print(f"    ⚠️ 에피소드 엔딩 설계 실패, 기본값 사용")
-            return [
-                {
-                    "id": f"{episode.get('id', 'ep')}_ending_default",
-                    "title": "기본 엔딩",
-                    "condition": "기본",
-                    "text": "에피소드가 끝났습니다.",
-                    "gauge_changes": {{}}
-                }
-            ]
+            raise ValueError(f"에피소드 엔딩 설계 결과가 비어 있습니다 ({episode.get('id', 'ep')})")
 
         print(f"    ✅ {len(endings)}개 엔딩 설계 완료")
         return endings
 
     # --------------------------------------------------------------------------
-    # [5단계] 스토리 트리 생성 (Generate Story Tree - LangGraph Engine)
+    # [5단계] 스토리 트리 생성 (Generate Story Tree - 깊이별 병렬 BFS)
     # --------------------------------------------------------------------------
-    async def generate_full_tree(self, context: Dict, max_depth: int = 3) -> List[StoryNode]:
+    async def generate_full_tree(
+        self,
+        context: Dict,
+        max_depth: int = 3,
+        on_node_text: Optional[Callable[[str, str], Awaitable[None]]] = None,
+        batch_runner: Optional[OpenAIBatchRunner] = None
+    ) -> List[StoryNode]:
         """
-        LangGraph를 사용하여 전체 스토리 트리를 생성합니다.
+        깊이별 BFS로 전체 스토리 트리를 생성합니다 (같은 깊이의 노드는 asyncio.gather로 동시에 생성).
 
         Args:
             context: 캐릭터, 게이지, 엔딩, 구조가이드, 소설요약 등 모든 컨텍스트 정보
             max_depth: 트리의 최대 깊이 (기본값: 3)
+            on_node_text: 노드 본문을 생성되는 대로 받을 async 콜백 (node_id, 텍스트 조각) - 지정 시 노드 응답을 스트리밍
+            batch_runner: 지정 시 노드 요청을 깊이별로 모아 Batch API로 제출 (precompute_tree_batch 참고)
 
         Returns:
             생성된 모든 StoryNode 리스트
@@ -602,13 +1275,14 @@ class InteractiveStoryDirector:
         estimated_nodes = sum([avg_choices ** d for d in range(max_depth + 1)])
         print(f"  📊 예상 노드 수: 약 {estimated_nodes}개")
 
-        # LangGraph 워크플로우 구성
-        workflow = StateGraph(StoryGenerationState)
-        workflow.add_node("generate_node", self._node_generator)
-        workflow.add_edge(START, "generate_node")
-        workflow.add_conditional_edges("generate_node", self._plan_next_step)
-
-        app = workflow.compile()
+        # 노드마다 반복되던 캐릭터/게이지/엔딩 포맷팅을 트리당 1회로 줄임 (호출자의 context는 변경하지 않음)
+        context = {
+            **context,
+            "_static_sys": self._build_static_context(context),
+            "_next_node_id": _node_id_factory(),
+            "_on_node_text": on_node_text,
+            "_batch_runner": batch_runner,
+        }
 
         # 초기 게이지 상태 설정 (AI가 제안한 initial_value 사용, 없으면 50)
         initial_gauges = {}
@@ -616,17 +1290,21 @@ class InteractiveStoryDirector:
             gauge_id = gauge.get("id", gauge.get("name", "unknown"))
             initial_gauges[gauge_id] = gauge.get("initial_value", 50)
 
-        # 초기 상태 주입
-        initial_state: StoryGenerationState = {
-            "nodes": [],
-            "context": context,
-            "max_depth": max_depth,
-            "current_gauges": initial_gauges
-        }
-
         try:
-            final_state = await app.ainvoke(initial_state)
-            nodes = final_state.get("nodes", [])
+            # 루트 노드 생성 후, 한 깊이의 자식 노드 전체를 한 번에 gather (게이트웨이가 같은 깊이 요청을 함께 스케줄링)
+            root = await self._node_generator({
+                "context": context,
+                "max_depth": max_depth,
+                "current_gauges": initial_gauges
+            })
+            nodes = [root["node"]]
+            level = [root]
+            while True:
+                tasks = self._plan_children(level, context, max_depth)
+                if not tasks:
+                    break
+                level = await asyncio.gather(*(self._node_generator(task) for task in tasks))
+                nodes.extend(result["node"] for result in level)
 
             print(f"✅ 트리 생성 완료! 총 {len(nodes)}개 노드 생성됨")
 
@@ -639,27 +1317,84 @@ class InteractiveStoryDirector:
             print(f"❌ 트리 생성 중 오류 발생: {e}")
             raise
 
+    async def precompute_tree_batch(
+        self,
+        context: Dict,
+        max_depth: int = 3,
+        poll_interval: float = 30.0
+    ) -> List[StoryNode]:
+        """
+        OpenAI Batch API로 스토리 트리를 미리 생성합니다 (오프라인 사전 생성/미리보기용).
+
+        자식 노드는 부모 본문이 있어야 만들 수 있으므로 깊이마다 배치 작업 1개를 제출하고 완료를 기다립니다.
+        생성된 노드는 노드 캐시(enable_cache=True)에 저장되므로, 이후 같은 컨텍스트로 generate_full_tree를
+        호출하면 LLM 호출 없이 캐시에서 복원됩니다.
+
+        Args:
+            context: generate_full_tree와 동일한 컨텍스트
+            max_depth: 트리의 최대 깊이
+            poll_interval: 배치 상태 확인 간격 (초)
+
+        Returns:
+            생성된 모든 StoryNode 리스트
+        """
+        if self.cache is None:
+            print("  ⚠️ 캐시 비활성화 상태 - 사전 생성 결과가 이후 호출에서 재사용되지 않습니다 (enable_cache=True 권장)")
+
+        runner = OpenAIBatchRunner(self.llm_flex.openai_api_key.get_secret_value(), poll_interval=poll_interval)
+        nodes = await self.generate_full_tree(context, max_depth=max_depth, batch_runner=runner)
+        print(f"  📦 배치 사전 생성 완료: {len(nodes)}개 노드, 배치 작업 {runner.batches_submitted}개")
+        return nodes
+
+    def _node_cache_key(
+        self,
+        static_sys: str,
+        parent: Optional[Dict],
+        choice_taken: Optional[StoryChoice],
+        current_gauges: Dict[str, int],
+        depth: int,
+        max_depth: int,
+        node_type: str,
+        model: str = ""
+    ) -> Optional[str]:
+        """노드 구조 기반 캐시 키 (캐시 비활성화 시 None)
+
+        프롬프트 전문 대신 노드를 결정하는 요소만으로 키를 만들어, 같은 (부모, 선택지) 분기는
+        재실행/재생성 시 프롬프트 문구가 바뀌어도 LLM 호출 없이 복원됩니다.
+        """
+        if self.cache is None:
+            return None
+
+        return make_cache_key(
+            [
+                ("context", static_sys),
+                ("parent", parent.get("text", "") if parent else ""),
+                ("choice", choice_taken.get("text", "") if choice_taken else ""),
+                ("gauges", _json_dumps(sorted(current_gauges.items()))),
+                ("position", f"{depth}/{max_depth}/{node_type}"),
+            ],
+            model or getattr(self.llm, "model_name", ""),
+            getattr(self.llm, "temperature", None),
+            namespace="story-node"
+        )
+
     def _print_tree_summary(self, nodes: List[StoryNode]):
         """생성된 트리 구조 요약 출력"""
         if not nodes:
             return
 
-        depth_counts = {}
-        for node in nodes:
-            depth = node.get("depth", 0)
-            depth_counts[depth] = depth_counts.get(depth, 0) + 1
+        depth_counts = Counter(node.get("depth", 0) for node in nodes)
 
         print("\n📈 트리 구조 요약:")
-        for depth in sorted(depth_counts.keys()):
-            count = depth_counts[depth]
+        for depth, count in sorted(depth_counts.items()):
             indent = "  " * depth
             print(f"  {indent}깊이 {depth}: {count}개 노드")
 
-    # --- LangGraph 내부 로직 (Worker) ---
-    async def _node_generator(self, state: Dict):
-        """실제 LLM을 호출하여 스토리 노드를 생성하는 워커"""
+    # --- 트리 생성 내부 로직 (Worker) ---
+    async def _node_generator(self, state: Dict) -> Dict[str, Any]:
+        """실제 LLM을 호출하여 스토리 노드를 생성하는 워커 (반환: {"node": 생성된 노드, "current_gauges": 노드 시점 게이지})"""
 
-        # Send로 전달된 task 정보 또는 초기 상태에서 추출
+        # _plan_children이 만든 task 정보 또는 초기 상태에서 추출
         if "task" in state:
             task = state["task"]
             depth = task["depth"]
@@ -673,6 +1408,9 @@ class InteractiveStoryDirector:
             choice_taken = None
             context = state["context"]
 
+        # 트리 단위 노드 ID 생성기 (generate_full_tree를 거치지 않은 호출이면 새로 생성)
+        next_node_id = context.get("_next_node_id") or _node_id_factory()
+
         # 노드 타입 결정 (AI가 선택지 개수는 자동 판단)
         max_depth = state.get("max_depth", 5)
         if depth == max_depth:
@@ -684,15 +1422,6 @@ class InteractiveStoryDirector:
         else:
             node_type = "development"
 
-        # 캐릭터 정보 포맷팅
-        characters_info = self._format_characters(context.get("characters", []))
-
-        # 게이지 정보 포맷팅
-        gauges_info = self._format_gauges(context.get("gauges", []))
-
-        # 엔딩 정보 포맷팅
-        endings_info = self._format_endings(context.get("endings", []))
-
         # 이전 스토리 컨텍스트 구성
         previous_context = ""
         if parent:
@@ -701,155 +1430,94 @@ class InteractiveStoryDirector:
         # 현재 게이지 상태 계산
         current_gauges = self._calculate_current_gauges(state, choice_taken)
 
-        system_prompt = f"""당신은 인터랙티브 소설 작가입니다. 주어진 컨텍스트를 바탕으로 스토리 노드를 생성합니다.
-
-[소설 배경]
-{context.get('novel_summary', '정보 없음')}
-
-[등장인물]
-{characters_info}
-
-[게이지 시스템]
-{gauges_info}
-
-[현재 게이지 상태]
-{json.dumps(current_gauges, ensure_ascii=False)}
-
-[가능한 엔딩들]
-{endings_info}
+        # system 메시지는 모든 호출에 공통인 작성 규칙 + 에피소드 내내 변하지 않는 블록(배경/인물/게이지/엔딩)만 담아
+        # 트리 전체에서 바이트 단위로 동일하게 유지 → OpenAI 자동 프롬프트 캐싱이 노드 간 공통 prefix를 재사용
+        # 노드마다 달라지는 게이지/위치/이전 스토리는 모두 user 메시지로 보냄
+        static_sys = context.get("_static_sys") or self._build_static_context(context)
+        system_prompt = static_sys
+        user_prompt = f"""[현재 게이지 상태]
+{_json_dumps(current_gauges)}
 
 [현재 노드 정보]
 - 깊이: {depth}/{max_depth}
 - 노드 타입: {node_type}
 - 선택지 개수: 상황에 맞게 2~4개 중 자동 결정
+{previous_context}
 
-{previous_context}"""
-
-        user_prompt = f"""위 컨텍스트를 바탕으로 다음 스토리 노드를 생성하세요.
-
-[작성 요구사항]
-1. **스토리 본문** (1200-2000자) - 독자가 완전히 몰입할 수 있도록 작성:
-
-   🎬 **영화적 장면 묘사** (필수):
-   - 시각적 디테일: 캐릭터의 표정, 몸짓, 주변 환경의 색감과 빛
-   - 청각적 요소: 대화 톤, 배경 소리, 침묵의 무게감
-   - 촉각/후각: 긴장감이 느껴지는 분위기, 공간의 온도감
-
-   💭 **내적 독백** (필수):
-   - 주요 캐릭터의 진짜 생각과 감정을 깊이 있게 표현
-   - 표면적으로 보이는 것과 내면의 갈등 대조
-   - 과거 기억이나 두려움이 현재에 미치는 영향
-
-   🗣️ **생생한 대화** (최소 2-3회 교환):
-   - 캐릭터 성격이 드러나는 자연스러운 대화
-   - 대화 중 표정, 몸짓, 말투 변화 묘사
-   - 말하지 않은 것(침묵, 망설임)도 의미 있게 표현
-
-   ⏱️ **시간의 흐름과 템포**:
-   - 긴박한 순간은 짧고 강렬하게
-   - 중요한 감정 순간은 느리고 섬세하게
-
-   예시 스타일:
-   "랠프는 손에 쥔 소라껍데기를 내려다봤다. 햇빛에 반짝이는 표면이 마치 희망의 상징처럼 느껴졌다.
-   하지만 가슴 깊은 곳에서는 불안이 꿈틀거렸다. '정말 우리를 구하러 올까?'
-
-   '봉화를 피워야 해.' 랠프가 말했다. 목소리는 의도적으로 단호하게 만들었지만,
-   손은 미세하게 떨리고 있었다. 다른 아이들이 알아챌까 봐 재빨리 주먹을 쥐었다.
-
-   잭이 비웃음을 흘렸다. '구조?' 그가 날카롭게 웃으며 고개를 저었다. '그게 중요한 게 아니야.
-   지금 당장 먹을 고기가 필요하다고!' 그의 눈에는 야성적인 흥분이 타오르고 있었다.
-   사냥의 쾌감이 이성을 집어삼키기 시작한 것 같았다.
-
-   두 소년 사이의 공기가 팽팽하게 긴장했다. 다른 아이들은 숨을 죽이고 지켜봤다..."
-
-2. **디테일 정보**:
-   - npc_emotions: 현재 등장하는 NPC들의 감정 상태 (예: {{'랠프': '불안', '잭': '흥분'}})
-   - situation: 현재 상황 한 줄 요약
-   - relations_update: 이번 장면으로 인한 인물 관계 변화 (예: {{'랠프-잭': '적대감 상승'}})
-
-3. **선택지** (2~4개, 상황에 맞게 판단):
-   - 선택지 개수는 현재 상황의 복잡도와 중요도에 따라 2~4개 중 적절히 결정하세요
-     - 단순한 상황, 긴박한 순간: 2개
-     - 일반적인 상황: 3개
-     - 중요한 분기점, 다양한 접근이 가능한 상황: 4개
-   - 선택지 텍스트는 플레이어 관점에서 1인칭으로 작성하되, 선택의 감정적 무게감을 표현
-   - 선택의 단기적 결과를 암시하는 묘사 포함 (예: "하지만 그의 눈빛에서 위협을 느낀다")
-   - 각 선택지에 특성 태그 포함 (1~2개씩)
-   - 사용 가능한 태그: cooperative, aggressive, cautious, trusting, doubtful, brave, fearful, rational, emotional
-
-   🎭 **즉각 반응 (immediate_reaction)** - ⚠️ 모든 선택지마다 MANDATORY 필수 작성 (100-200자):
-   - 플레이어가 이 선택을 했을 때 **즉시** 벌어지는 일
-   - 캐릭터들의 첫 반응 (표정, 몸짓, 짧은 말)
-   - 분위기의 변화 (긴장감 상승/하강, 온도감 변화)
-   - 플레이어의 내적 감정 (후회, 확신, 불안 등)
-   - 다음 장면으로 넘어가기 전 짧은 "숨고르기" 제공
-
-   ⚠️ CRITICAL: immediate_reaction이 없거나 비어있으면 절대 안 됩니다! 반드시 각 선택지마다 100자 이상으로 작성하세요!
-
-   예시 1 (협력적 선택):
-   "당신이 손을 내밀자 그의 경계심이 조금 풀리는 것이 보였다. '믿어도 되는 걸까?' 그가 낮게 중얼거렸다.
-   주변 사람들의 시선이 당신에게 집중되었고, 공기 중의 긴장감이 미묘하게 완화되는 느낌이 들었다."
-
-   예시 2 (공격적 선택):
-   "당신의 날카로운 말에 그의 표정이 굳어졌다. 주먹을 불끈 쥔 그가 한 발짝 다가섰다.
-   주변 공기가 얼어붙었고, 당신은 이 선택이 돌이킬 수 없는 갈등을 불러올 수 있다는 것을 직감했다."
-
-{"⚠️ 이것은 에피소드 엔딩으로 연결되는 노드입니다. 스토리를 적절히 마무리하고 선택지는 빈 배열로 두세요." if node_type == "ending" else ""}
-
-⚠️ CRITICAL: 모든 선택지에 immediate_reaction을 100-200자로 반드시 포함하세요!
-
-반드시 아래 JSON 형식으로만 응답하세요:
-{{
-    "text": "스토리 본문 (1200-2000자)...",
-    "details": {{
-        "npc_emotions": {{"캐릭터명": "감정"}},
-        "situation": "상황 요약",
-        "relations_update": {{ "관계": "변화 내용" }}
-    }},
-    "choices": [
-        {{
-            "text": "그에게 손을 내밀며 협력을 제안한다",
-            "tags": ["cooperative", "trusting"],
-            "immediate_reaction": "당신이 손을 내밀자 그의 눈빛이 잠시 흔들렸다. '정말... 믿어도 되는 건가?' 그가 조심스럽게 당신의 손을 바라보았다. 주변 사람들의 숨소리가 멈춘 듯 고요했고, 공기 중의 긴장감이 미묘하게 풀리는 것을 느낄 수 있었다."
-        }},
-        {{
-            "text": "그의 약점을 지적하며 압박한다",
-            "tags": ["aggressive", "rational"],
-            "immediate_reaction": "당신의 날카로운 지적에 그의 얼굴이 창백해졌다. 주먹을 불끈 쥔 그가 이를 악물었다. '이 자식이...' 그가 낮게 중얼거렸고, 주변 공기가 한순간 얼어붙었다. 당신은 돌이킬 수 없는 선을 넘었다는 것을 직감했다."
-        }},
-        {{
-            "text": "세 번째 선택지 예시",
-            "tags": ["cautious", "emotional"],
-            "immediate_reaction": "⚠️ 모든 선택지에 immediate_reaction 필드가 반드시 있어야 합니다! 절대 빠뜨리지 마세요!"
-        }}
-    ]
-}}
-
-⚠️⚠️⚠️ 중요: 위 JSON의 모든 choice 객체에 immediate_reaction 필드가 있는 것을 확인하세요!
-선택지가 2개든 3개든 4개든, 모든 선택지마다 immediate_reaction을 반드시 작성하세요!
-
-⚠️ 다시 한번 강조: immediate_reaction 필드를 절대 빠뜨리지 마세요! 각 선택마다 100자 이상 필수입니다!"""
+{_NODE_USER_PROMPT_ENDING if node_type == "ending" else _NODE_USER_PROMPT}"""
 
         try:
             # Structured Output 모드로 LLM 호출 (JSON Schema 강제)
             print("  🔧 Structured Output 모드로 노드 생성 중...")
-            structured_response = await self.structured_llm.ainvoke([
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=user_prompt)
-            ])
+            # 같은 깊이의 노드들은 asyncio.gather로 병렬 실행되므로 세마포어로 동시 호출 수 제한
+            if node_type in _DEEP_NODE_TYPES:
+                node_llm, structured_llm = self.llm_deep, self.structured_llm_deep
+            elif node_type in _CRITICAL_NODE_TYPES:
+                node_llm, structured_llm = self.llm_flex, self.structured_llm
+            else:
+                node_llm, structured_llm = self.llm_fast, self.structured_llm_fast
+
+            # 캐시 활성화 시 (부모 본문, 선택지, 게이지, 위치) 구조 키로 이전 생성 결과 재사용
+            node_key = self._node_cache_key(
+                static_sys, parent, choice_taken, current_gauges, depth, max_depth, node_type,
+                model=getattr(node_llm, "model_name", "")
+            )
+            cached = self.cache.get(node_key) if node_key else None
+
+            # 정확히 같은 분기가 없으면 의미적으로 비슷한 분기의 노드 재사용 시도
+            semantic_vector = None
+            semantic_partition = None
+            near_match = None
+            if cached is None and self.semantic_cache is not None and parent:
+                semantic_partition = make_cache_key(static_sys, namespace=f"semantic:{depth}/{max_depth}/{node_type}")
+                try:
+                    semantic_vector = await self.semantic_cache.embed(SemanticNodeCache.make_text(
+                        parent.get("text", ""),
+                        choice_taken.get("text", "") if choice_taken else "",
+                        current_gauges
+                    ))
+                    cached, near_match = self.semantic_cache.lookup(
+                        semantic_partition, semantic_vector, self.semantic_repair_threshold
+                    )
+                    if cached is not None:
+                        print("  🧭 유사 분기 캐시 적중")
+                except Exception as e:
+                    print(f"  ⚠️ 임베딩 생성 실패, 유사도 캐시 생략: {e}")
+                    semantic_vector = None
+
+            # 노드 ID 생성 (스트리밍 콜백이 어느 노드의 본문인지 구분할 수 있도록 호출 전에 생성)
+            node_id = next_node_id()
+            on_node_text = context.get("_on_node_text")
+
+            if cached is not None:
+                # 저장 시점에 이미 스키마 검증을 통과한 dict이므로 재검증 없이 사용 (노드끼리 공유되지 않도록 복사)
+                print("  ♻️ 노드 캐시 적중 - LLM 호출 생략")
+                parsed = copy.deepcopy(cached)
+                if on_node_text:
+                    await on_node_text(node_id, parsed.get("text", ""))
+            else:
+                parsed = None
+                if near_match is not None:
+                    # 조금 다른 분기: 캐시된 본문을 재사용하고 즉각 반응만 다시 작성 (실패 시 전체 생성)
+                    parsed = await self._rewrite_reactions(near_match, choice_taken, current_gauges)
+                    if parsed is not None and on_node_text:
+                        await on_node_text(node_id, parsed["text"])
+                if parsed is None:
+                    messages = [
+                        SystemMessage(content=system_prompt),
+                        HumanMessage(content=user_prompt)
+                    ]
+                    parsed = await self._generate_node_response(node_llm, structured_llm, messages, node_id, context)
+                if node_key:
+                    self.cache.set(node_key, copy.deepcopy(parsed))
+                if semantic_vector is not None:
+                    self.semantic_cache.add(semantic_partition, semantic_vector, copy.deepcopy(parsed))
 
-            # Pydantic 모델이 자동으로 검증하므로 immediate_reaction이 보장됨
             print(f"🔍 DEBUG - Structured Output 응답:")
-            print(f"  선택지 개수: {len(structured_response.choices)}")
-            for idx, choice in enumerate(structured_response.choices):
-                print(f"  Choice {idx+1}: immediate_reaction 길이 = {len(choice.immediate_reaction)}자")
-                print(f"    내용: {choice.immediate_reaction[:100]}...")
-
-            # Pydantic 모델을 dict로 변환
-            parsed = structured_response.model_dump()
-
-            # 노드 ID 생성
-            node_id = str(uuid.uuid4())[:8]
+            print(f"  선택지 개수: {len(parsed['choices'])}")
+            for idx, choice in enumerate(parsed["choices"]):
+                print(f"  Choice {idx+1}: immediate_reaction 길이 = {len(choice['immediate_reaction'])}자")
+                print(f"    내용: {choice['immediate_reaction'][:100]}...")
 
             # 노드 구성
             new_node: StoryNode = {
@@ -869,13 +1537,13 @@ class InteractiveStoryDirector:
 
             print(f"  ✅ 노드 생성 완료: depth={depth}, id={node_id}, choices={len(new_node['choices'])}")
 
-            return {"nodes": [new_node], "current_gauges": current_gauges}
+            return {"node": new_node, "current_gauges": current_gauges}
 
         except Exception as e:
             print(f"  ❌ 노드 생성 실패 (depth={depth}): {e}")
             # 폴백 노드 생성
             fallback_node: StoryNode = {
-                "id": str(uuid.uuid4())[:8],
+                "id": next_node_id(),
                 "depth": depth,
                 "text": f"[오류로 인해 스토리를 생성할 수 없습니다: {str(e)}]",
                 "details": {
@@ -888,27 +1556,170 @@ class InteractiveStoryDirector:
                 "node_type": "error",
                 "episode_id": context.get("episode_id", "unknown")
             }
-            return {"nodes": [fallback_node], "current_gauges": current_gauges}
+            return {"node": fallback_node, "current_gauges": current_gauges}
+
+    async def _generate_node_response(
+        self,
+        node_llm: ChatOpenAI,
+        structured_llm: Any,
+        messages: List[Any],
+        node_id: str,
+        context: Dict
+    ) -> ParsedNode:
+        """노드 LLM 호출 (배치 수집기 / 스트리밍 콜백 / 일반 Structured Output 중 하나)"""
+        # 같은 에피소드의 노드 요청을 같은 캐시 키로 묶어 prefix 캐시 적중률을 높임
+        prompt_cache_key = f"story-node:{context.get('episode_id', 'unknown')}"
+        batch_runner = context.get("_batch_runner")
+        on_node_text = context.get("_on_node_text")
+        if batch_runner:
+            # 같은 깊이의 요청이 한 배치로 모여야 하므로 세마포어 없이 제출 (동시 호출 제한은 Batch API 쪽에서 처리)
+            structured_response = await batch_runner.parse(
+                messages, StoryNodeSchema,
+                model=getattr(node_llm, "model_name", ""),
+                temperature=getattr(node_llm, "temperature", None)
+            )
+            return _node_schema_to_dict(structured_response)
+
+        async with self._llm_semaphore:
+            if on_node_text:
+                return await self._stream_node(node_llm, messages, node_id, on_node_text, prompt_cache_key=prompt_cache_key)
+            structured_response = _structured_result(
+                await self.gateway.invoke(structured_llm, messages, prompt_cache_key=prompt_cache_key)
+            )
+        # Pydantic 모델을 dict로 변환 (모델이 자동으로 검증하므로 immediate_reaction이 보장됨)
+        return _node_schema_to_dict(structured_response)
+
+    async def _rewrite_reactions(
+        self,
+        near_node: ParsedNode,
+        choice_taken: Optional[StoryChoice],
+        current_gauges: Dict[str, int]
+    ) -> Optional[ParsedNode]:
+        """
+        유사 분기 노드의 본문/선택지를 그대로 두고 선택지별 즉각 반응만 현재 상황에 맞게 다시 작성
+
+        전체 노드 생성 대비 출력이 선택지 수 × 100-200자로 작아 토큰/지연이 크게 줄어듭니다.
+        반응 개수나 길이가 맞지 않으면 None을 반환하여 호출부가 전체 생성으로 넘어가도록 합니다.
+        """
+        choices = near_node.get("choices", [])
+        if not choices:
+            return None
+
+        choices_info = "\n".join(
+            f"{idx}. {c.get('text', '')}\n   (기존 반응) {c.get('immediate_reaction', '')}"
+            for idx, c in enumerate(choices, 1)
+        )
+        prompt = f"""아래는 인터랙티브 소설의 한 장면과 선택지입니다. 장면 본문과 선택지 문구는 그대로 두고,
+현재 게이지 상태와 직전 선택에 맞게 각 선택지의 즉각 반응(immediate_reaction)만 다시 작성하세요.
+
+[현재 게이지 상태]
+{_json_dumps(current_gauges)}
+
+[직전 플레이어의 선택]
+{choice_taken.get('text', '') if choice_taken else '(시작)'}
+
+[장면 본문]
+{near_node.get('text', '')}
+
+[선택지]
+{choices_info}
+
+선택지 순서대로 {len(choices)}개의 즉각 반응(각 100-200자)을 reactions에 작성하세요."""
+
+        try:
+            rewritten = await self._cached_structured_dump(prompt, schema=ReactionRewriteSchema)
+        except Exception as e:
+            print(f"  ⚠️ 즉각 반응 재작성 실패, 전체 생성으로 전환: {e}")
+            return None
+
+        reactions = rewritten.get("reactions", [])
+        if len(reactions) != len(choices) or any(len(r) < _MIN_IMMEDIATE_REACTION for r in reactions):
+            return None
+
+        parsed = copy.deepcopy(near_node)
+        for choice, reaction in zip(parsed["choices"], reactions):
+            choice["immediate_reaction"] = reaction
+        print("  🩹 유사 분기 노드 재사용 (즉각 반응만 재작성)")
+        return parsed
+
+    async def _stream_node(
+        self,
+        node_llm: ChatOpenAI,
+        messages: List[Any],
+        node_id: str,
+        on_node_text: Callable[[str, str], Awaitable[None]],
+        **kwargs
+    ) -> ParsedNode:
+        """
+        노드 JSON을 스트리밍으로 받으면서 text 필드를 도착하는 대로 콜백에 전달
+
+        같은 JSON Schema(strict)를 response_format으로 지정하므로 출력 형식은 Structured Output 호출과 같고,
+        스트림이 끝나면 전체 응답을 StoryNodeSchema로 검증합니다.
+        """
+        reader = _JsonStringFieldReader("text")
+        parts = []
+        async for chunk in self.gateway.stream(node_llm, messages, response_format=StoryNodeSchema, **kwargs):
+            content = chunk.content
+            if not isinstance(content, str) or not content:
+                continue
+            parts.append(content)
+            delta = reader.feed(content)
+            if delta:
+                await on_node_text(node_id, delta)
+        return _node_schema_to_dict(StoryNodeSchema.model_validate_json("".join(parts)))
+
+    def _build_static_context(self, context: Dict) -> str:
+        """노드 생성 시스템 프롬프트 중 에피소드 내에서 변하지 않는 앞부분(고정 규칙 + 에피소드 컨텍스트, 캐시 가능한 prefix) 구성"""
+        return f"""{_NODE_SYSTEM_RULES}
+
+[소설 배경]
+{context.get('novel_summary', '정보 없음')}
+
+[등장인물]
+{self._format_characters(context.get("characters", []))}
+
+[게이지 시스템]
+{self._format_gauges(context.get("gauges", []))}
+
+[가능한 엔딩들]
+{self._format_endings(context.get("endings", []))}"""
+
+    def _clean_description(self, description: str) -> str:
+        """[cite: ...] 표시 제거 후 300자로 자름"""
+        clean_desc = _CITE_RE.sub('', description).strip()
+        if len(clean_desc) > 300:
+            clean_desc = clean_desc[:300] + "..."
+        return clean_desc
+
+    def _clean_relationships(self, char: Character) -> str:
+        """주요 관계 3개를 [cite: ...] 표시 제거 후 연결"""
+        return '; '.join(_CITE_RE.sub('', r).strip() for r in char.get('relationships', [])[:3])
 
     def _format_characters(self, characters: List[Character]) -> str:
         """캐릭터 정보를 프롬프트용 문자열로 포맷팅"""
         if not characters:
             return "등록된 캐릭터 없음"
 
+        if self.compact_prompt:
+            # 한 줄 한 캐릭터 (첫 줄은 컬럼 헤더) - 불릿/라벨 반복 토큰 절감
+            result = ["이름|별명|설명|관계"]
+            for char in characters:
+                result.append("|".join([
+                    char.get('name', '이름없음'),
+                    ', '.join(char.get('aliases', [])),
+                    self._clean_description(char.get('description', '정보 없음')).replace('\n', ' '),
+                    self._clean_relationships(char),
+                ]))
+            return "\n".join(result)
+
         result = []
         for char in characters:
             # cite 태그 제거하여 프롬프트에 사용 (간결하게)
-            description = char.get('description', '정보 없음')
-            # [cite: ...] 패턴 제거
-            import re
-            clean_desc = re.sub(r'\\\[cite:.*?\\\\]', '', description).strip()
-            # 너무 길면 줄임
-            if len(clean_desc) > 300:
-                clean_desc = clean_desc[:300] + "..."
+            clean_desc = self._clean_description(char.get('description', '정보 없음'))
 
             char_info = f"""• {char.get('name', '이름없음')} (별명: {', '.join(char.get('aliases', []))})
   - 설명: {clean_desc}
-  - 관계: {'; '.join(char.get('relationships', [])[:3])}"""
+  - 관계: {self._clean_relationships(char)}"""
             result.append(char_info)
 
         return "\n".join(result)
@@ -918,6 +1729,15 @@ class InteractiveStoryDirector:
         if not gauges:
             return "등록된 게이지 없음"
 
+        if self.compact_prompt:
+            result = ["이름|id|0↔100|의미"]
+            for g in gauges:
+                result.append(
+                    f"{g.get('name', '이름없음')}|{g.get('id', 'unknown')}|"
+                    f"{g.get('min_label', '최소')}↔{g.get('max_label', '최대')}|{g.get('meaning', '불명')}"
+                )
+            return "\n".join(result)
+
         result = []
         for g in gauges:
             gauge_info = f"""• {g.get('name', '이름없음')} (id: {g.get('id', 'unknown')})
@@ -932,6 +1752,12 @@ class InteractiveStoryDirector:
         if not endings:
             return "등록된 엔딩 없음"
 
+        if self.compact_prompt:
+            result = ["타입|제목|조건"]
+            for e in endings:
+                result.append(f"{e.get('type', 'unknown')}|{e.get('title', '제목없음')}|{e.get('condition', '불명')}")
+            return "\n".join(result)
+
         result = []
         for e in endings:
             ending_info = f"""• [{e.get('type', 'unknown')}] {e.get('title', '제목없음')}
@@ -960,70 +1786,49 @@ class InteractiveStoryDirector:
 
         return current
 
-    # --- LangGraph 내부 로직 (Manager) ---
-    def _plan_next_step(self, state):
+    # --- 트리 생성 내부 로직 (Manager) ---
+    def _plan_children(self, level: List[Dict[str, Any]], context: Dict, max_depth: int) -> List[Dict[str, Any]]:
         """
-        Map-Reduce 패턴을 사용한 트리 분기 로직
+        한 깊이의 생성 결과 → 다음 깊이의 자식 노드 생성 태스크 목록 (빈 리스트면 트리 완성)
 
         - 각 노드의 선택지마다 새로운 자식 노드를 생성
-        - 최대 깊이에 도달하면 종료
+        - 최대 깊이(엔딩 노드)에 도달하면 종료
         - 선택지가 없는 노드(엔딩)는 더 이상 분기하지 않음
         """
-        nodes = state.get("nodes", [])
-        max_depth = state.get("max_depth", 5)
-        context = state.get("context", {})
-        current_gauges = state.get("current_gauges", {})
-
-        # 아직 노드가 없으면 루트 노드 생성을 위해 초기 상태 반환
-        if not nodes:
-            return [Send("generate_node", {
-                "context": context,
-                "max_depth": max_depth,
-                "current_gauges": current_gauges
-            })]
-
-        # 가장 최근에 생성된 노드들 찾기 (같은 깊이의 노드들)
-        # LangGraph의 Map-Reduce에서는 병렬로 생성된 노드들이 한 번에 추가됨
-        if len(nodes) == 1:
-            latest_nodes = nodes
-        else:
-            # 가장 깊은 depth의 노드들을 찾음
-            max_current_depth = max(n["depth"] for n in nodes)
-            latest_nodes = [n for n in nodes if n["depth"] == max_current_depth]
-
-        # 최대 깊이 체크
-        if latest_nodes and latest_nodes[0]["depth"] > max_depth:
+        if level and level[0]["node"]["depth"] >= max_depth:
             print(f"🏁 최대 깊이 {max_depth} 도달. 트리 생성 완료.")
-            return END
+            return []
 
-        # 각 최신 노드의 선택지에 대해 자식 노드 생성 태스크 생성
+        # 각 노드의 선택지에 대해 자식 노드 생성 태스크 생성
         tasks = []
-        for node in latest_nodes:
+        for result in level:
+            node = result["node"]
             choices = node.get("choices", [])
 
             if not choices:
                 # 선택지가 없는 노드 (엔딩 또는 에러)는 스킵
                 continue
 
+            # 부모 노드 시점의 게이지를 기준으로 자식 게이지 계산
+            state = {"context": context, "current_gauges": result["current_gauges"]}
+
             for choice_idx, choice in enumerate(choices):
                 # 이 선택지를 선택했을 때의 자식 노드 생성 태스크
-                task = {
+                tasks.append({
                     "task": {
                         "depth": node["depth"] + 1,
                         "parent_node": node,
                         "choice_taken": choice,
                         "choice_index": choice_idx
                     },
-                    "context": context,
-                    "max_depth": max_depth,
-                    "current_gauges": current_gauges
-                }
-                tasks.append(Send("generate_node", task))
+                    **state,
+                    "max_depth": max_depth
+                })
                 print(f"  📝 태스크 예약: depth={node['depth']+1}, parent={node['id']}, choice={choice_idx}")
 
         if not tasks:
             print("🏁 더 이상 생성할 노드가 없습니다. 트리 생성 완료.")
-            return END
+            return []
 
         print(f"🔀 {len(tasks)}개의 분기 노드 생성 시작...")
         return tasks
@@ -1031,8 +1836,14 @@ class InteractiveStoryDirector:
     # 유틸리티
     def _parse_json(self, content: str) -> Dict:
         """LLM 응답에서 JSON을 안전하게 파싱"""
+        # JSON 모드 응답은 본문 전체가 JSON 객체이므로 orjson으로 바로 파싱
+        try:
+            return _json_loads(content)
+        except ValueError:
+            pass
+
         try:
-            # 먼저 LangChain 파서 시도
+            # 코드 블록/부분 JSON은 LangChain 파서로 시도
             return self.json_parser.parse(content)
         except Exception:
             pass
@@ -1040,19 +1851,18 @@ class InteractiveStoryDirector:
         # 직접 JSON 추출 시도
         try:
             # ```json ... ``` 블록 추출
-            json_match = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```', content)
+            json_match = _CODE_BLOCK_RE.search(content)
             if json_match:
                 json_str = json_match.group(1).strip()
-                return json.loads(json_str)
+                return _json_loads(json_str)
 
-            # { } 블록 직접 추출 (가장 큰 JSON 객체 찾기)
-            json_match = re.search(r'\{[\s\S]*\}', content)
-            if json_match:
-                json_str = json_match.group(0).strip()
-                return json.loads(json_str)
+            # { } 블록 직접 추출 (중괄호 짝 맞추기)
+            json_str = _extract_json_object(content)
+            if json_str:
+                return _json_loads(json_str)
 
             # 직접 파싱 시도
-            return json.loads(content.strip())
+            return _json_loads(content.strip())
 
         except json.JSONDecodeError as e:
             print(f"  ⚠️ JSON 파싱 실패: {e}")
@@ -1066,21 +1876,20 @@ class InteractiveStoryDirector:
                 fixed_content = content
 
                 # 1. 후행 쉼표 제거 (객체, 배열 모두)
-                fixed_content = re.sub(r',(\s*[}\]])', r'\1', fixed_content)
+                fixed_content = _TRAILING_COMMA_RE.sub(r'\1', fixed_content)
 
                 # 2. 여러 쉼표 연속을 하나로
-                fixed_content = re.sub(r',\s*,+', ',', fixed_content)
+                fixed_content = _REPEATED_COMMA_RE.sub(',', fixed_content)
 
                 # 3. 줄바꿈/공백이 있는 후행 쉼표도 제거
-                fixed_content = re.sub(r',\s*\n\s*}', '}', fixed_content)
-                fixed_content = re.sub(r',\s*\n\s*]', ']', fixed_content)
+                fixed_content = _TRAILING_COMMA_OBJ_RE.sub('}', fixed_content)
+                fixed_content = _TRAILING_COMMA_ARR_RE.sub(']', fixed_content)
 
                 # 4. JSON 블록 추출
-                json_match = re.search(r'\{[\s\S]*\}', fixed_content)
-                if json_match:
-                    cleaned = json_match.group(0)
+                cleaned = _extract_json_object(fixed_content)
+                if cleaned:
                     print(f"  ✅ 수정된 JSON 길이: {len(cleaned)} chars")
-                    result = json.loads(cleaned)
+                    result = _json_loads(cleaned)
                     print(f"  ✅ JSON 파싱 성공! keys: {result.keys() if isinstance(result, dict) else 'N/A'}")
                     return result
             except Exception as fix_error:
@@ -1100,30 +1909,34 @@ class InteractiveStoryDirector:
 [소설 텍스트]
 {novel_text}
 """
-            response = await self.llm.ainvoke(prompt)
-            return response.content
+            response_text = await self._cached_invoke(prompt)
+            return response_text
 
         # 긴 텍스트는 청크로 나눠서 각각 요약
         print(f"  📚 긴 텍스트 감지 ({len(novel_text):,}자), 청크 분할 요약 시작...")
 
-        chunks = []
-        for i in range(0, len(novel_text), chunk_size):
-            chunks.append(novel_text[i:i + chunk_size])
+        # 청크 문자열을 미리 리스트로 만들지 않고 시작 오프셋만 넘김
+        # → 실제 슬라이스는 세마포어를 얻은 뒤 생성되므로 동시에 메모리에 올라가는 청크는 동시 요청 수만큼
+        num_chunks = (len(novel_text) + chunk_size - 1) // chunk_size
 
-        print(f"  📦 {len(chunks)}개 청크로 분할")
+        print(f"  📦 {num_chunks}개 청크로 분할")
 
-        # 각 청크 요약
-        chunk_summaries = []
-        for i, chunk in enumerate(chunks):
-            print(f"    [{i+1}/{len(chunks)}] 청크 요약 중...")
-            prompt = f"""다음은 소설의 {i+1}번째 부분입니다. 이 부분의 핵심 내용을 200자 내외로 요약해주세요.
+        # 각 청크 요약 (청크끼리는 독립적이므로 동시에 요청, 동시 호출 수는 세마포어로 제한)
+        async def summarize_chunk(i: int, offset: int) -> str:
+            async with self._llm_semaphore:
+                print(f"    [{i+1}/{num_chunks}] 청크 요약 중...")
+                prompt = f"""다음은 소설의 {i+1}번째 부분입니다. 이 부분의 핵심 내용을 200자 내외로 요약해주세요.
 주요 사건, 등장인물의 행동, 갈등을 포함하세요.
 
 [텍스트]
-{chunk}
+{novel_text[offset:offset + chunk_size]}
 """
-            response = await self.llm.ainvoke(prompt)
-            chunk_summaries.append(f"[파트 {i+1}] {response.content}")
+                response_text = await self._cached_invoke(prompt, llm=self.llm_flex)
+            return f"[파트 {i+1}] {response_text}"
+
+        chunk_summaries = await asyncio.gather(
+            *(summarize_chunk(i, offset) for i, offset in enumerate(range(0, len(novel_text), chunk_size)))
+        )
 
         # 청크 요약들을 통합하여 최종 요약
         print("  🔄 청크 요약 통합 중...")
@@ -1135,26 +1948,7 @@ class InteractiveStoryDirector:
 [부분별 요약]
 {combined_summaries}
 """
-        response = await self.llm.ainvoke(final_prompt)
+        response_text = await self._cached_invoke(final_prompt)
         print("  ✅ 통합 요약 완료")
 
-        return response.content
-
-
-# ==============================================================================
-# 3. LangGraph 상태 정의 (State Definition)
-# ==============================================================================
-
-def merge_gauges(current: Dict[str, int], new: Dict[str, int]) -> Dict[str, int]:
-    """게이지 상태 병합 (최신 값으로 업데이트)"""
-    if not new:
-        return current
-    result = current.copy() if current else {}
-    result.update(new)
-    return result
-
-class StoryGenerationState(TypedDict):
-    nodes: Annotated[List[StoryNode], operator.add]
-    context: Dict[str, Any]  # 캐릭터, 소설요약, 게이지, 엔딩, 가이드 등 모든 정보
-    max_depth: int
-    current_gauges: Annotated[Dict[str, int], merge_gauges]  # 현재 게이지 상태
+        return response_text
@@ -1,101 +1,103 @@
-from typing import Dict
+from typing import Dict, Optional
 import json
 
+try:
+    import orjson
+except ImportError:  # orjson 미설치 환경에서는 표준 json 사용
+    orjson = None
+
+
+def _format_gauge_changes(changes: Optional[Dict]) -> str:
+    """게이지 변화량 표시 (예: "hope: +10, trust:  -5" - 양수만 '+' 접두, 나머지는 공백 접두)"""
+    if not changes:
+        return ""
+    return ", ".join(f"{k}: +{v}" if v > 0 else f"{k}:  {v}" for k, v in changes.items())
+
 
 def export_to_markdown(result: Dict, output_path: str = "story_export.md") -> str:
     """스토리를 마크다운 형식으로 내보내기"""
-    lines = []
-
-    # 메타데이터
-    meta = result.get("metadata", {})
-    lines.append(f"# 인터랙티브 스토리")
-    lines.append(f"\n- 에피소드: {meta.get('total_episodes', 0)}개")
-    lines.append(f"- 노드: {meta.get('total_nodes', 0)}개")
-    lines.append(f"- 게이지: {', '.join(meta.get('gauges', []))}")
-    lines.append("")
-
-    # 최종 엔딩
-    context = result.get("context", {})
-    lines.append("## 최종 엔딩")
-    for ending in context.get("final_endings", []):
-        lines.append(f"\n### [{ending.get('type', '?')}] {ending.get('title', '?')}")
-        lines.append(f"- 조건: `{ending.get('condition', '?')}`")
-        lines.append(f"- {ending.get('summary', '')}")
-    lines.append("")
-
-    # 에피소드별
-    for episode in result.get("episodes", []):
-        lines.append(f"\n## 에피소드 {episode.get('order', '?')}: {episode.get('title', '?')}")
-        lines.append(f"\n**테마**: {episode.get('theme', '?')}")
-        lines.append(f"\n**설명**: {episode.get('description', '?')}")
-
-        # 도입부
-        if episode.get("intro_text"):
-            lines.append(f"\n### 도입부")
-            lines.append(f"\n{episode.get('intro_text', '')}")
-
-        # 엔딩
-        lines.append(f"\n### 에피소드 엔딩")
-        for ending in episode.get("endings", []):
-            changes = ending.get("gauge_changes", {})
-            change_str = ", ".join([f"{k}: {'+' if v > 0 else ' '}{v}" for k, v in changes.items()])
-            lines.append(f"\n#### {ending.get('title', '?')}")
-            lines.append(f"- 조건: `{ending.get('condition', '?')}`")
-            lines.append(f"- 게이지: {change_str}")
-            lines.append(f"- {ending.get('text', '')}")
-
-    content = "\n".join(lines)
-
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(content)
+    # 줄 목록을 모았다가 join하지 않고 파일에 바로 기록 (1MB 버퍼)
+    with open(output_path, "w", encoding="utf-8", buffering=1 << 20) as f:
+        # 메타데이터
+        meta = result.get("metadata", {})
+        print(f"# 인터랙티브 스토리", file=f)
+        print(f"\n- 에피소드: {meta.get('total_episodes', 0)}개", file=f)
+        print(f"- 노드: {meta.get('total_nodes', 0)}개", file=f)
+        print(f"- 게이지: {', '.join(meta.get('gauges', []))}", file=f)
+        print("", file=f)
+
+        # 최종 엔딩
+        context = result.get("context", {})
+        print("## 최종 엔딩", file=f)
+        for ending in context.get("final_endings", []):
+            print(f"\n### [{ending.get('type', '?')}] {ending.get('title', '?')}", file=f)
+            print(f"- 조건: `{ending.get('condition', '?')}`", file=f)
+            print(f"- {ending.get('summary', '')}", file=f)
+        print("", file=f)
+
+        # 에피소드별
+        for episode in result.get("episodes", []):
+            print(f"\n## 에피소드 {episode.get('order', '?')}: {episode.get('title', '?')}", file=f)
+            print(f"\n**테마**: {episode.get('theme', '?')}", file=f)
+            print(f"\n**설명**: {episode.get('description', '?')}", file=f)
+
+            # 도입부
+            if episode.get("intro_text"):
+                print(f"\n### 도입부", file=f)
+                print(f"\n{episode.get('intro_text', '')}", file=f)
+
+            # 엔딩
+            print(f"\n### 에피소드 엔딩", file=f)
+            for ending in episode.get("endings", []):
+                change_str = _format_gauge_changes(ending.get("gauge_changes"))
+                print(f"\n#### {ending.get('title', '?')}", file=f)
+                print(f"- 조건: `{ending.get('condition', '?')}`", file=f)
+                print(f"- 게이지: {change_str}", file=f)
+                print(f"- {ending.get('text', '')}", file=f)
 
     return output_path
 
 
 def export_to_html(result: Dict, output_path: str = "story_export.html") -> str:
     """스토리를 HTML 형식으로 내보내기"""
-    html = []
-    html.append("<!DOCTYPE html>")
-    html.append("<html><head>")
-    html.append("<meta charset='utf-8'>")
-    html.append("<title>인터랙티브 스토리</title>")
-    html.append("<style>")
-    html.append("body { font-family: sans-serif; max-width: 800px; margin: 0 auto; padding: 20px; }")
-    html.append(".episode { border: 1px solid #ddd; margin: 20px 0; padding: 20px; border-radius: 8px; }")
-    html.append(".intro { background: #f5f5f5; padding: 15px; border-radius: 5px; }")
-    html.append(".ending { background: #e8f4e8; padding: 10px; margin: 10px 0; border-radius: 5px; }")
-    html.append(".gauge { color: #666; font-size: 0.9em; }")
-    html.append("</style>")
-    html.append("</head><body>")
-
-    meta = result.get("metadata", {})
-    html.append(f"<h1>인터랙티브 스토리</h1>")
-    html.append(f"<p>에피소드: {meta.get('total_episodes', 0)}개 | 노드: {meta.get('total_nodes', 0)}개</p>")
-
-    for episode in result.get("episodes", []):
-        html.append(f"<div class='episode'>")
-        html.append(f"<h2>에피소드 {episode.get('order', '?')}: {episode.get('title', '?')}</h2>")
-        html.append(f"<p><strong>테마:</strong> {episode.get('theme', '?')}</p>")
-
-        if episode.get("intro_text"):
-            html.append(f"<div class='intro'><h3>도입부</h3>")
-            html.append(f"<p>{episode.get('intro_text', '').replace(chr(10), '<br>')}</p></div>")
-
-        html.append(f"<h3>엔딩</h3>")
-        for ending in episode.get("endings", []):
-            changes = ending.get("gauge_changes", {})
-            change_str = ", ".join([f"{k}: {'+' if v > 0 else ' '}{v}" for k, v in changes.items()])
-            html.append(f"<div class='ending'>")
-            html.append(f"<strong>{ending.get('title', '?')}</strong>")
-            html.append(f"<p class='gauge'>조건: {ending.get('condition', '?')} | {change_str}</p>")
-            html.append(f"<p>{ending.get('text', '')}</p></div>")
-
-        html.append("</div>")
-
-    html.append("</body></html>")
-
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write("\n".join(html))
+    with open(output_path, "w", encoding="utf-8", buffering=1 << 20) as f:
+        print("<!DOCTYPE html>", file=f)
+        print("<html><head>", file=f)
+        print("<meta charset='utf-8'>", file=f)
+        print("<title>인터랙티브 스토리</title>", file=f)
+        print("<style>", file=f)
+        print("body { font-family: sans-serif; max-width: 800px; margin: 0 auto; padding: 20px; }", file=f)
+        print(".episode { border: 1px solid #ddd; margin: 20px 0; padding: 20px; border-radius: 8px; }", file=f)
+        print(".intro { background: #f5f5f5; padding: 15px; border-radius: 5px; }", file=f)
+        print(".ending { background: #e8f4e8; padding: 10px; margin: 10px 0; border-radius: 5px; }", file=f)
+        print(".gauge { color: #666; font-size: 0.9em; }", file=f)
+        print("</style>", file=f)
+        print("</head><body>", file=f)
+
+        meta = result.get("metadata", {})
+        print(f"<h1>인터랙티브 스토리</h1>", file=f)
+        print(f"<p>에피소드: {meta.get('total_episodes', 0)}개 | 노드: {meta.get('total_nodes', 0)}개</p>", file=f)
+
+        for episode in result.get("episodes", []):
+            print(f"<div class='episode'>", file=f)
+            print(f"<h2>에피소드 {episode.get('order', '?')}: {episode.get('title', '?')}</h2>", file=f)
+            print(f"<p><strong>테마:</strong> {episode.get('theme', '?')}</p>", file=f)
+
+            if episode.get("intro_text"):
+                print(f"<div class='intro'><h3>도입부</h3>", file=f)
+                print(f"<p>{episode.get('intro_text', '').replace(chr(10), '<br>')}</p></div>", file=f)
+
+            print(f"<h3>엔딩</h3>", file=f)
+            for ending in episode.get("endings", []):
+                change_str = _format_gauge_changes(ending.get("gauge_changes"))
+                print(f"<div class='ending'>", file=f)
+                print(f"<strong>{ending.get('title', '?')}</strong>", file=f)
+                print(f"<p class='gauge'>조건: {ending.get('condition', '?')} | {change_str}</p>", file=f)
+                print(f"<p>{ending.get('text', '')}</p></div>", file=f)
+
+            print("</div>", file=f)
+
+        print("</body></html>", file=f)
 
     return output_path
 
@@ -130,6 +132,16 @@ def export_for_game_engine(result: Dict, output_path: str = "story_game.json") -
 
         export_data["episodes"].append(ep_data)
 
+    # 에피소드 전체 트리가 들어가므로 orjson으로 바로 UTF-8 bytes 직렬화 (들여쓰기 2칸은 동일)
+    if orjson is not None:
+        try:
+            raw = orjson.dumps(export_data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+            with open(output_path, "wb") as f:
+                f.write(raw)
+            return output_path
+        except TypeError:  # orjson이 지원하지 않는 타입 → 표준 json으로 재시도
+            pass
+
     with open(output_path, "w", encoding="utf-8") as f:
         json.dump(export_data, f, ensure_ascii=False, indent=2)
 
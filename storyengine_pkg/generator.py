@@ -1,6 +1,10 @@
+import asyncio
 import os
 import json
-from typing import List, Dict, Optional
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple, Union
+
+from langchain_core.messages import SystemMessage, HumanMessage
 
 from storyengine_pkg.director import InteractiveStoryDirector
 from storyengine_pkg.models import (
@@ -8,30 +12,223 @@ from storyengine_pkg.models import (
     InitialAnalysis,
     EpisodeModel,
 )
+from storyengine_pkg.tokenizer import token_encoder
 
 
-def _validate_and_clean_node_structure(node: Dict):
+# STORY_VERBOSE=1이면 에피소드 프롬프트 전문/응답 미리보기/intro_text 등 대용량 진단 출력을 켬
+# (프롬프트에 원문 발췌가 들어가 수만 자가 되므로 기본은 요약 한 줄만 출력)
+_VERBOSE = os.getenv("STORY_VERBOSE", "") == "1"
+
+# 첫 에피소드 프롬프트에 넣는 원문 발췌 길이 (토큰 기준, 토크나이저를 못 쓰면 문자 기준 15,000자)
+_NOVEL_EXCERPT_TOKENS = 12000
+_NOVEL_EXCERPT_CHARS = 15000
+
+
+@lru_cache(maxsize=8)
+def _novel_excerpt(novel_context: str) -> Tuple[str, str]:
     """
-    Recursively traverses the node tree to ensure 'immediate_reaction' is present in every choice.
-    Structured Output 모드를 사용하므로 경고만 출력하고 에러는 발생시키지 않음.
+    원문 앞부분 발췌 + 설명 문구 반환
+
+    한국어는 글자당 토큰 수가 일정하지 않아 문자 수로 자르면 실제 프롬프트 길이가 들쭉날쭉하므로 토큰 수로 자릅니다.
+    같은 소설의 에피소드들이 반복 호출하므로 결과를 캐시하여 토큰화는 소설당 한 번만 수행합니다.
     """
-    if not isinstance(node, dict):
-        return
+    encoder = token_encoder()
+    if encoder is None:
+        if len(novel_context) <= _NOVEL_EXCERPT_CHARS:
+            return novel_context, "(complete text)"
+        return (
+            novel_context[:_NOVEL_EXCERPT_CHARS],
+            f"(showing first {_NOVEL_EXCERPT_CHARS:,} characters of {len(novel_context):,} total)"
+        )
+
+    tokens = encoder.encode(novel_context, disallowed_special=())
+    if len(tokens) <= _NOVEL_EXCERPT_TOKENS:
+        return novel_context, "(complete text)"
+    excerpt = encoder.decode(tokens[:_NOVEL_EXCERPT_TOKENS])
+    return excerpt, f"(showing first {len(excerpt):,} characters of {len(novel_context):,} total)"
+
+
+# 에피소드 생성 규칙/출력 형식 (모든 소설·에피소드에 공통인 system 메시지)
+# 값이 바뀌는 항목은 MAX_DEPTH 등 이름으로만 적고 실제 값은 user 메시지의 EPISODE SETTINGS로 전달하여,
+# 이 블록이 항상 같은 접두사가 되도록 함 (OpenAI 자동 프롬프트 캐싱은 접두사 일치 시에만 적용)
+_EPISODE_SYSTEM_PROMPT = """You are an expert interactive story writer adapting an EXISTING novel into an interactive story game.
+The values MAX_DEPTH, TOTAL_NODES, EPISODE_ORDER, GAUGE_ID_1 and GAUGE_ID_2 used below are given in the EPISODE SETTINGS of the user message.
+
+⚠️ ADAPTATION RULES - DO NOT CREATE A NEW STORY:
+1. Use the EXACT character names from the character list. NEVER use generic names like "캐릭터A", "캐릭터B", "주인공".
+2. Do NOT invent characters or plot events, and do NOT change names, relationships, personalities, setting, time period or core conflict.
+3. Start the episode from an event in the story plot and follow the novel's timeline.
+4. Scenes, atmosphere and dialogue MUST match the novel and each character's personality.
+5. Choices affect HOW events unfold, not WHAT events happen.
+Example (Romeo and Juliet): ✅ "로미오는 캐플릿 가문의 무도회에 몰래 잠입했다..." ❌ "캐릭터A는 어두운 밤에 갈등을 마주했다..."
+
+Generate the content for this episode, including a title, an intro_text, a starting node,
+a COMPLETE branching narrative tree up to EXACTLY depth MAX_DEPTH, and possible endings.
+
+🚨 CRITICAL REQUIREMENTS:
+1. You MUST include "intro_text" field (1500-2500 Korean characters introducing the episode with cinematic detail, emotional depth, and immersive atmosphere)
+2. You MUST generate ALL nodes from depth 0 to depth MAX_DEPTH
+- Depth 0: 1 starting node (root)
+- Depth 1: 2 nodes (children of the root node)
+- Depth 2: 4 nodes (each depth 1 node has 2 children)
+- Depth 3: 8 nodes (each depth 2 node has 2 children)
+- Continue this pattern until you reach depth MAX_DEPTH
+- EVERY non-leaf node (depth 0 to MAX_DEPTH-1) MUST have exactly 2 choices and exactly 2 children nodes
+- ONLY nodes at depth MAX_DEPTH (leaf nodes) should have empty choices and children arrays
+- Total nodes should be approximately TOTAL_NODES nodes (2^(maxDepth+1) - 1)
+
+🚨 MANDATORY: Your response MUST be a single, valid JSON object that follows this EXACT structure:
+{
+  "episode_order": EPISODE_ORDER,
+  "title": "Episode Title Here",
+  "intro_text": "🚨 REQUIRED: Write 1500-2500 Korean characters introducing this episode. Include: (1) Strong opening hook, (2) Atmospheric setting with sensory details, (3) Character emotions and inner thoughts, (4) 2-3 meaningful dialogues, (5) Core conflict hint, (6) Transition to choice moment. Make it cinematic and immersive like a movie opening scene. DO NOT SKIP THIS FIELD!",
+  "start_node": {
+    "id": "node_0",
+    "text": "The story text for the first scene of the episode...",
+    "depth": 0,
+    "details": {
+        "npc_emotions": {"CharacterName": "emotion_state"},
+        "situation": "Brief description of the current situation",
+        "relations_update": {"Character1-Character2": "relationship_change"}
+    },
+    "choices": [
+        {
+            "text": "First choice for the player",
+            "tags": ["tag1", "tag2"],
+            "immediate_reaction": "Immediate reaction when this choice is made (100-200 Korean characters): character reactions, atmosphere change, player emotions..."
+        },
+        {
+            "text": "Second choice for the player",
+            "tags": ["tag3", "tag4"],
+            "immediate_reaction": "Different immediate reaction for this choice (100-200 Korean characters)..."
+        }
+    ],
+    "children": [
+        {
+            "id": "node_1",
+            "text": "The story continues after the first choice...",
+            "depth": 1,
+            "details": {
+                "npc_emotions": {"CharacterName": "emotion_state"},
+                "situation": "Brief description",
+                "relations_update": {}
+            },
+            "choices": [...],
+            "children": [...]
+        },
+        {
+            "id": "node_2",
+            "text": "The story continues after the second choice...",
+            "depth": 1,
+            "details": {
+                "npc_emotions": {"CharacterName": "emotion_state"},
+                "situation": "Brief description",
+                "relations_update": {}
+            },
+            "choices": [...],
+            "children": [...]
+        }
+    ]
+  },
+  "endings": [
+    {
+      "id": "epEPISODE_ORDER_ending_1",
+      "title": "Ending Title 1",
+      "condition": "cooperative >= 2 AND trusting >= 1",
+      "text": "The full ending text describing what happens...",
+      "gauge_changes": {"GAUGE_ID_1": 10, "GAUGE_ID_2": -5}
+    },
+    {
+      "id": "epEPISODE_ORDER_ending_2",
+      "title": "Ending Title 2",
+      "condition": "aggressive >= 2 OR doubtful >= 2",
+      "text": "Another ending text...",
+      "gauge_changes": {"GAUGE_ID_1": -10, "GAUGE_ID_2": 15}
+    },
+    {
+      "id": "epEPISODE_ORDER_ending_3",
+      "title": "Ending Title 3",
+      "condition": "rational >= 3",
+      "text": "A third possible ending...",
+      "gauge_changes": {"GAUGE_ID_1": 5, "GAUGE_ID_2": 5}
+    }
+  ]
+}
+
+IMPORTANT RULES:
+- Each node must have 'id', 'text', 'depth', 'details', 'choices', and 'children'.
+- The 'details' object must include:
+  * 'npc_emotions': emotional states of NPCs present in this scene (e.g., {"Romeo": "passionate", "Juliet": "conflicted"})
+  * 'situation': a brief description of what's happening in this scene
+  * 'relations_update': any changes in character relationships (can be empty dict if no changes)
+- Each 'choice' object must include:
+  * 'text': the choice text for the player
+  * 'tags': array of tags (cooperative, aggressive, cautious, trusting, doubtful, brave, fearful, rational, emotional)
+  * 'immediate_reaction': 100-200 Korean characters describing what happens IMMEDIATELY after this choice (character reactions, atmosphere change, player emotions)
+- The 'children' array of a node should contain the nodes that result from the 'choices' of that same node, in the same order.
+- Do NOT stop at depth 1 or 2. RECURSIVELY generate children for EVERY node until depth MAX_DEPTH is reached.
+- Ensure the 'id' of each node is unique within the episode (use node_0, node_1, node_2, etc.).
+- Generate 2-4 possible endings for this episode. Each ending should:
+  * Have a unique 'id' field (e.g., "epEPISODE_ORDER_ending_1", "epEPISODE_ORDER_ending_2", etc.)
+  * Have a descriptive title
+  * Specify the 'condition' using TAG-BASED LOGIC (e.g., "cooperative >= 2 AND trusting >= 1", "aggressive >= 3 OR doubtful >= 2")
+    - Available tags: cooperative, aggressive, cautious, trusting, doubtful, brave, fearful, rational, emotional
+    - Use comparison operators: >=, <=, >, <, ==
+    - Use logical operators: AND, OR
+    - Tags accumulate based on player choices throughout the episode
+  * Provide full ending text (800-1500 Korean characters) with:
+    - Climactic scene showing the result of player choices (300-400 chars)
+    - Character emotional reactions and inner thoughts (200-300 chars)
+    - Explicit mention of player's choice impact: "당신의 선택은..." (200-300 chars)
+    - Emotional closure with hint of what's next (100-200 chars)
+  * Include 'gauge_changes' dict with gauge ID keys and integer values (can be positive or negative)
+  * Use the EXACT field name "gauge_changes" (with underscore, not camelCase)
+
+🚨🚨🚨 VERIFICATION CHECKLIST BEFORE RESPONDING (MANDATORY):
+✓ Did I include the "intro_text" field with 1500-2500 Korean characters? (🚨 THIS IS MANDATORY!)
+✓ Did I generate nodes at ALL depths from 0 to MAX_DEPTH?
+✓ Do ALL nodes at depths 0 through MAX_DEPTH-1 have exactly 2 choices and 2 children?
+✓ Do ONLY nodes at depth MAX_DEPTH have empty choices/children arrays?
+✓ Is 'immediate_reaction' present in EVERY choice object?
+✓ Is the total node count approximately TOTAL_NODES?
+✓ Did I generate 2-4 endings with unique 'id' fields (e.g., "epEPISODE_ORDER_ending_1")?
+✓ Do all ending 'condition' fields use TAG-BASED logic (not node paths)?
+✓ Did I use "gauge_changes" (not "gaugeChanges") in all endings?
+✓ Did I use the EXACT character names, and would someone who read the original novel recognize every scene?
+
+**CRITICAL: All story content (node text, choice text, ending text, titles) MUST be written in Korean (한글).**
+- Only field names and IDs should be in English
+- All narrative content must be in Korean
+"""
 
-    # Validate 'immediate_reaction' in choices - 경고만 출력
-    if "choices" in node and isinstance(node["choices"], list):
-        for idx, choice in enumerate(node["choices"]):
-            if isinstance(choice, dict):
-                reaction = choice.get("immediate_reaction", "").strip()
-                if not reaction:
-                    print(f"  ⚠️ Node {node.get('id', 'N/A')}, Choice {idx+1}: 'immediate_reaction' is missing (Structured Output should prevent this)")
-                elif len(reaction) < 20:
-                    print(f"  ℹ️ Node {node.get('id', 'N/A')}, Choice {idx+1}: 'immediate_reaction' 짧음 ({len(reaction)}자)")
 
-    # Recurse through children
-    if "children" in node and isinstance(node["children"], list):
-        for child in node["children"]:
-            _validate_and_clean_node_structure(child)
+def _validate_and_clean_node_structure(node: Dict):
+    """
+    Traverses the node tree to ensure 'immediate_reaction' is present in every choice.
+    Structured Output 모드를 사용하므로 경고만 출력하고 에러는 발생시키지 않음.
+    재귀 대신 명시적 스택으로 순회하므로 트리 깊이에 관계없이 RecursionError가 발생하지 않음.
+    """
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if not isinstance(current, dict):
+            continue
+
+        # Validate 'immediate_reaction' in choices - 경고만 출력
+        choices = current.get("choices")
+        if isinstance(choices, list):
+            for idx, choice in enumerate(choices):
+                if isinstance(choice, dict):
+                    reaction = choice.get("immediate_reaction", "").strip()
+                    if not reaction:
+                        print(f"  ⚠️ Node {current.get('id', 'N/A')}, Choice {idx+1}: 'immediate_reaction' is missing (Structured Output should prevent this)")
+                    elif len(reaction) < 20:
+                        print(f"  ℹ️ Node {current.get('id', 'N/A')}, Choice {idx+1}: 'immediate_reaction' 짧음 ({len(reaction)}자)")
+
+        # 자식은 역순으로 쌓아 기존 재귀와 같은 순서(전위 순회)로 경고 출력
+        children = current.get("children")
+        if isinstance(children, list):
+            stack.extend(reversed(children))
 
 
 async def generate_single_episode(
@@ -40,31 +237,41 @@ async def generate_single_episode(
     story_config: StoryConfig,
     novel_context: str,
     current_episode_order: int,
-    previous_episode_data: Optional[EpisodeModel]
+    previous_episode_data: Optional[EpisodeModel],
+    enable_cache: bool = False,
+    director: Optional[InteractiveStoryDirector] = None
 ) -> EpisodeModel:
     """
     Contains the core logic to generate one episode by calling the LLM.
+
+    enable_cache=True이면 같은 프롬프트(소설/분석/설정/순서가 동일)의 응답을 LLM 응답 캐시에서 재사용합니다 (개발/재실행용).
+    여러 에피소드를 연달아 만들 때는 director를 넘기면 호출마다 디렉터를 새로 만들지 않고 재사용합니다
+    (이 경우 enable_cache 대신 디렉터의 캐시 설정을 따름).
     """
-    director = InteractiveStoryDirector(api_key=api_key)
+    if director is None:
+        director = InteractiveStoryDirector(api_key=api_key, enable_cache=enable_cache)
+
+    # 프롬프트 여러 곳에 들어가는 설정 값은 한 번만 계산
+    gauge_ids = story_config.selected_gauge_ids
+    themes = ', '.join(gauge_ids)
+    max_depth = story_config.max_depth
+    # initial_depth가 있으면 그 깊이까지만 생성 (출력 토큰이 깊이에 지수적으로 늘어나므로 플레이어가 내려가는 경로만 나중에 확장)
+    gen_depth = min(story_config.initial_depth, max_depth) if story_config.initial_depth is not None else max_depth
+    total_nodes = (1 << (gen_depth + 1)) - 1
 
     # --- Determine the context for the LLM prompt ---
     if previous_episode_data is None:
         # This is the first episode.
-        # 더 많은 컨텍스트 전달 (3000자 → 15000자)
-        novel_excerpt = novel_context[:15000] if len(novel_context) > 15000 else novel_context
-        excerpt_info = f"(showing first 15,000 characters of {len(novel_context):,} total)" if len(novel_context) > 15000 else "(complete text)"
+        # 원문 앞부분을 토큰 수 기준으로 발췌 (소설당 한 번만 토큰화)
+        # 토크나이저 첫 로드(인코딩 파일 다운로드)와 긴 원문 토큰화가 이벤트 루프를 막지 않도록 스레드에서 실행
+        novel_excerpt, excerpt_info = await asyncio.to_thread(_novel_excerpt, novel_context)
 
         # 요약과 캐릭터 정보 추출
         summary_text = initial_analysis.summary if initial_analysis.summary else "ERROR: No summary provided"
-        characters_text = json.dumps(initial_analysis.characters, ensure_ascii=False, indent=2) if initial_analysis.characters else "ERROR: No characters"
+        characters_text = initial_analysis.characters_json if initial_analysis.characters else "ERROR: No characters"
 
+        # 고정 블록(줄거리/등장인물/원문)이 앞, 에피소드 번호/테마는 뒤 - 재생성 시 긴 접두사가 프롬프트 캐시에 적중
         context_prompt = f"""
-        You are adapting an EXISTING novel into an interactive story game.
-
-        ⚠️ CRITICAL: DO NOT CREATE A NEW STORY. You must use the EXACT plot below.
-        ⚠️ FORBIDDEN: Using generic names like "캐릭터A", "캐릭터B", "주인공"
-        ⚠️ REQUIRED: Use the SPECIFIC character names from the CHARACTER LIST below
-
         ═══════════════════════════════════════════════════════════════════
         📖 ORIGINAL STORY PLOT (YOU MUST FOLLOW THIS EXACTLY):
         ═══════════════════════════════════════════════════════════════════
@@ -86,31 +293,7 @@ async def generate_single_episode(
         ═══════════════════════════════════════════════════════════════════
 
         TASK: Create Episode {current_episode_order} of {story_config.num_episodes}
-        THEMES: {', '.join(story_config.selected_gauge_ids)}
-
-        🚫 ABSOLUTE PROHIBITIONS:
-        1. DO NOT use generic character names (캐릭터A, 캐릭터B, 주인공, etc.)
-        2. DO NOT create new plot events not in the summary above
-        3. DO NOT change character names, relationships, or personalities
-        4. DO NOT invent new characters not listed above
-        5. DO NOT change the story's setting, time period, or core conflict
-
-        ✅ MANDATORY REQUIREMENTS:
-        1. Episode MUST start from an event described in the STORY PLOT above
-        2. ALL character names MUST match the CHARACTER LIST exactly
-        3. Scene descriptions MUST match the novel's setting and atmosphere
-        4. Dialogue MUST reflect character personalities from the CHARACTER LIST
-        5. Choices affect HOW events unfold, not WHAT events happen
-        6. The plot timeline MUST follow the novel's sequence
-
-        EXAMPLE (if story is Romeo and Juliet):
-        ✅ CORRECT: "로미오는 캐플릿 가문의 무도회에 몰래 잠입했다..."
-        ❌ WRONG: "캐릭터A는 어두운 밤에 갈등을 마주했다..."
-
-        Before generating, ask yourself:
-        - Did I use the EXACT character names from the list?
-        - Is this scene from the actual novel plot?
-        - Would someone who read the original novel recognize this?
+        THEMES: {themes}
         """
     else:
         # This is a subsequent episode (e.g., Ep 2, 3...).
@@ -118,181 +301,59 @@ async def generate_single_episode(
         # A more advanced implementation could analyze the leaf nodes of the previous episode.
         previous_episode_summary = f"The previous episode, '{previous_episode_data.title}', ended."
 
+        # 소설 단위로 고정인 요약/등장인물을 앞에, 에피소드마다 바뀌는 내용을 뒤에 두어
+        # 2화 이후 요청들이 같은 프롬프트 접두사를 공유하도록 함 (OpenAI 자동 프롬프트 캐싱은 접두사 일치 시에만 적용)
         context_prompt = f"""
+        The overall story summary is: {initial_analysis.summary}
+        The main characters are: {initial_analysis.characters_json}
+
         The story continues. The previous episode ended like this: {previous_episode_summary}.
         Now, create episode {current_episode_order} of the story.
-        Continue to incorporate the main themes: {', '.join(story_config.selected_gauge_ids)}.
-        The overall story summary is: {initial_analysis.summary}
-        The main characters are: {json.dumps(initial_analysis.characters, ensure_ascii=False, indent=2)}
+        Continue to incorporate the main themes: {themes}.
         """
 
     # --- Construct the main LLM prompt ---
-    llm_prompt = f"""
-    You are an expert interactive story writer.
-    {context_prompt}
-
-    Generate the content for this episode, including a title, an intro_text, a starting node,
-    a COMPLETE branching narrative tree up to EXACTLY depth {story_config.max_depth}, and possible endings.
-
-    🚨 CRITICAL REQUIREMENTS:
-    1. You MUST include "intro_text" field (1500-2500 Korean characters introducing the episode with cinematic detail, emotional depth, and immersive atmosphere)
-    2. You MUST generate ALL nodes from depth 0 to depth {story_config.max_depth}
-    - Depth 0: 1 starting node (root)
-    - Depth 1: 2 nodes (children of the root node)
-    - Depth 2: 4 nodes (each depth 1 node has 2 children)
-    - Depth 3: 8 nodes (each depth 2 node has 2 children)
-    - Continue this pattern until you reach depth {story_config.max_depth}
-    - EVERY non-leaf node (depth 0 to {story_config.max_depth - 1}) MUST have exactly 2 choices and exactly 2 children nodes
-    - ONLY nodes at depth {story_config.max_depth} (leaf nodes) should have empty choices and children arrays
-    - Total nodes should be approximately {2 ** (story_config.max_depth + 1) - 1} nodes (2^(maxDepth+1) - 1)
-
-    🚨 MANDATORY: Your response MUST be a single, valid JSON object that follows this EXACT structure:
-    {{
-      "episode_order": {current_episode_order},
-      "title": "Episode Title Here",
-      "intro_text": "🚨 REQUIRED: Write 1500-2500 Korean characters introducing this episode. Include: (1) Strong opening hook, (2) Atmospheric setting with sensory details, (3) Character emotions and inner thoughts, (4) 2-3 meaningful dialogues, (5) Core conflict hint, (6) Transition to choice moment. Make it cinematic and immersive like a movie opening scene. DO NOT SKIP THIS FIELD!",
-      "start_node": {{
-        "id": "node_0",
-        "text": "The story text for the first scene of the episode...",
-        "depth": 0,
-        "details": {{
-            "npc_emotions": {{"CharacterName": "emotion_state"}},
-            "situation": "Brief description of the current situation",
-            "relations_update": {{"Character1-Character2": "relationship_change"}}
-        }},
-        "choices": [
-            {{
-                "text": "First choice for the player",
-                "tags": ["tag1", "tag2"],
-                "immediate_reaction": "Immediate reaction when this choice is made (100-200 Korean characters): character reactions, atmosphere change, player emotions..."
-            }},
-            {{
-                "text": "Second choice for the player",
-                "tags": ["tag3", "tag4"],
-                "immediate_reaction": "Different immediate reaction for this choice (100-200 Korean characters)..."
-            }}
-        ],
-        "children": [
-            {{
-                "id": "node_1",
-                "text": "The story continues after the first choice...",
-                "depth": 1,
-                "details": {{
-                    "npc_emotions": {{"CharacterName": "emotion_state"}},
-                    "situation": "Brief description",
-                    "relations_update": {{}}
-                }},
-                "choices": [...],
-                "children": [...]
-            }},
-            {{
-                "id": "node_2",
-                "text": "The story continues after the second choice...",
-                "depth": 1,
-                "details": {{
-                    "npc_emotions": {{"CharacterName": "emotion_state"}},
-                    "situation": "Brief description",
-                    "relations_update": {{}}
-                }},
-                "choices": [...],
-                "children": [...]
-            }}
-        ]
-      }},
-      "endings": [
-        {{
-          "id": "ep{current_episode_order}_ending_1",
-          "title": "Ending Title 1",
-          "condition": "cooperative >= 2 AND trusting >= 1",
-          "text": "The full ending text describing what happens...",
-          "gauge_changes": {{"{story_config.selected_gauge_ids[0] if story_config.selected_gauge_ids else 'gauge1'}": 10, "{story_config.selected_gauge_ids[1] if len(story_config.selected_gauge_ids) > 1 else 'gauge2'}": -5}}
-        }},
-        {{
-          "id": "ep{current_episode_order}_ending_2",
-          "title": "Ending Title 2",
-          "condition": "aggressive >= 2 OR doubtful >= 2",
-          "text": "Another ending text...",
-          "gauge_changes": {{"{story_config.selected_gauge_ids[0] if story_config.selected_gauge_ids else 'gauge1'}": -10, "{story_config.selected_gauge_ids[1] if len(story_config.selected_gauge_ids) > 1 else 'gauge2'}": 15}}
-        }},
-        {{
-          "id": "ep{current_episode_order}_ending_3",
-          "title": "Ending Title 3",
-          "condition": "rational >= 3",
-          "text": "A third possible ending...",
-          "gauge_changes": {{"{story_config.selected_gauge_ids[0] if story_config.selected_gauge_ids else 'gauge1'}": 5, "{story_config.selected_gauge_ids[1] if len(story_config.selected_gauge_ids) > 1 else 'gauge2'}": 5}}
-        }}
-      ]
-    }}
-
-    IMPORTANT RULES:
-    - Each node must have 'id', 'text', 'depth', 'details', 'choices', and 'children'.
-    - The 'details' object must include:
-      * 'npc_emotions': emotional states of NPCs present in this scene (e.g., {{"Romeo": "passionate", "Juliet": "conflicted"}})
-      * 'situation': a brief description of what's happening in this scene
-      * 'relations_update': any changes in character relationships (can be empty dict if no changes)
-    - Each 'choice' object must include:
-      * 'text': the choice text for the player
-      * 'tags': array of tags (cooperative, aggressive, cautious, trusting, doubtful, brave, fearful, rational, emotional)
-      * 'immediate_reaction': 100-200 Korean characters describing what happens IMMEDIATELY after this choice (character reactions, atmosphere change, player emotions)
-    - The 'children' array of a node should contain the nodes that result from the 'choices' of that same node, in the same order.
-    - RECURSIVELY generate children nodes for EVERY node until depth {story_config.max_depth} is reached.
-    - Do NOT stop at depth 1 or 2. You MUST continue generating until depth {story_config.max_depth}.
-    - Each non-leaf node (depth 0 to {story_config.max_depth - 1}) MUST have exactly 2 choices and exactly 2 children.
-    - ONLY nodes at depth {story_config.max_depth} (leaf nodes) should have empty 'choices' and 'children' arrays.
-    - Ensure the 'id' of each node is unique within the episode (use node_0, node_1, node_2, etc.).
-    - Generate 2-4 possible endings for this episode. Each ending should:
-      * Have a unique 'id' field (e.g., "ep{current_episode_order}_ending_1", "ep{current_episode_order}_ending_2", etc.)
-      * Have a descriptive title
-      * Specify the 'condition' using TAG-BASED LOGIC (e.g., "cooperative >= 2 AND trusting >= 1", "aggressive >= 3 OR doubtful >= 2")
-        - Available tags: cooperative, aggressive, cautious, trusting, doubtful, brave, fearful, rational, emotional
-        - Use comparison operators: >=, <=, >, <, ==
-        - Use logical operators: AND, OR
-        - Tags accumulate based on player choices throughout the episode
-      * Provide full ending text (800-1500 Korean characters) with:
-        - Climactic scene showing the result of player choices (300-400 chars)
-        - Character emotional reactions and inner thoughts (200-300 chars)
-        - Explicit mention of player's choice impact: "당신의 선택은..." (200-300 chars)
-        - Emotional closure with hint of what's next (100-200 chars)
-      * Include 'gauge_changes' dict with gauge ID keys and integer values (can be positive or negative)
-      * Use the EXACT field name "gauge_changes" (with underscore, not camelCase)
-
-    EXAMPLE FOR maxDepth={story_config.max_depth}:
-    - You need {2 ** (story_config.max_depth + 1) - 1} total nodes
-    - Depth 0: 1 node → Depth 1: 2 nodes → Depth 2: 4 nodes → Depth 3: 8 nodes (and so on)
-    - The deepest nodes (at depth {story_config.max_depth}) are leaf nodes with NO choices or children
-
-    🚨🚨🚨 VERIFICATION CHECKLIST BEFORE RESPONDING (MANDATORY):
-    ✓ Did I include the "intro_text" field with 1500-2500 Korean characters? (🚨 THIS IS MANDATORY!)
-    ✓ Did I generate nodes at ALL depths from 0 to {story_config.max_depth}?
-    ✓ Do ALL nodes at depths 0 through {story_config.max_depth - 1} have exactly 2 choices and 2 children?
-    ✓ Do ONLY nodes at depth {story_config.max_depth} have empty choices/children arrays?
-    ✓ Is 'immediate_reaction' present in EVERY choice object?
-    ✓ Is the total node count approximately {2 ** (story_config.max_depth + 1) - 1}?
-    ✓ Did I generate 2-4 endings with unique 'id' fields (e.g., "ep{current_episode_order}_ending_1")?
-    ✓ Do all ending 'condition' fields use TAG-BASED logic (not node paths)?
-    ✓ Did I use "gauge_changes" (not "gaugeChanges") in all endings?
-
-    **CRITICAL: All story content (node text, choice text, ending text, titles) MUST be written in Korean (한글).**
-    - Only field names and IDs should be in English
-    - All narrative content must be in Korean
+    # 규칙/출력 형식은 공통 system 메시지, 소설 컨텍스트와 이번 에피소드 설정값은 user 메시지
+    user_prompt = f"""{context_prompt}
+
+    EPISODE SETTINGS:
+    - EPISODE_ORDER = {current_episode_order}
+    - MAX_DEPTH = {gen_depth} (leaf nodes are at depth {gen_depth}; nodes at depths 0-{gen_depth - 1} have exactly 2 choices and 2 children)
+    - TOTAL_NODES = {total_nodes}
+    - GAUGE_ID_1 = {gauge_ids[0] if gauge_ids else 'gauge1'}
+    - GAUGE_ID_2 = {gauge_ids[1] if len(gauge_ids) > 1 else 'gauge2'}
+    - Available gauge IDs for 'gauge_changes': {themes}
     """
+    if gen_depth < max_depth:
+        # 뼈대 모드: 마지막 깊이 노드는 엔딩이 아니라 이어질 분기점 → 선택지는 만들고 자식은 비워 둠
+        user_prompt = user_prompt.rstrip() + f"""
+    - SKELETON MODE: the full story continues to depth {max_depth} later. Nodes at depth MAX_DEPTH are NOT endings:
+      each of them MUST still have exactly 2 choices (with immediate_reaction), but an EMPTY 'children' array.
+    """
+    messages = [SystemMessage(content=_EPISODE_SYSTEM_PROMPT), HumanMessage(content=user_prompt)]
 
     # --- Call the LLM and parse the response ---
-    print(f"Generating Episode {current_episode_order} with prompt:\n{llm_prompt}")
-    response = await director.llm.ainvoke(llm_prompt)
-    print(f"🤖 LLM Response content (first 1000 chars): {response.content[:1000]}")
+    if _VERBOSE:
+        print(f"Generating Episode {current_episode_order} with prompt:\n{user_prompt}")
+    else:
+        print(f"Generating Episode {current_episode_order} (prompt {len(user_prompt):,} chars, depth {gen_depth})")
+    # 캐시 활성화 시 sha256(모델 + temperature + 메시지) 키로 이전 응답 재사용
+    response_text = await director._cached_invoke(messages, llm=director.llm_json)
+    if _VERBOSE:
+        print(f"🤖 LLM Response content (first 1000 chars): {response_text[:1000]}")
 
-    generated_episode_data = director._parse_json(response.content)
+    generated_episode_data = director._parse_json(response_text)
 
     # Check if parsing was successful
     if generated_episode_data is None:
         print("❌ CRITICAL ERROR: Failed to parse LLM response as JSON!")
-        print(f"❌ LLM Response content (full): {response.content}")
+        print(f"❌ LLM Response content (full): {response_text}")
         raise RuntimeError("LLM response parsing failed - received None")
 
-    print(f"📊 Parsed episode data keys: {generated_episode_data.keys() if isinstance(generated_episode_data, dict) else 'NOT A DICT'}")
-    print(f"📊 Has intro_text in parsed data: {'intro_text' in generated_episode_data if isinstance(generated_episode_data, dict) else 'N/A'}")
-    print(f"📊 intro_text value: {generated_episode_data.get('intro_text', 'NOT FOUND') if isinstance(generated_episode_data, dict) else 'N/A'}")
+    if _VERBOSE:
+        print(f"📊 Parsed episode data keys: {generated_episode_data.keys() if isinstance(generated_episode_data, dict) else 'NOT A DICT'}")
+        print(f"📊 Has intro_text in parsed data: {'intro_text' in generated_episode_data if isinstance(generated_episode_data, dict) else 'N/A'}")
+        print(f"📊 intro_text value: {generated_episode_data.get('intro_text', 'NOT FOUND') if isinstance(generated_episode_data, dict) else 'N/A'}")
 
     # Validate and clean the generated structure to ensure 'immediate_reaction' exists.
     if isinstance(generated_episode_data, dict) and generated_episode_data.get("start_node"):
@@ -300,17 +361,12 @@ async def generate_single_episode(
 
     # --- Validate and return the Episode object ---
     try:
-        # Convert start_node to nodes array if necessary (for backend compatibility)
-        if isinstance(generated_episode_data, dict) and "start_node" in generated_episode_data and "nodes" not in generated_episode_data:
-            print("🔄 Converting start_node to nodes array for backend compatibility")
-            generated_episode_data["nodes"] = [generated_episode_data["start_node"]]
-
         # ⚠️ intro_text가 없으면 경고 출력
         if not generated_episode_data.get("intro_text"):
             print("❌ WARNING: LLM did not generate intro_text! This should not happen.")
             print("❌ Please check the LLM prompt and response above.")
 
-        new_episode = EpisodeModel(**generated_episode_data)
+        new_episode = EpisodeModel.model_validate(generated_episode_data)
         print(f"✅ Successfully created EpisodeModel: order={new_episode.episode_order}, title={new_episode.title}")
         print(f"📦 Episode has {len(new_episode.nodes) if new_episode.nodes else 0} nodes")
         print(f"📝 Intro text present: {new_episode.intro_text is not None} (length: {len(new_episode.intro_text) if new_episode.intro_text else 0})")
@@ -323,3 +379,41 @@ async def generate_single_episode(
         raise
 
 
+async def generate_episodes_parallel(
+    api_key: str,
+    initial_analysis: InitialAnalysis,
+    story_config: StoryConfig,
+    novel_context: str,
+    episode_orders: List[int],
+    max_parallel: int = 4,
+    enable_cache: bool = False,
+    return_exceptions: bool = False
+) -> List[Union[EpisodeModel, BaseException]]:
+    """
+    Generates several independent episodes concurrently (at most max_parallel LLM calls in flight).
+
+    이전 에피소드 결과에 의존하지 않는 생성 모드용 (예: 각 에피소드를 원작 요약에서 바로 생성, 여러 소설 일괄 생성).
+    순차 모드(이전 에피소드를 이어 받는 /generate-next-episode)는 generate_single_episode를 차례로 호출해야 합니다.
+    결과는 episode_orders 순서대로 반환됩니다.
+    return_exceptions=True이면 실패한 에피소드 자리에 예외 객체를 넣고 나머지 결과는 그대로 반환합니다
+    (기본값은 첫 실패 예외를 그대로 발생).
+    """
+    semaphore = asyncio.Semaphore(max_parallel)
+    # 모든 에피소드가 디렉터 하나(같은 게이트웨이/응답 캐시)를 공유
+    director = InteractiveStoryDirector(api_key=api_key, enable_cache=enable_cache)
+
+    async def generate(order: int) -> EpisodeModel:
+        async with semaphore:
+            return await generate_single_episode(
+                api_key=api_key,
+                initial_analysis=initial_analysis,
+                story_config=story_config,
+                novel_context=novel_context,
+                current_episode_order=order,
+                previous_episode_data=None,
+                director=director
+            )
+
+    return await asyncio.gather(
+        *(generate(order) for order in episode_orders), return_exceptions=return_exceptions
+    )
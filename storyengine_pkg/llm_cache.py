@@ -0,0 +1,218 @@
+"""
+LLM 응답 캐시 (프롬프트 해시 기반 + 임베딩 유사도 기반)
+
+같은 소설/에피소드를 반복 생성할 때 동일한 프롬프트가 다시 나오므로,
+sha256(모델 + temperature + 메시지) 키로 응답을 메모리(LRU) + 디스크(JSON)에 저장합니다.
+항목마다 만료 시각을 기록하여 기본 7일이 지난 응답은 다시 생성합니다.
+"""
+import hashlib
+import json
+import math
+import operator
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # orjson 미설치 환경에서는 표준 json 사용
+    orjson = None
+
+DEFAULT_CACHE_DIR = ".llm_cache"
+DEFAULT_CACHE_TTL = 7 * 86400  # 초 (7일)
+
+# 프로세스 전역 메모리 캐시 (API는 요청마다 디렉터를 새로 만들기 때문에 인스턴스 간에 공유)
+# 키가 내용 해시이므로 다른 인스턴스/디렉터리 간 공유해도 충돌하지 않음
+# 값은 (만료 시각 또는 None, 응답) 튜플
+_SHARED_MEMORY: "OrderedDict[str, Tuple[Optional[float], Any]]" = OrderedDict()
+_SHARED_MEMORY_SIZE = 512
+
+
+def _serialize_messages(messages: Any) -> list:
+    """문자열 프롬프트 / LangChain 메시지 리스트를 (role, content) 리스트로 정규화"""
+    if isinstance(messages, str):
+        return [("human", messages)]
+
+    serialized = []
+    for m in messages:
+        if isinstance(m, (tuple, list)):
+            serialized.append((str(m[0]), str(m[1])))
+        else:
+            serialized.append((getattr(m, "type", "human"), str(getattr(m, "content", m))))
+    return serialized
+
+
+def make_cache_key(messages: Any, model: str = "", temperature: Optional[float] = None, namespace: str = "") -> str:
+    """
+    캐시 키 생성
+
+    Args:
+        messages: 프롬프트 문자열 또는 메시지 리스트
+        model: 모델 이름
+        temperature: 샘플링 온도
+        namespace: 출력 형식 구분자 (예: Structured Output 스키마 이름)
+    """
+    payload = {
+        "model": model,
+        "temperature": temperature,
+        "namespace": namespace,
+        "messages": _serialize_messages(messages),
+    }
+    # orjson은 bytes를 바로 반환하므로 인코딩 없이 해시 (표준 json 경로도 같은 바이트열을 만들도록 compact 구분자 사용)
+    if orjson is not None:
+        raw = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    else:
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+class LLMResponseCache:
+    """메모리 LRU + 디스크(키별 JSON 파일) 2단계 캐시
+
+    Args:
+        ttl: 기본 유효 기간(초) - None이면 만료 없음
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        max_memory_items: int = _SHARED_MEMORY_SIZE,
+        shared_memory: bool = True,
+        ttl: Optional[float] = DEFAULT_CACHE_TTL
+    ):
+        self.cache_dir = cache_dir
+        self.max_memory_items = max_memory_items
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, Tuple[Optional[float], Any]]" = _SHARED_MEMORY if shared_memory else OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _remember(self, key: str, value: Any, expires_at: Optional[float]):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        """캐시 조회 (없으면 None) - 반환값은 캐시 내부 객체이므로 dict/list는 호출부에서 수정하지 말 것"""
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at is None or expires_at > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._memory[key]
+
+        try:
+            with open(self._path(key), "rb") as f:
+                raw = f.read()
+            data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+            value = data["value"]
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+
+        # 만료 시각이 없는 파일은 TTL 도입 이전에 저장된 항목 → 만료 없음으로 취급
+        expires_at = data.get("expires_at")
+        if expires_at is not None and expires_at <= now:
+            self.misses += 1
+            return None
+
+        self._remember(key, value, expires_at)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """캐시 저장 (ttl 미지정 시 인스턴스 기본값, 디스크 쓰기는 임시 파일 → rename 으로 원자적으로 처리)"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        self._remember(key, value, expires_at)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        data = {"value": value, "expires_at": expires_at}
+        try:
+            if orjson is not None:
+                raw = orjson.dumps(data)
+            else:
+                raw = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            with open(tmp_path, "wb") as f:
+                f.write(raw)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError) as e:
+            print(f"  ⚠️ LLM 캐시 저장 실패: {e}")
+
+
+# 의미 기반(임베딩 유사도) 노드 캐시 저장소 - 파티션(에피소드 정적 컨텍스트 해시)별 (벡터, 값) 리스트
+_SEMANTIC_STORE: Dict[str, List[Tuple[List[float], Any]]] = {}
+_SEMANTIC_MAX_PER_PARTITION = 1000
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm == 0:
+        return list(vector)
+    return [v / norm for v in vector]
+
+
+class SemanticNodeCache:
+    """
+    표현만 다른 비슷한 선택지에 대해 이전에 생성한 노드를 재사용하는 캐시
+
+    (이전 본문 + 선택지 + 10단위로 묶은 게이지)를 임베딩하여 같은 파티션 안에서
+    코사인 유사도가 threshold 이상인 항목이 있으면 그 값을 반환합니다.
+    벡터 수가 적고(파티션당 최대 1000개) 차원을 줄여 쓰므로 순수 파이썬 내적으로 충분합니다.
+    """
+
+    def __init__(self, embeddings: Any, threshold: float = 0.92):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_text(previous_text: str, choice_text: str, gauges: Dict[str, int]) -> str:
+        """임베딩 입력 텍스트 구성 (게이지는 10 단위로 반올림하여 작은 수치 차이는 무시)"""
+        bucketed = ", ".join(f"{k}={int(round(v, -1))}" for k, v in sorted(gauges.items()))
+        return f"[이전]\n{previous_text}\n[선택]\n{choice_text}\n[게이지]\n{bucketed}"
+
+    async def embed(self, text: str) -> List[float]:
+        return _normalize(await self.embeddings.aembed_query(text))
+
+    def best_match(self, partition: str, vector: List[float]) -> Tuple[float, Optional[Any]]:
+        """파티션 안에서 가장 유사한 항목의 (코사인 유사도, 값) 반환 (항목이 없으면 (-1.0, None))"""
+        best_score = -1.0
+        best_value = None
+        for stored, value in _SEMANTIC_STORE.get(partition, []):
+            score = sum(map(operator.mul, stored, vector))
+            if score > best_score:
+                best_score, best_value = score, value
+        return best_score, best_value
+
+    def lookup(self, partition: str, vector: List[float], near_threshold: Optional[float] = None) -> Tuple[Optional[Any], Optional[Any]]:
+        """
+        가장 유사한 항목으로 (적중 값, 근접 값) 반환
+
+        유사도가 threshold 이상이면 적중(hits 증가), 아니면 미스(misses 증가)이며,
+        미스여도 near_threshold 이상이면 부분 재사용용 근접 값으로 돌려줍니다. 해당 없으면 각각 None.
+        """
+        best_score, best_value = self.best_match(partition, vector)
+        if best_score >= self.threshold:
+            self.hits += 1
+            return best_value, None
+        self.misses += 1
+        if near_threshold is not None and best_score >= near_threshold:
+            return None, best_value
+        return None, None
+
+    def add(self, partition: str, vector: List[float], value: Any):
+        entries = _SEMANTIC_STORE.setdefault(partition, [])
+        entries.append((vector, value))
+        if len(entries) > _SEMANTIC_MAX_PER_PARTITION:
+            del entries[0]
@@ -0,0 +1,158 @@
+"""
+OpenAI 호출 게이트웨이 (RPM/TPM 토큰 버킷 + Rate Limit 재시도)
+
+트리 노드/에피소드를 병렬로 생성하면 짧은 시간에 요청이 몰려 429(Rate Limit)가 나기 쉬우므로,
+모든 LLM 호출을 이 게이트웨이로 보내 분당 요청 수/토큰 수 예산 안에서만 요청을 내보내고
+429/5xx 응답과 연결 오류/타임아웃은 실패 대신 지수 백오프 후 재시도합니다.
+"""
+import asyncio
+import random
+import time
+from typing import Any, AsyncIterator, Optional
+
+import openai
+
+from .tokenizer import count_message_tokens
+
+# 재시도 대상 오류 (429 Rate Limit, 5xx 서버 오류)
+_RETRYABLE_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+# 연결 오류/타임아웃(APITimeoutError 포함) 재시도 상한 - 응답이 원래 오래 걸리는 요청이면 같은 타임아웃이 반복되므로 짧게 제한
+_MAX_CONNECTION_RETRIES = 2
+# 응답 길이 예상치 (TPM 예약용, 실제 사용량은 응답 후 정산)
+_EXPECTED_OUTPUT_TOKENS = 2000
+
+
+def estimate_tokens(messages: Any) -> int:
+    """TPM 예약량 = 프롬프트 토큰 수 (o200k_base 토크나이저, 없으면 한국어 기준 보수적 추정) + 예상 출력 토큰"""
+    return count_message_tokens(messages) + _EXPECTED_OUTPUT_TOKENS
+
+
+def _usage_tokens(response: Any) -> Optional[int]:
+    """
+    응답의 실제 총 토큰 사용량 (알 수 없으면 None)
+
+    Structured Output 러너블(director의 _RawStructuredOutput)은 모델 호출과 파싱을 나눠 실행하고
+    {"raw": AIMessage, "parsed": 스키마 객체 또는 None, "parsing_error": 파싱 오류 또는 None}을 반환하므로,
+    이 경우 파싱 성공 여부와 관계없이 원본 메시지의 usage_metadata를 읽습니다.
+    """
+    if isinstance(response, dict):
+        response = response.get("raw")
+    usage = getattr(response, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+class _TokenBucket:
+    """분당 한도를 초당 충전 속도로 환산한 토큰 버킷 (잔량은 음수가 될 수 있음 → 초과 사용분만큼 대기)"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """amount만큼 꺼내려면 기다려야 하는 시간(초) - 용량보다 큰 요청은 용량만큼으로 취급"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+    def give(self, amount: float):
+        """예약분 정산 (amount가 음수면 추가 차감)"""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class LLMGateway:
+    """
+    RPM/TPM 예산 안에서 LLM 호출을 내보내고 429/5xx는 백오프 후 재시도하는 게이트웨이
+
+    Args:
+        requests_per_minute: 분당 최대 요청 수
+        tokens_per_minute: 분당 최대 토큰 수 (요청 시 추정치를 예약하고 응답의 실제 사용량으로 정산)
+        max_retries: 재시도 최대 횟수 (대기: 2**attempt + 0~1초 지터, 서버가 Retry-After를 주면 그 이상)
+            연결 오류/타임아웃은 이 값과 _MAX_CONNECTION_RETRIES 중 작은 횟수만 재시도
+    """
+
+    def __init__(self, requests_per_minute: int = 500, tokens_per_minute: int = 200_000, max_retries: int = 6):
+        self._requests = _TokenBucket(requests_per_minute)
+        self._tokens = _TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.retries = 0
+
+    async def acquire(self, est_tokens: int):
+        """요청 1건 + est_tokens 토큰 예산이 생길 때까지 대기 후 차감"""
+        while True:
+            wait = max(self._requests.wait_time(1), self._tokens.wait_time(est_tokens))
+            if wait <= 0:
+                # 확인과 차감 사이에 await가 없으므로 다른 코루틴과 경합하지 않음
+                self._requests.take(1)
+                self._tokens.take(est_tokens)
+                return
+            await asyncio.sleep(wait)
+
+    def _settle(self, est_tokens: int, total_tokens: Optional[int]):
+        """실제 토큰 사용량으로 예약분 정산 (사용량을 알 수 없는 응답은 예약분 그대로 차감)"""
+        if total_tokens:
+            self._tokens.give(est_tokens - total_tokens)
+
+    def _retry_limit(self, error: Exception) -> int:
+        if isinstance(error, openai.APIConnectionError):
+            return min(self.max_retries, _MAX_CONNECTION_RETRIES)
+        return self.max_retries
+
+    async def _backoff(self, attempt: int, error: Exception):
+        delay = 2 ** attempt + random.random()
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            delay = max(delay, float(retry_after)) if retry_after else delay
+        except ValueError:
+            pass
+        self.retries += 1
+        print(f"  ⏳ {type(error).__name__} - {delay:.1f}초 후 재시도 ({attempt + 1}/{self._retry_limit(error)})")
+        await asyncio.sleep(delay)
+
+    async def invoke(self, runnable: Any, messages: Any, est_tokens: Optional[int] = None, **kwargs) -> Any:
+        """runnable.ainvoke(messages, **kwargs)를 예산 안에서 호출 (429/5xx/연결 오류는 재시도)"""
+        # 긴 프롬프트의 토큰화(및 첫 호출 시 인코딩 파일 로드)가 이벤트 루프를 막지 않도록 스레드에서 계산
+        est_tokens = est_tokens or await asyncio.to_thread(estimate_tokens, messages)
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(est_tokens)
+            try:
+                response = await runnable.ainvoke(messages, **kwargs)
+            except _RETRYABLE_ERRORS as e:
+                if attempt >= self._retry_limit(e):
+                    raise
+                await self._backoff(attempt, e)
+                continue
+            self._settle(est_tokens, _usage_tokens(response))
+            return response
+
+    async def stream(self, runnable: Any, messages: Any, est_tokens: Optional[int] = None, **kwargs) -> AsyncIterator[Any]:
+        """runnable.astream(messages, **kwargs) 조각을 그대로 전달 (첫 조각 도착 전 실패만 재시도 - 이미 전달한 조각은 되돌릴 수 없음)"""
+        est_tokens = est_tokens or await asyncio.to_thread(estimate_tokens, messages)
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(est_tokens)
+            started = False
+            total_tokens = None
+            try:
+                async for chunk in runnable.astream(messages, **kwargs):
+                    started = True
+                    # 사용량은 스트림 마지막 조각에만 실림 (stream_usage)
+                    total_tokens = _usage_tokens(chunk) or total_tokens
+                    yield chunk
+                self._settle(est_tokens, total_tokens)
+                return
+            except _RETRYABLE_ERRORS as e:
+                if started or attempt >= self._retry_limit(e):
+                    raise
+                await self._backoff(attempt, e)
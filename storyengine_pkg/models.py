@@ -1,6 +1,8 @@
 """
 데이터 모델 정의
 """
+import json
+from functools import cached_property
 from typing import TypedDict, List, Dict, Optional
 
 
@@ -74,20 +76,26 @@ class Episode(TypedDict):
 # NEW PYDANTIC MODELS FOR SEQUENTIAL GENERATION
 # ============================================
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 class StoryConfig(BaseModel):
     num_episodes: int = Field(alias="numEpisodes")
     max_depth: int = Field(alias="maxDepth")
     selected_gauge_ids: List[str] = Field(alias="selectedGaugeIds")
+    # 설정 시 이 깊이까지만 뼈대 트리를 생성하고, 가장 깊은 노드는 선택지만 두어 /regenerate-subtree로 나중에 확장 (None이면 max_depth까지 전체 생성)
+    initial_depth: Optional[int] = Field(default=None, alias="initialDepth", ge=1)
 
-    class Config:
-        populate_by_name = True  # Allow both snake_case and camelCase
+    model_config = ConfigDict(populate_by_name=True)  # Allow both snake_case and camelCase
 
 class InitialAnalysis(BaseModel):
     summary: Optional[str] = None
     characters: List[Dict]
 
+    @cached_property
+    def characters_json(self) -> str:
+        """프롬프트용 등장인물 JSON (같은 분석 객체로 여러 에피소드를 만들 때 한 번만 직렬화)"""
+        return json.dumps(self.characters, ensure_ascii=False, indent=2)
+
 class EpisodeModel(BaseModel):
     # Java에서 "order" 또는 "episodeOrder"로 보낼 수 있음
     episode_order: int = Field(alias="order")
@@ -103,8 +111,15 @@ class EpisodeModel(BaseModel):
     intro_text: Optional[str] = Field(default=None, alias="introText")
     endings: Optional[List[Dict]] = None
 
-    class Config:
-        populate_by_name = True  # snake_case와 camelCase 모두 허용
+    model_config = ConfigDict(populate_by_name=True)  # snake_case와 camelCase 모두 허용
+
+    @model_validator(mode="before")
+    @classmethod
+    def _wrap_start_node(cls, data):
+        # LLM은 start_node만 반환하므로 백엔드 호환용 nodes 배열을 검증 단계에서 채움 (입력 dict는 수정하지 않음)
+        if isinstance(data, dict) and "start_node" in data and "nodes" not in data:
+            data = {**data, "nodes": [data["start_node"]]}
+        return data
 
 class GenerateNextEpisodeRequest(BaseModel):
     initial_analysis: InitialAnalysis = Field(alias="initialAnalysis")
@@ -113,5 +128,4 @@ class GenerateNextEpisodeRequest(BaseModel):
     current_episode_order: int = Field(alias="currentEpisodeOrder")
     previous_episode: Optional[EpisodeModel] = Field(alias="previousEpisode", default=None)
 
-    class Config:
-        populate_by_name = True  # Allow both snake_case and camelCase
+    model_config = ConfigDict(populate_by_name=True)  # Allow both snake_case and camelCase
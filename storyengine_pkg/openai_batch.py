@@ -0,0 +1,139 @@
+"""
+OpenAI Batch API 요청 수집기 (오프라인 트리 사전 생성용)
+
+트리 생성 중 같은 깊이의 노드 요청들은 동시에 들어오므로, 잠깐(window초) 모았다가
+JSONL 하나로 업로드해 배치 작업 1개로 제출하고 완료될 때까지 폴링합니다.
+배치 요청은 즉시 응답 대비 약 50% 저렴하지만 완료까지 최대 24시간이 걸릴 수 있습니다.
+"""
+import asyncio
+import json
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from openai import AsyncOpenAI
+from openai.lib._parsing._completions import type_to_response_format_param
+from pydantic import BaseModel
+
+_BATCH_ENDPOINT = "/v1/chat/completions"
+_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+_ROLE_MAP = {"system": "system", "human": "user", "ai": "assistant"}
+
+
+def _to_openai_messages(messages: Any) -> List[Dict[str, str]]:
+    """문자열 프롬프트 / LangChain 메시지 리스트를 Chat Completions 메시지 형식으로 변환"""
+    if isinstance(messages, str):
+        return [{"role": "user", "content": messages}]
+    return [
+        {"role": _ROLE_MAP.get(getattr(m, "type", "human"), "user"), "content": str(getattr(m, "content", m))}
+        for m in messages
+    ]
+
+
+class OpenAIBatchRunner:
+    """
+    동시에 대기 중인 Structured Output 요청을 모아 Batch API 작업 하나로 제출
+
+    parse()는 마지막 요청 도착 후 window초 동안 새 요청이 없으면 그때까지 모인 요청을 한 번에 제출하고,
+    배치가 끝나면 각 요청의 응답을 스키마로 검증하여 돌려줍니다. 실패한 요청은 해당 호출에서만 예외가 발생합니다.
+    """
+
+    def __init__(self, api_key: str, window: float = 2.0, poll_interval: float = 30.0, completion_window: str = "24h"):
+        self.client = AsyncOpenAI(api_key=api_key)
+        self.window = window
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self._pending: List[Tuple[Dict[str, Any], type, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # 실행 중인 제출/폴링 태스크 (이벤트 루프는 태스크를 약한 참조로만 들고 있어, 참조를 두지 않으면
+        # 최대 24시간 폴링하는 도중 GC되어 대기 중인 parse()가 영원히 끝나지 않을 수 있음)
+        self._flush_tasks: Set[asyncio.Task] = set()
+        self.batches_submitted = 0
+
+    async def parse(self, messages: Any, schema: type, model: str, temperature: Optional[float] = None) -> BaseModel:
+        """요청을 다음 배치에 추가하고 결과가 나올 때까지 대기"""
+        body: Dict[str, Any] = {
+            "model": model,
+            "messages": _to_openai_messages(messages),
+            "response_format": type_to_response_format_param(schema),
+        }
+        if temperature is not None:
+            body["temperature"] = temperature
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((body, schema, future))
+
+        # 요청이 들어올 때마다 타이머를 다시 걸어 같은 단계의 요청이 모두 모인 뒤 제출
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = loop.call_later(self.window, self._start_flush, loop)
+        return await future
+
+    def _start_flush(self, loop: asyncio.AbstractEventLoop):
+        """모인 요청의 제출 태스크 시작 (완료될 때까지 참조 유지)"""
+        task = loop.create_task(self._flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self):
+        pending, self._pending = self._pending, []
+        self._timer = None
+        if not pending:
+            return
+
+        try:
+            results = await self._run_batch([body for body, _, _ in pending])
+        except Exception as e:
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for idx, (_, schema, future) in enumerate(pending):
+            if future.done():
+                continue
+            content = results.get(str(idx))
+            if content is None:
+                future.set_exception(RuntimeError(f"배치 요청 {idx} 응답 없음"))
+                continue
+            try:
+                future.set_result(schema.model_validate_json(content))
+            except Exception as e:
+                future.set_exception(e)
+
+    async def _run_batch(self, bodies: List[Dict[str, Any]]) -> Dict[str, str]:
+        """JSONL 업로드 → 배치 생성 → 완료까지 폴링 → custom_id별 응답 본문(content) 반환"""
+        lines = [
+            json.dumps({"custom_id": str(idx), "method": "POST", "url": _BATCH_ENDPOINT, "body": body}, ensure_ascii=False)
+            for idx, body in enumerate(bodies)
+        ]
+        input_file = await self.client.files.create(
+            file=("story_nodes.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch"
+        )
+        batch = await self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=_BATCH_ENDPOINT,
+            completion_window=self.completion_window
+        )
+        self.batches_submitted += 1
+        print(f"  📦 배치 작업 제출: {batch.id} ({len(bodies)}개 요청)")
+
+        while batch.status not in _TERMINAL_STATUSES:
+            await asyncio.sleep(self.poll_interval)
+            batch = await self.client.batches.retrieve(batch.id)
+
+        print(f"  📦 배치 작업 종료: {batch.id} (status={batch.status})")
+        if not batch.output_file_id:
+            raise RuntimeError(f"배치 작업 실패: {batch.id} (status={batch.status})")
+
+        output = await self.client.files.content(batch.output_file_id)
+        results: Dict[str, str] = {}
+        for line in output.text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            if response.get("status_code") != 200:
+                continue
+            results[item["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+        return results
@@ -1,16 +1,59 @@
-from typing import List, Dict
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional
 
-from .models import Episode
-from .utils import calculate_tag_scores, determine_episode_ending, calculate_final_ending
+from .models import Episode, StoryNode
+from .utils import (
+    calculate_tag_scores,
+    determine_episode_ending,
+    prepare_endings,
+    determine_episode_ending_prepared,
+    calculate_final_ending,
+)
 
 
-def simulate_playthrough(episode: Episode, choice_indices: List[int]) -> Dict:
+class EpisodeView:
+    """
+    시뮬레이션용 에피소드 트리 읽기 전용 뷰
+
+    노드 dict 리스트를 필드별 병렬 리스트(노드 위치 i로 접근)와 자식 위치 리스트로 한 번 변환해 두고,
+    순회 중에는 dict 키 조회 대신 정수 인덱스만 따라갑니다. 저장/응답 형식은 기존 노드 dict 그대로입니다.
+    """
+    __slots__ = ("nodes", "ids", "parent_ids", "choices", "children_idx", "id_to_idx", "root")
+
+    def __init__(self, nodes: List[StoryNode]):
+        self.nodes = nodes
+        self.ids = [node.get("id") for node in nodes]
+        self.parent_ids = [node.get("parent_id") for node in nodes]
+        self.choices = [node.get("choices") or [] for node in nodes]
+
+        # 노드 ID → 위치 (중복 ID는 첫 번째 것 우선)
+        self.id_to_idx: Dict[str, int] = {}
+        for i, node_id in enumerate(self.ids):
+            self.id_to_idx.setdefault(node_id, i)
+
+        # 위치 i 노드의 자식 위치 리스트 (노드 리스트 순서 유지)
+        by_parent: Dict[Optional[str], List[int]] = {}
+        for i, parent_id in enumerate(self.parent_ids):
+            by_parent.setdefault(parent_id, []).append(i)
+        self.children_idx = [by_parent.get(node_id, []) for node_id in self.ids]
+
+        # parent_id가 없는 첫 노드가 루트
+        self.root: Optional[int] = by_parent[None][0] if None in by_parent else None
+
+    @classmethod
+    def from_episode(cls, episode: Episode) -> "EpisodeView":
+        return cls(episode.get("nodes", []))
+
+
+def simulate_playthrough(episode: Episode, choice_indices: List[int], view: Optional[EpisodeView] = None) -> Dict:
     """
     특정 선택 경로로 에피소드 플레이 시뮬레이션
 
     Args:
         episode: 에피소드 데이터
         choice_indices: 각 노드에서의 선택지 인덱스 [0, 1, 0, ...]
+        view: 미리 만든 EpisodeView (같은 에피소드를 여러 번 시뮬레이션하는 호출부가 한 번만 만들어 전달, 없으면 새로 생성)
 
     Returns:
         {
@@ -21,40 +64,34 @@ def simulate_playthrough(episode: Episode, choice_indices: List[int]) -> Dict:
             "gauge_changes": {"hope": 10, ...}
         }
     """
-    nodes = episode.get("nodes", [])
     endings = episode.get("endings", [])
+    if view is None:
+        view = EpisodeView.from_episode(episode)
 
     # 루트 노드 찾기
-    root = None
-    for node in nodes:
-        if node.get("parent_id") is None:
-            root = node
-            break
-
-    if not root:
+    if view.root is None:
         return {"error": "루트 노드를 찾을 수 없습니다"}
 
-    path = [root]
+    current = view.root
+    path = [view.nodes[current]]
     choices_made = []
-    current_node = root
 
     # 선택 경로 따라가기
-    for i, choice_idx in enumerate(choice_indices):
-        choices = current_node.get("choices", [])
+    for choice_idx in choice_indices:
+        choices = view.choices[current]
         if not choices:
             break
 
         if choice_idx >= len(choices):
             choice_idx = 0  # 범위 초과 시 첫 번째 선택
 
-        selected_choice = choices[choice_idx]
-        choices_made.append(selected_choice)
+        choices_made.append(choices[choice_idx])
 
         # 다음 노드 찾기 (해당 선택지로 연결된 자식 노드)
-        children = [n for n in nodes if n.get("parent_id") == current_node.get("id")]
+        children = view.children_idx[current]
         if choice_idx < len(children):
-            current_node = children[choice_idx]
-            path.append(current_node)
+            current = children[choice_idx]
+            path.append(view.nodes[current])
         else:
             break
 
@@ -73,13 +110,18 @@ def simulate_playthrough(episode: Episode, choice_indices: List[int]) -> Dict:
     }
 
 
-def simulate_full_game(result: Dict, episode_choices: List[List[int]]) -> Dict:
+def simulate_full_game(
+    result: Dict,
+    episode_choices: List[List[int]],
+    views: Optional[List[EpisodeView]] = None
+) -> Dict:
     """
     전체 게임 플레이 시뮬레이션
 
     Args:
         result: main_flow 결과
         episode_choices: 각 에피소드별 선택지 인덱스 [[0,1,0], [1,0], ...]
+        views: 에피소드 순서대로 미리 만든 EpisodeView 리스트 (없으면 이번 호출에서 에피소드마다 한 번씩 생성)
 
     Returns:
         {
@@ -91,11 +133,14 @@ def simulate_full_game(result: Dict, episode_choices: List[List[int]]) -> Dict:
     episodes = result.get("episodes", [])
     final_endings = result.get("context", {}).get("final_endings", [])
 
+    if views is None:
+        views = _episode_views(result)
+
     episode_results = []
 
     for i, episode in enumerate(episodes):
         choices = episode_choices[i] if i < len(episode_choices) else []
-        sim_result = simulate_playthrough(episode, choices)
+        sim_result = simulate_playthrough(episode, choices, views[i])
         episode_results.append({
             "episode_id": episode.get("id"),
             "episode_title": episode.get("title"),
@@ -113,58 +158,111 @@ def simulate_full_game(result: Dict, episode_choices: List[List[int]]) -> Dict:
     }
 
 
-def get_all_possible_endings(episode: Episode) -> List[Dict]:
-    """에피소드에서 가능한 모든 엔딩 경로 분석"""
-    nodes = episode.get("nodes", [])
-    endings = episode.get("endings", [])
+def _episode_views(result: Dict) -> List[EpisodeView]:
+    """게임 결과의 에피소드 순서대로 EpisodeView 생성"""
+    return [EpisodeView.from_episode(episode) for episode in result.get("episodes", [])]
 
-    # 모든 리프 노드까지의 경로 찾기
-    def find_all_paths(node_id, current_path, all_paths):
-        node = next((n for n in nodes if n.get("id") == node_id), None)
-        if not node:
-            return
 
-        current_path = current_path + [node]
-        children = [n for n in nodes if n.get("parent_id") == node_id]
+# 배치 시뮬레이션 워커 프로세스의 게임 결과와 뷰
+# (작업마다 보내지 않고 워커 시작 시 initializer로 한 번만 전달, 뷰도 워커당 한 번만 생성)
+_BATCH_RESULT: Optional[Dict] = None
+_BATCH_VIEWS: Optional[List[EpisodeView]] = None
 
-        if not children or not node.get("choices"):
-            # 리프 노드
-            all_paths.append(current_path)
-        else:
-            for i, child in enumerate(children):
-                find_all_paths(child.get("id"), current_path, all_paths)
+
+def _init_batch_worker(result: Dict):
+    global _BATCH_RESULT, _BATCH_VIEWS
+    _BATCH_RESULT = result
+    _BATCH_VIEWS = _episode_views(result)
+
+
+def _simulate_batch_item(episode_choices: List[List[int]]) -> Dict:
+    return simulate_full_game(_BATCH_RESULT, episode_choices, _BATCH_VIEWS)
+
+
+def simulate_full_game_batch(
+    result: Dict,
+    all_choices: List[List[List[int]]],
+    max_workers: Optional[int] = None,
+    min_parallel: int = 64
+) -> List[Dict]:
+    """
+    여러 선택 조합으로 전체 게임 시뮬레이션 (밸런스 분석용)
+
+    조합끼리는 독립이므로 프로세스 풀에 나눠 실행하고, 결과는 all_choices 순서대로 반환합니다.
+    조합 수가 min_parallel 미만이거나 max_workers=1이면 프로세스 생성/직렬화 비용이 더 크므로 현재 프로세스에서 순차 실행합니다.
+
+    Args:
+        result: main_flow 결과
+        all_choices: simulate_full_game의 episode_choices 리스트 [[[0,1,0], [1,0]], ...]
+        max_workers: 워커 프로세스 수 (None이면 CPU 수)
+        min_parallel: 병렬 실행을 시작하는 최소 조합 수
+    """
+    if max_workers == 1 or len(all_choices) < min_parallel:
+        # 조합마다 같은 트리를 다시 변환하지 않도록 뷰는 배치 전체에서 한 번만 생성
+        views = _episode_views(result)
+        return [simulate_full_game(result, episode_choices, views) for episode_choices in all_choices]
+
+    workers = max_workers or os.cpu_count() or 1
+    # 작업을 워커당 여러 묶음으로 나눠 프로세스 간 통신 횟수를 줄이면서 부하도 고르게 분배
+    chunksize = max(1, len(all_choices) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker, initargs=(result,)) as executor:
+        return list(executor.map(_simulate_batch_item, all_choices, chunksize=chunksize))
+
+
+def get_all_possible_endings(episode: Episode) -> List[Dict]:
+    """에피소드에서 가능한 모든 엔딩 경로 분석"""
+    # 엔딩 조건은 경로마다 다시 해석하지 않도록 한 번만 정리 (경로 수만큼 판정하므로 판정 로그는 출력하지 않음)
+    prepared_endings = prepare_endings(episode.get("endings", []))
+    view = EpisodeView.from_episode(episode)
 
     # 루트에서 시작
-    root = next((n for n in nodes if n.get("parent_id") is None), None)
-    if not root:
+    if view.root is None:
         return []
 
-    all_paths = []
-    find_all_paths(root.get("id"), [], all_paths)
-
-    # 각 경로의 엔딩 분석
+    # 모든 리프 노드까지의 경로를 따라가며 각 경로의 엔딩 분석
+    # 재귀 대신 명시적 스택 (노드 위치, 다음에 방문할 자식 순번, 이 노드로 들어올 때 고른 선택지)으로 전위 순회하고,
+    # 태그 점수는 노드에 들어갈 때 더하고 나올 때 빼서 공유 접두사를 경로마다 다시 집계하지 않음
     results = []
-    for path in all_paths:
-        choices_made = []
-        for i, node in enumerate(path[:-1]):
-            choices = node.get("choices", [])
-            if choices and i + 1 < len(path):
-                # 다음 노드로 가는 선택지 찾기
-                next_node = path[i + 1]
-                children = [n for n in nodes if n.get("parent_id") == node.get("id")]
-                for j, child in enumerate(children):
-                    if child.get("id") == next_node.get("id") and j < len(choices):
-                        choices_made.append(choices[j])
-                        break
-
-        tag_scores = calculate_tag_scores(choices_made)
-        reached_ending = determine_episode_ending(choices_made, endings)
-
-        results.append({
-            "path_length": len(path),
-            "tag_scores": tag_scores,
-            "ending": reached_ending.get("title") if reached_ending else "없음",
-            "gauge_changes": reached_ending.get("gauge_changes", {}) if reached_ending else {}
-        })
+    path_length = 0
+    entry_choices = []
+    tag_scores: Dict[str, int] = {}
+    stack = [(view.root, 0, None)]
+    while stack:
+        node_idx, child_idx, entry_choice = stack.pop()
+        if child_idx == 0:
+            path_length += 1
+            entry_choices.append(entry_choice)
+            if entry_choice:
+                for tag in entry_choice.get("tags", []):
+                    tag_scores[tag] = tag_scores.get(tag, 0) + 1
+
+        choices = view.choices[node_idx]
+        children = view.children_idx[node_idx] if choices else []
+        if child_idx < len(children):
+            stack.append((node_idx, child_idx + 1, None))
+            stack.append((children[child_idx], 0, choices[child_idx] if child_idx < len(choices) else None))
+            continue
+
+        if not children:
+            # 리프 노드
+            scores = dict(tag_scores)
+            reached_ending = determine_episode_ending_prepared(scores, prepared_endings)
+            results.append({
+                "path_length": path_length,
+                "tag_scores": scores,
+                "ending": reached_ending.get("title") if reached_ending else "없음",
+                "gauge_changes": reached_ending.get("gauge_changes", {}) if reached_ending else {}
+            })
+
+        # 노드에서 나올 때 들어올 때 더한 태그 점수를 되돌림
+        path_length -= 1
+        exited_choice = entry_choices.pop()
+        if exited_choice:
+            for tag in exited_choice.get("tags", []):
+                count = tag_scores[tag] - 1
+                if count:
+                    tag_scores[tag] = count
+                else:
+                    del tag_scores[tag]
 
     return results
\ No newline at end of file
@@ -0,0 +1,67 @@
+"""
+토큰 수 계산 (gpt-4o / gpt-4o-mini 계열 o200k_base 토크나이저)
+
+프롬프트가 한국어라 문자 수 // 4 같은 영어 기준 추정은 실제 토큰 수보다 몇 배 작게 나오므로,
+tiktoken을 쓸 수 있으면 실제로 토큰화하고 못 쓰면 한글 등 비ASCII 문자를 글자당 1토큰으로 보수적으로 추정합니다.
+
+tiktoken은 인코딩 파일이 로컬 캐시(TIKTOKEN_CACHE_DIR)에 없으면 첫 로드 때 네트워크로 내려받으므로,
+서버는 시작 시 load_token_encoder()로 미리 로드하고 비동기 코드에서는 이벤트 루프 밖(스레드)에서 호출합니다.
+"""
+import asyncio
+import threading
+from typing import Any
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken 미설치 환경에서는 문자 종류별 추정치 사용
+    tiktoken = None
+
+_ENCODING_NAME = "o200k_base"
+
+
+_encoder = None
+_encoder_loaded = False
+_encoder_lock = threading.Lock()
+
+
+def token_encoder():
+    """
+    o200k_base 토크나이저 - 미설치 또는 인코딩 파일 로드 실패 시 None
+
+    여러 스레드가 동시에 처음 호출해도 로드(다운로드)와 실패 로그는 한 번만 일어납니다.
+    """
+    global _encoder, _encoder_loaded
+    if _encoder_loaded:
+        return _encoder
+    with _encoder_lock:
+        if not _encoder_loaded:
+            if tiktoken is None:
+                print("⚠️ tiktoken 미설치, 토큰 수를 문자 수 기준으로 추정합니다")
+            else:
+                try:
+                    _encoder = tiktoken.get_encoding(_ENCODING_NAME)
+                except Exception as e:
+                    print(f"⚠️ 토크나이저 로드 실패, 토큰 수를 문자 수 기준으로 추정합니다: {e}")
+            _encoder_loaded = True
+    return _encoder
+
+
+async def load_token_encoder():
+    """이벤트 루프를 막지 않도록 스레드에서 토크나이저 로드 (서버 시작 시 워밍업용)"""
+    return await asyncio.to_thread(token_encoder)
+
+
+def count_tokens(text: str) -> int:
+    """text의 토큰 수 (토크나이저가 없으면 ASCII 4자당 1토큰 + 비ASCII 글자당 1토큰으로 추정)"""
+    encoder = token_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return ascii_chars // 4 + (len(text) - ascii_chars)
+
+
+def count_message_tokens(messages: Any) -> int:
+    """문자열 프롬프트 / LangChain 메시지 리스트의 입력 토큰 수"""
+    if isinstance(messages, str):
+        return count_tokens(messages)
+    return sum(count_tokens(str(getattr(m, "content", m))) for m in messages)
@@ -1,11 +1,32 @@
 import json
-from typing import List, Dict, Optional
+import operator
+from collections import Counter
+from functools import lru_cache
+from typing import Callable, List, Dict, Optional, Tuple
 
 from .models import StoryChoice, EpisodeEnding, FinalEnding, Episode, StoryNode
 
+try:
+    import orjson
+except ImportError:  # orjson 미설치 환경에서는 표준 json 사용
+    orjson = None
+
+# 없는 키 기본값용 공용 빈 dict (조회 전용 - 수정하지 말 것)
+_EMPTY: Dict = {}
+
 
 def save_episode_story(result: Dict, filename: str = "episode_story.json") -> str:
     """에피소드 기반 스토리를 JSON 파일로 저장"""
+    # 전체 에피소드 트리가 들어가므로 orjson으로 바로 UTF-8 bytes 직렬화 (들여쓰기 2칸은 동일)
+    if orjson is not None:
+        try:
+            raw = orjson.dumps(result, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+            with open(filename, "wb") as f:
+                f.write(raw)
+            return filename
+        except TypeError:  # orjson이 지원하지 않는 타입 → 표준 json으로 재시도
+            pass
+
     with open(filename, "w", encoding="utf-8") as f:
         json.dump(result, f, ensure_ascii=False, indent=2)
     return filename
@@ -13,17 +34,26 @@ def save_episode_story(result: Dict, filename: str = "episode_story.json") -> st
 
 def load_episode_story(filename: str = "episode_story.json") -> Dict:
     """저장된 에피소드 스토리 로드"""
+    if orjson is not None:
+        with open(filename, "rb") as f:
+            return orjson.loads(f.read())
     with open(filename, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
 def calculate_tag_scores(choices_made: List[StoryChoice]) -> Dict[str, int]:
     """선택한 선택지들의 태그를 누적하여 점수 계산"""
-    scores = {}
-    for choice in choices_made:
-        for tag in choice.get("tags", []):
-            scores[tag] = scores.get(tag, 0) + 1
-    return scores
+    return dict(Counter(tag for choice in choices_made for tag in choice.get("tags", [])))
+
+
+# 조건식 비교 연산자 (앞에서부터 검사하므로 두 글자 연산자가 먼저)
+_COMPARISONS = {
+    ">=": operator.ge,
+    "<=": operator.le,
+    ">": operator.gt,
+    "<": operator.lt,
+    "==": operator.eq,
+}
 
 
 def evaluate_condition(condition: str, tag_scores: Dict[str, int]) -> bool:
@@ -36,50 +66,40 @@ def evaluate_condition(condition: str, tag_scores: Dict[str, int]) -> bool:
     - "cooperative >= 2 AND trusting >= 1"
     - "doubtful >= 2 OR aggressive >= 2"
     - "default" (항상 True)
+
+    같은 엔딩 조건이 플레이마다 반복 평가되므로 조건식별로 한 번만 해석한 판정 함수를 재사용합니다.
     """
+    return _compile_tag_condition(condition)(tag_scores)
+
+
+@lru_cache(maxsize=1024)
+def _compile_tag_condition(condition: str) -> Callable[[Dict[str, int]], bool]:
+    """조건식 → (태그 점수 → bool) 판정 함수 (AND를 먼저 나누므로 "a AND b OR c"는 a AND (b OR c))"""
     if condition == "default":
-        return True
+        return lambda tag_scores: True
 
     # AND/OR로 분리
     if " AND " in condition:
-        parts = condition.split(" AND ")
-        return all(evaluate_condition(part.strip(), tag_scores) for part in parts)
+        parts = [_compile_tag_condition(part.strip()) for part in condition.split(" AND ")]
+        return lambda tag_scores: all(part(tag_scores) for part in parts)
 
     if " OR " in condition:
-        parts = condition.split(" OR ")
-        return any(evaluate_condition(part.strip(), tag_scores) for part in parts)
+        parts = [_compile_tag_condition(part.strip()) for part in condition.split(" OR ")]
+        return lambda tag_scores: any(part(tag_scores) for part in parts)
 
-    # 단일 조건 평가
-    operators = [">=", "<=", ">", "<", "=="]
-    for op in operators:
+    # 단일 조건 (오른쪽은 숫자 또는 태그명)
+    for op, compare in _COMPARISONS.items():
         if op in condition:
             parts = condition.split(op)
             if len(parts) == 2:
                 left = parts[0].strip()
                 right = parts[1].strip()
-
-                # 왼쪽 값
-                left_val = tag_scores.get(left, 0)
-
-                # 오른쪽 값 (숫자 또는 태그명)
                 if right.isdigit():
-                    right_val = int(right)
-                else:
-                    right_val = tag_scores.get(right, 0)
-
-                # 연산자 적용
-                if op == ">=":
-                    return left_val >= right_val
-                elif op == "<=":
-                    return left_val <= right_val
-                elif op == ">":
-                    return left_val > right_val
-                elif op == "<":
-                    return left_val < right_val
-                elif op == "==":
-                    return left_val == right_val
+                    threshold = int(right)
+                    return lambda tag_scores: compare(tag_scores.get(left, 0), threshold)
+                return lambda tag_scores: compare(tag_scores.get(left, 0), tag_scores.get(right, 0))
 
-    return False
+    return lambda tag_scores: False
 
 
 def determine_episode_ending(choices_made: List[StoryChoice], endings: List[EpisodeEnding]) -> EpisodeEnding:
@@ -93,8 +113,15 @@ def determine_episode_ending(choices_made: List[StoryChoice], endings: List[Epis
     Returns:
         조건을 만족하는 엔딩 (없으면 default 엔딩)
     """
-    tag_scores = calculate_tag_scores(choices_made)
+    return determine_episode_ending_from_scores(calculate_tag_scores(choices_made), endings)
+
+
+def determine_episode_ending_from_scores(tag_scores: Dict[str, int], endings: List[EpisodeEnding]) -> EpisodeEnding:
+    """
+    이미 계산된 태그 점수로 에피소드 엔딩 결정 (determine_episode_ending과 같은 규칙)
 
+    경로를 따라 태그 점수를 누적해 두는 호출부(가능한 모든 엔딩 분석 등)에서 선택지 리스트를 다시 집계하지 않도록 사용합니다.
+    """
     print(f"\n🎯 [엔딩 판정] 태그 점수: {tag_scores}")
     print(f"🎯 [엔딩 판정] 가능한 엔딩 개수: {len(endings)}")
 
@@ -123,6 +150,36 @@ def determine_episode_ending(choices_made: List[StoryChoice], endings: List[Epis
         return None
 
 
+def prepare_endings(endings: List[EpisodeEnding]) -> Tuple[List[Tuple[Callable[[Dict[str, int]], bool], EpisodeEnding]], Optional[EpisodeEnding]]:
+    """
+    엔딩 리스트를 (조건 판정 함수, 엔딩) 리스트 + 대체 엔딩으로 한 번만 정리
+
+    같은 엔딩 목록으로 여러 경로를 판정할 때(가능한 모든 엔딩 분석 등) determine_episode_ending_prepared와 함께 사용합니다.
+    대체 엔딩은 determine_episode_ending과 같은 규칙 (condition이 "default"인 첫 엔딩, 없으면 첫 번째 엔딩)
+    """
+    conditional = [
+        (_compile_tag_condition(ending.get("condition", "default")), ending)
+        for ending in endings
+        if ending.get("condition", "default") != "default"
+    ]
+    fallback = next((ending for ending in endings if ending.get("condition") == "default"), None)
+    if fallback is None and endings:
+        fallback = endings[0]
+    return conditional, fallback
+
+
+def determine_episode_ending_prepared(
+    tag_scores: Dict[str, int],
+    prepared: Tuple[List[Tuple[Callable[[Dict[str, int]], bool], EpisodeEnding]], Optional[EpisodeEnding]]
+) -> Optional[EpisodeEnding]:
+    """prepare_endings 결과로 엔딩 결정 (판정 과정 로그 없이 한 번의 순회)"""
+    conditional, fallback = prepared
+    for predicate, ending in conditional:
+        if predicate(tag_scores):
+            return ending
+    return fallback
+
+
 def calculate_final_ending(episode_results: List[Dict], final_endings: List[FinalEnding], initial_gauges: Dict[str, int] = None) -> Dict:
     """
     모든 에피소드를 거친 후 최종 엔딩 결정
@@ -143,16 +200,21 @@ def calculate_final_ending(episode_results: List[Dict], final_endings: List[Fina
 
     print(f"\n🏁 [최종 엔딩 판정] 초기 게이지: {gauges}")
 
+    # 에피소드별 엔딩/변화량을 한 번만 꺼내 두고, 등장하는 게이지는 미리 기본값 50으로 채움 (누적 루프에서 키 확인 생략)
+    ending_changes = []
+    for result in episode_results:
+        ending = result.get("ending") or _EMPTY
+        changes = ending.get("gauge_changes") or _EMPTY
+        ending_changes.append((ending, changes))
+        for gauge_id in changes:
+            gauges.setdefault(gauge_id, 50)
+
     # 에피소드별 게이지 변화 누적
-    for i, result in enumerate(episode_results):
-        ending = result.get("ending", {})
-        changes = ending.get("gauge_changes", {})
+    for i, (ending, changes) in enumerate(ending_changes):
         print(f"  📖 에피소드 {i+1} 엔딩: '{ending.get('title', '?')}' - 게이지 변화: {changes}")
         for gauge_id, change in changes.items():
-            if gauge_id not in gauges:
-                gauges[gauge_id] = 50
             old_val = gauges[gauge_id]
-            gauges[gauge_id] = max(0, min(100, gauges[gauge_id] + change))
+            gauges[gauge_id] = max(0, min(100, old_val + change))
             print(f"     {gauge_id}: {old_val} → {gauges[gauge_id]} ({change:+d})")
 
     print(f"\n🏁 [최종 엔딩 판정] 최종 게이지: {gauges}")
@@ -238,17 +300,23 @@ def get_children(nodes: List[StoryNode], parent_id: str) -> List[StoryNode]:
 
 def get_path_to_node(nodes: List[StoryNode], node_id: str) -> List[StoryNode]:
     """루트에서 특정 노드까지의 경로 반환"""
+    # 조상마다 전체 노드를 다시 훑지 않도록 ID 인덱스를 한 번만 생성 (중복 ID는 첫 번째 것 우선)
+    nodes_by_id = {}
+    for node in nodes:
+        nodes_by_id.setdefault(node.get("id"), node)
+
     path = []
-    current = get_node_by_id(nodes, node_id)
+    current = nodes_by_id.get(node_id)
 
     while current:
-        path.insert(0, current)
+        path.append(current)
         parent_id = current.get("parent_id")
         if parent_id:
-            current = get_node_by_id(nodes, parent_id)
+            current = nodes_by_id.get(parent_id)
         else:
             break
 
+    path.reverse()
     return path
 
 
@@ -1,4 +1,6 @@
-from typing import List, Dict
+import re
+from functools import lru_cache
+from typing import Callable, List, Dict
 
 from .models import Episode, FinalEnding
 
@@ -18,19 +20,26 @@ def validate_gauge_balance(episodes: List[Episode], final_endings: List[FinalEnd
     """
     # 모든 에피소드 엔딩 조합의 게이지 범위 계산
     gauge_ranges = {}
-
-    # 각 게이지의 최소/최대 가능 값 계산
     for episode in episodes:
-        for ending in episode.get("endings", []):
-            changes = ending.get("gauge_changes", {})
-            for gauge_id, change in changes.items():
-                if gauge_id not in gauge_ranges:
-                    gauge_ranges[gauge_id] = {"min": 0, "max": 0}
-                if change > 0:
-                    gauge_ranges[gauge_id]["max"] += change
-                else:
-                    gauge_ranges[gauge_id]["min"] += change
+        _accumulate_gauge_changes(gauge_ranges, episode)
+    return _gauge_balance_report(gauge_ranges, final_endings, initial_value)
+
+
+def _accumulate_gauge_changes(gauge_ranges: Dict, episode: Episode):
+    """에피소드 엔딩들의 게이지 변화량을 게이지별 음수 합(min) / 양수 합(max)에 누적"""
+    for ending in episode.get("endings", []):
+        changes = ending.get("gauge_changes", {})
+        for gauge_id, change in changes.items():
+            if gauge_id not in gauge_ranges:
+                gauge_ranges[gauge_id] = {"min": 0, "max": 0}
+            if change > 0:
+                gauge_ranges[gauge_id]["max"] += change
+            else:
+                gauge_ranges[gauge_id]["min"] += change
 
+
+def _gauge_balance_report(gauge_ranges: Dict, final_endings: List[FinalEnding], initial_value: int) -> Dict:
+    """누적된 변화량 합에 초기값을 적용하고 최종 엔딩별 도달 가능 여부 판정 (gauge_ranges는 제자리에서 갱신)"""
     # 초기값 적용
     for gauge_id in gauge_ranges:
         gauge_ranges[gauge_id]["min"] = max(0, initial_value + gauge_ranges[gauge_id]["min"])
@@ -70,46 +79,79 @@ def validate_gauge_balance(episodes: List[Episode], final_endings: List[FinalEnd
 
 def check_condition_reachability(condition: str, gauge_ranges: Dict) -> bool:
     """조건이 게이지 범위 내에서 만족 가능한지 확인"""
+    return compile_condition(condition)(gauge_ranges)
+
+
+_OPERATORS = [">=", "<=", ">", "<", "=="]
+
+
+@lru_cache(maxsize=1024)
+def compile_condition(condition: str) -> Callable[[Dict], bool]:
+    """
+    조건식을 한 번만 해석하여 (게이지 범위 → 만족 가능 여부) 함수로 반환
+
+    같은 조건을 여러 범위에 반복 평가할 때 문자열 분할/파싱을 매번 하지 않도록 사용합니다.
+    조건식별로 캐시하므로 check_condition_reachability를 반복 호출해도 AND/OR 분할은 처음 한 번만 수행됩니다.
+    AND를 먼저 나누므로 "a AND b OR c"는 a AND (b OR c)로 해석됩니다.
+
+    비교 값이 정수가 아닌 부분은 해석 시점이 아니라 평가 시점에 ValueError를 일으키므로,
+    AND/OR 단락 평가로 그 부분까지 가지 않으면 예외 없이 결과를 반환합니다.
+    """
     if condition == "default":
-        return True
+        return lambda gauge_ranges: True
 
     # AND 조건
     if " AND " in condition:
-        parts = condition.split(" AND ")
-        return all(check_condition_reachability(p.strip(), gauge_ranges) for p in parts)
+        parts = [compile_condition(p.strip()) for p in condition.split(" AND ")]
+        return lambda gauge_ranges: all(part(gauge_ranges) for part in parts)
 
     # OR 조건
     if " OR " in condition:
-        parts = condition.split(" OR ")
-        return any(check_condition_reachability(p.strip(), gauge_ranges) for p in parts)
+        parts = [compile_condition(p.strip()) for p in condition.split(" OR ")]
+        return lambda gauge_ranges: any(part(gauge_ranges) for part in parts)
 
     # 단일 조건 파싱
-    operators = [">=", "<=", ">", "<", "=="]
-    for op in operators:
+    for op in _OPERATORS:
         if op in condition:
             parts = condition.split(op)
             if len(parts) == 2:
-                gauge_id = parts[0].strip()
-                threshold = int(parts[1].strip())
+                try:
+                    threshold = int(parts[1].strip())
+                except ValueError as e:
+                    return _raise_on_evaluation(e)
+                return _compile_comparison(parts[0].strip(), op, threshold)
 
-                if gauge_id not in gauge_ranges:
-                    return False
+    return lambda gauge_ranges: False
 
-                range_min = gauge_ranges[gauge_id]["min"]
-                range_max = gauge_ranges[gauge_id]["max"]
 
-                if op == ">=":
-                    return range_max >= threshold
-                elif op == "<=":
-                    return range_min <= threshold
-                elif op == ">":
-                    return range_max > threshold
-                elif op == "<":
-                    return range_min < threshold
-                elif op == "==":
-                    return range_min <= threshold <= range_max
+def _raise_on_evaluation(error: ValueError) -> Callable[[Dict], bool]:
+    """해석할 수 없는 비교식 → 평가될 때 해석 오류를 일으키는 함수"""
+    def check(gauge_ranges: Dict) -> bool:
+        raise error
 
-    return False
+    return check
+
+
+def _compile_comparison(gauge_id: str, op: str, threshold: int) -> Callable[[Dict], bool]:
+    """단일 비교식 → 게이지 범위 안에 조건을 만족하는 값이 있는지 확인하는 함수"""
+    def check(gauge_ranges: Dict) -> bool:
+        if gauge_id not in gauge_ranges:
+            return False
+
+        range_min = gauge_ranges[gauge_id]["min"]
+        range_max = gauge_ranges[gauge_id]["max"]
+
+        if op == ">=":
+            return range_max >= threshold
+        elif op == "<=":
+            return range_min <= threshold
+        elif op == ">":
+            return range_max > threshold
+        elif op == "<":
+            return range_min < threshold
+        return range_min <= threshold <= range_max
+
+    return check
 
 
 def find_dead_ends(episodes: List[Episode]) -> List[Dict]:
@@ -120,20 +162,28 @@ def find_dead_ends(episodes: List[Episode]) -> List[Dict]:
         for node in episode.get("nodes", []):
             # 엔딩 노드가 아닌데 선택지가 없는 경우
             if node.get("node_type") != "ending" and not node.get("choices"):
-                dead_ends.append({
-                    "episode_id": episode.get("id"),
-                    "node_id": node.get("id"),
-                    "depth": node.get("depth"),
-                    "text_preview": node.get("text", "")[:100] + "..."
-                })
+                dead_ends.append(_dead_end_entry(episode, node))
 
     return dead_ends
 
 
+def _dead_end_entry(episode: Episode, node: Dict) -> Dict:
+    return {
+        "episode_id": episode.get("id"),
+        "node_id": node.get("id"),
+        "depth": node.get("depth"),
+        "text_preview": node.get("text", "")[:100] + "..."
+    }
+
+
+# 조건식의 단어(태그명/AND/OR/숫자) 추출용 - 공백/비교 연산자/괄호로 구분 (하이픈 등이 들어간 태그명도 그대로 유지)
+_WORD_RE = re.compile(r"[^\s<>=!()]+")
+
+
 def check_tag_coverage(episodes: List[Episode]) -> Dict:
     """에피소드 엔딩의 태그 조건 커버리지 확인"""
     all_tags = set()
-    used_tags = set()
+    condition_words = set()
 
     # 사용된 모든 태그 수집
     for episode in episodes:
@@ -142,13 +192,19 @@ def check_tag_coverage(episodes: List[Episode]) -> Dict:
                 for tag in choice.get("tags", []):
                     all_tags.add(tag)
 
-        # 엔딩 조건에서 사용된 태그
-        for ending in episode.get("endings", []):
-            condition = ending.get("condition", "")
-            for tag in all_tags:
-                if tag in condition:
-                    used_tags.add(tag)
+        _collect_condition_words(condition_words, episode)
+
+    return _tag_coverage_report(all_tags, condition_words)
 
+
+def _collect_condition_words(condition_words: set, episode: Episode):
+    # 엔딩 조건에 나오는 단어 (부분 문자열 비교 시 "doubt"가 "doubtful"에 매칭되므로 단어 단위로 분리)
+    for ending in episode.get("endings", []):
+        condition_words.update(_WORD_RE.findall(ending.get("condition", "")))
+
+
+def _tag_coverage_report(all_tags: set, condition_words: set) -> Dict:
+    used_tags = all_tags & condition_words
     unused_tags = all_tags - used_tags
 
     return {
@@ -156,4 +212,41 @@ def check_tag_coverage(episodes: List[Episode]) -> Dict:
         "used_in_conditions": list(used_tags),
         "unused_tags": list(unused_tags),
         "coverage_rate": len(used_tags) / len(all_tags) if all_tags else 1.0
-    }
\ No newline at end of file
+    }
+
+
+def full_validation_pass(episodes: List[Episode], final_endings: List[FinalEnding], initial_value: int = 50) -> Dict:
+    """
+    게이지 밸런스 / 막다른 노드 / 태그 커버리지 검증을 에피소드 노드 한 번 순회로 수행
+
+    세 검증을 각각 호출하면 같은 노드 리스트를 여러 번 훑으므로, 전체 리포트가 필요할 때는 이 함수를 사용합니다.
+    결과는 validate_gauge_balance / find_dead_ends / check_tag_coverage를 각각 호출한 것과 같습니다.
+
+    Returns:
+        {
+            "gauge_balance": validate_gauge_balance 결과,
+            "dead_ends": find_dead_ends 결과,
+            "tag_coverage": check_tag_coverage 결과
+        }
+    """
+    gauge_ranges = {}
+    dead_ends = []
+    all_tags = set()
+    condition_words = set()
+
+    for episode in episodes:
+        for node in episode.get("nodes", []):
+            choices = node.get("choices")
+            if node.get("node_type") != "ending" and not choices:
+                dead_ends.append(_dead_end_entry(episode, node))
+            for choice in choices or []:
+                all_tags.update(choice.get("tags", []))
+
+        _accumulate_gauge_changes(gauge_ranges, episode)
+        _collect_condition_words(condition_words, episode)
+
+    return {
+        "gauge_balance": _gauge_balance_report(gauge_ranges, final_endings, initial_value),
+        "dead_ends": dead_ends,
+        "tag_coverage": _tag_coverage_report(all_tags, condition_words),
+    }
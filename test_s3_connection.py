@@ -12,8 +12,10 @@ S3 연결 테스트 스크립트
 import os
 import sys
 import boto3
+from boto3.s3.transfer import TransferConfig
 from dotenv import load_dotenv
 from botocore.exceptions import ClientError, NoCredentialsError
+import io
 import json
 
 # Windows에서 UTF-8 출력 지원
@@ -59,12 +61,13 @@ def test_s3_connection():
     print("-" * 60)
 
     try:
-        s3_client = boto3.client(
-            's3',
+        # AI 서버(api.get_s3_client)와 같은 방식: 세션 하나에서 클라이언트를 만들어 이후 단계에서 재사용
+        session = boto3.session.Session(
             region_name=aws_region,
             aws_access_key_id=aws_access_key,
             aws_secret_access_key=aws_secret_key
         )
+        s3_client = session.client('s3')
         print("✅ S3 클라이언트 생성 성공")
     except Exception as e:
         print(f"❌ S3 클라이언트 생성 실패: {str(e)}")
@@ -126,8 +129,11 @@ def test_s3_connection():
     print("-" * 60)
 
     try:
-        response = s3_client.get_object(Bucket=aws_bucket, Key=test_key)
-        content = response['Body'].read().decode('utf-8')
+        # AI 서버와 같은 전송 설정 (8MB 초과 시 멀티파트 병렬 다운로드)
+        buffer = io.BytesIO()
+        transfer_config = TransferConfig(multipart_threshold=8 * 1024 * 1024, max_concurrency=10, use_threads=True)
+        s3_client.download_fileobj(aws_bucket, test_key, buffer, Config=transfer_config)
+        content = buffer.getvalue().decode('utf-8')
         downloaded_data = json.loads(content)
         print(f"✅ 파일 다운로드 성공")
         print(f"   내용: {downloaded_data}")